@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Full discovery runs against local stub supervisor, go2rtc and UniFi Protect servers.
+
+Usage: python3 benchmarks/bench_discovery.py [--cameras 10 100 1000 5000] [--entities 50000]
+                                             [--go2rtc 0.25] [--refreshes 1] [--profile DIR]
+
+For each scale, fixtures are written to a temp directory and served by stub
+HTTP(S) servers in this process (the supervisor stub answers the camera-only
+template render as HA would). Discovery runs in a child process (so its
+peak RSS is its own) with HA_URL, HA_STORAGE_PATH, the go2rtc endpoints, the
+NVR and all /data files pointed at the stubs. Reported per scale: discovery
+wall time (first refresh, and the mean of later ones with --refreshes),
+child peak RSS, and requests served by each stub.
+
+With --profile, discovery runs in profiling mode and its reports are
+written to DIR (timings then include the profiling overhead).
+
+The NVR stub needs a self-signed certificate, generated with openssl.
+"""
+
+import argparse
+import http.server
+import json
+import os
+import resource
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from fixtures import write_fixtures  # noqa: E402
+
+
+class StubServer(http.server.ThreadingHTTPServer):
+    """Serves fixture files by path and counts the requests it gets."""
+
+    daemon_threads = True
+
+    def __init__(self, routes, tls_files=None):
+        """
+        Args:
+            routes: (method, path) -> fixture file path, or bytes to send
+            tls_files: (certfile, keyfile) to serve HTTPS
+        """
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.routes = routes
+        self.requests = Counter()
+        self.lock = threading.Lock()
+        if tls_files:
+            ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            ctx.load_cert_chain(*tls_files)
+            self.socket = ctx.wrap_socket(self.socket, server_side=True)
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def handle_route(self, method: str):
+        path = self.path.split("?")[0]
+        with self.server.lock:
+            self.server.requests[f"{method} {path}"] += 1
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        route = self.server.routes.get((method, path))
+        if route is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        if method == "POST":
+            self.send_header("Set-Cookie", "TOKEN=bench; Path=/")
+        if isinstance(route, bytes):
+            self.send_header("Content-Length", str(len(route)))
+            self.end_headers()
+            self.wfile.write(route)
+            return
+        self.send_header("Content-Length", str(os.path.getsize(route)))
+        self.end_headers()
+        with open(route, "rb") as f:
+            while chunk := f.read(65536):
+                self.wfile.write(chunk)
+
+    def do_GET(self):
+        self.handle_route("GET")
+
+    def do_POST(self):
+        self.handle_route("POST")
+
+
+def supervisor_routes(states_path: str) -> dict:
+    """HA API routes: the full /api/states dump, each camera state, and the camera-only template render."""
+    import discover_cameras as dc
+
+    with open(states_path) as f:
+        cameras = [s for s in json.load(f) if s["entity_id"].startswith("camera.")]
+    keys = ["friendly_name"] + dc.STREAM_URL_ATTRIBUTES
+    rendered = [{"entity_id": s["entity_id"], "state": s["state"],
+                 "attributes": {k: v for k, v in s["attributes"].items() if k in keys}} for s in cameras]
+    routes = {("GET", "/core/api/states"): states_path,
+              ("POST", "/core/api/template"): json.dumps(rendered).encode()}
+    for state in cameras:
+        routes[("GET", f"/core/api/states/{state['entity_id']}")] = json.dumps(state).encode()
+    return routes
+
+
+def make_certificate(directory: str):
+    """Self-signed certificate for the NVR stub."""
+    cert = os.path.join(directory, "nvr.crt")
+    key = os.path.join(directory, "nvr.key")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+                    "-subj", "/CN=127.0.0.1", "-keyout", key, "-out", cert],
+                   check=True, capture_output=True)
+    return cert, key
+
+
+def run_child(args):
+    """Child process: point discovery at the stubs, refresh, print one JSON line of timings."""
+    import contextlib
+    import io
+
+    import discover_cameras as dc
+
+    dc.SUPERVISOR_TOKEN = "bench"
+    dc.HA_URL = args.ha_url
+    dc.HA_STORAGE_PATH = os.path.join(args.fixtures, ".storage")
+    dc.GO2RTC_ENDPOINTS = [args.go2rtc_url]
+    data = os.path.join(args.fixtures, "data")
+    dc.GO2RTC_ENDPOINT_FILE = os.path.join(data, "go2rtc_endpoint")
+    dc.DISCOVERY_STATUS_FILE = os.path.join(data, "discovery_status.json")
+    dc.DISCOVERY_METRICS_FILE = os.path.join(data, "discovery_metrics.prom")
+    dc.CIRCUIT_BREAKER_FILE = os.path.join(data, "circuit_breakers.json")
+    dc.DISCOVERY_SNAPSHOT_FILE = os.path.join(data, "discovery_snapshot.json")
+    options = {"stream_probe": "off", "parallel_discovery": not args.sequential}
+    if args.profile:
+        dc.PROFILE_DIR = os.path.abspath(args.profile)
+        options["profiling"] = True
+    config_path = os.path.join(data, "monocle.json")
+
+    timings = []
+    for _ in range(args.refreshes):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            dc.refresh_monocle_config(options, config_path)
+        timings.append(time.perf_counter() - start)
+
+    with open(config_path) as f:
+        cameras = len(json.load(f)["cameras"])
+    print(json.dumps({"timings": timings, "cameras": cameras,
+                      "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}))
+
+
+def bench_scale(cameras: int, entities: int, go2rtc_cameras: int, refreshes: int, sequential: bool,
+                tls_files, profile: str = None) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        # The NVR's port isn't known until its stub is listening, so start it first
+        nvr_routes = {}
+        nvr = StubServer(nvr_routes, tls_files)
+        paths = write_fixtures(tmp, cameras, entities, go2rtc_cameras, nvr_host=f"127.0.0.1:{nvr.port}")
+        nvr_routes[("POST", "/api/auth/login")] = b"{}"
+        nvr_routes[("GET", "/proxy/protect/api/bootstrap")] = paths["bootstrap.json"]
+        supervisor = StubServer(supervisor_routes(paths["states.json"]))
+        go2rtc = StubServer({("GET", "/api/streams"): paths["go2rtc.json"]})
+
+        start = time.perf_counter()
+        child = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", "--fixtures", tmp,
+             "--ha-url", f"http://127.0.0.1:{supervisor.port}/core",
+             "--go2rtc-url", f"http://127.0.0.1:{go2rtc.port}/api/streams",
+             "--refreshes", str(refreshes)] + (["--sequential"] if sequential else [])
+            + (["--profile", os.path.abspath(profile)] if profile else []),
+            capture_output=True, text=True, cwd=os.path.dirname(BENCH_DIR))
+        elapsed = time.perf_counter() - start
+        for server in (nvr, supervisor, go2rtc):
+            server.shutdown()
+        if child.returncode != 0:
+            raise RuntimeError(child.stderr.strip().splitlines()[-1] if child.stderr.strip() else "child failed")
+
+        result = json.loads(child.stdout.strip().splitlines()[-1])
+        result.update({
+            "process_seconds": elapsed,
+            "expected": cameras + go2rtc_cameras,
+            "requests": {"supervisor": sum(supervisor.requests.values()),
+                         "go2rtc": sum(go2rtc.requests.values()),
+                         "nvr": sum(nvr.requests.values())},
+        })
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--cameras", type=int, nargs="+", default=[10, 100, 1000, 5000],
+                        help="UniFi cameras per run")
+    parser.add_argument("--entities", type=int, default=50000,
+                        help="entities per run, at most (scaled down to 10 per camera)")
+    parser.add_argument("--go2rtc", type=float, default=0.25,
+                        help="extra go2rtc-only cameras, as a fraction of the UniFi cameras")
+    parser.add_argument("--refreshes", type=int, default=1,
+                        help="refreshes per child process (later ones reuse sessions and caches)")
+    parser.add_argument("--sequential", action="store_true", help="parallel_discovery: false")
+    parser.add_argument("--profile", metavar="DIR", help="profiling: true, with the reports written to DIR")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--fixtures", help=argparse.SUPPRESS)
+    parser.add_argument("--ha-url", help=argparse.SUPPRESS)
+    parser.add_argument("--go2rtc-url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return
+
+    with tempfile.TemporaryDirectory() as cert_dir:
+        tls_files = make_certificate(cert_dir)
+        print(f"{'cameras':>7} {'entities':>8} {'first s':>8} {'later s':>8} {'process s':>9} "
+              f"{'RSS MB':>7} {'found':>11} {'HA req':>6} {'go2rtc':>6} {'NVR req':>7}")
+        for cameras in args.cameras:
+            entities = min(args.entities, max(1000, cameras * 10))
+            go2rtc_cameras = int(cameras * args.go2rtc)
+            r = bench_scale(cameras, entities, go2rtc_cameras, args.refreshes, args.sequential, tls_files,
+                            args.profile)
+            later = r["timings"][1:]
+            later_s = f"{sum(later) / len(later):8.3f}" if later else f"{'-':>8}"
+            print(f"{cameras:>7} {entities:>8} {r['timings'][0]:8.3f} {later_s} {r['process_seconds']:9.3f} "
+                  f"{r['peak_rss_kb'] / 1024:7.1f} {r['cameras']:>5}/{r['expected']:<5} "
+                  f"{r['requests']['supervisor']:>6} {r['requests']['go2rtc']:>6} {r['requests']['nvr']:>7}")
+
+
+if __name__ == "__main__":
+    main()
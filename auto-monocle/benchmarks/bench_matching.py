@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Camera matching cost: CameraMatcher vs the old nested substring loops.
+
+Usage: python3 benchmarks/bench_matching.py [--streams 1000] [--entities 10000]
+
+Every stream and UniFi camera has a matching entity; the remaining entities
+are lookalikes ("Camera 0001 Side") that the old loops could wrongly claim.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import discover_cameras as dc  # noqa: E402
+from fixtures import camera_name, camera_slug  # noqa: E402
+
+
+def legacy_match(entities, go2rtc_streams, unifi_cameras):
+    """The matching loops discover_cameras() used before CameraMatcher."""
+    discovered = {eid: {"name": name, "stream_url": None} for eid, name in entities.items()}
+    for stream_name, url in go2rtc_streams.items():
+        for entity_id, camera in discovered.items():
+            if (stream_name.lower() in entity_id.lower() or
+                    stream_name.lower() in camera["name"].lower() or
+                    entity_id.replace("camera.", "") == stream_name):
+                camera["stream_url"] = url
+                break
+    for cam in unifi_cameras.values():
+        for entity_id, camera in discovered.items():
+            if camera["stream_url"]:
+                continue
+            entity_name = camera["name"].lower()
+            unifi_name = cam["name"].lower()
+            if (unifi_name in entity_name or entity_name in unifi_name or
+                    unifi_name.replace(" ", "_") in entity_id.lower()):
+                camera["stream_url"] = cam["url"]
+                break
+    return {eid: c["stream_url"] for eid, c in discovered.items() if c["stream_url"]}
+
+
+def indexed_match(entities, go2rtc_streams, unifi_cameras):
+    matcher = dc.CameraMatcher(entities)
+    urls = {}
+    for stream_name, entity_id in matcher.assign({s: (s, None) for s in go2rtc_streams}).items():
+        urls[entity_id] = go2rtc_streams[stream_name]
+    queries = {key: (cam["name"], None) for key, cam in unifi_cameras.items()}
+    for key, entity_id in matcher.assign(queries, available=lambda e: e not in urls).items():
+        urls[entity_id] = unifi_cameras[key]["url"]
+    return urls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--streams", type=int, default=1000, help="go2rtc streams and UniFi cameras (each)")
+    parser.add_argument("--entities", type=int, default=10000)
+    args = parser.parse_args()
+
+    entities = {}
+    # Lookalikes first, so first-hit matching sees them before the real camera
+    for i in range(args.entities - 2 * args.streams):
+        n = i % (2 * args.streams)
+        entities[f"camera.{camera_slug(n)}_side_{i}"] = f"{camera_name(n)} Side {i}"
+    for i in range(2 * args.streams):
+        entities[f"camera.{camera_slug(i)}"] = camera_name(i)
+
+    go2rtc_streams = {camera_slug(i): f"rtsp://go2rtc/{i}" for i in range(args.streams)}
+    unifi_cameras = {f"unifi{i}": {"name": camera_name(i), "url": f"rtsps://nvr/{i}"}
+                     for i in range(args.streams, 2 * args.streams)}
+    expected = {f"camera.{camera_slug(i)}" for i in range(2 * args.streams)}
+
+    print(f"{args.streams} go2rtc streams + {args.streams} UniFi cameras, {len(entities)} camera entities")
+    print(f"{'engine':<10} {'seconds':>9} {'correct':>9}")
+    for label, fn in [("indexed", indexed_match), ("legacy", legacy_match)]:
+        start = time.perf_counter()
+        urls = fn(entities, go2rtc_streams, unifi_cameras)
+        elapsed = time.perf_counter() - start
+        correct = len(expected & set(urls))
+        print(f"{label:<10} {elapsed:9.3f} {correct:>4}/{len(expected)}")
+
+
+if __name__ == "__main__":
+    main()
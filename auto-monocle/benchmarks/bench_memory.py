@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Peak memory of loading discovery inputs whole (json.load) vs streaming them.
+
+Usage: python3 benchmarks/bench_memory.py [--cameras 500] [--entities 20000]
+
+Peak is measured with tracemalloc around each parse, so only allocations made
+while reading and indexing the input are counted.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import discover_cameras as dc  # noqa: E402
+from fixtures import write_fixtures  # noqa: E402
+
+
+def peak_of(fn) -> int:
+    """Run fn and return its peak traced allocation in bytes."""
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def load_whole(path: str, array_path):
+    with open(path) as f:
+        data = json.load(f)
+    for key in array_path:
+        data = data[key]
+    return data
+
+
+def stream(path: str, array_path):
+    with open(path, "rb") as f:
+        yield from dc.iter_json_array(f, array_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--cameras", type=int, default=500)
+    parser.add_argument("--entities", type=int, default=20000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = write_fixtures(tmp, args.cameras, args.entities)
+
+        def registry(name, array_path, indexer):
+            path = paths[f".storage/{name}"]
+            return (name, path,
+                    lambda: indexer(load_whole(path, array_path)),
+                    lambda: indexer(stream(path, array_path)))
+
+        def bootstrap_whole():
+            data = load_whole(paths["bootstrap.json"], ())
+            return [{k: cam[k] for k in dc.PROTECT_CAMERA_FIELDS if k in cam} for cam in data["cameras"]]
+
+        def bootstrap_stream():
+            with open(paths["bootstrap.json"], "rb") as f:
+                return dc.read_protect_bootstrap(f)
+
+        def cameras_only(states):
+            return [s for s in states if s.get("entity_id", "").startswith("camera.")]
+
+        cases = [
+            registry("core.entity_registry", ("data", "entities"), dc.index_entity_registry),
+            registry("core.device_registry", ("data", "devices"), dc.index_device_registry),
+            ("/api/states", paths["states.json"],
+             lambda: cameras_only(load_whole(paths["states.json"], ())),
+             lambda: cameras_only(stream(paths["states.json"], ()))),
+            ("protect bootstrap", paths["bootstrap.json"], bootstrap_whole, bootstrap_stream),
+        ]
+
+        print(f"{args.cameras} cameras, {args.entities} entities")
+        print(f"{'input':<22} {'size MB':>8} {'json.load MB':>13} {'stream MB':>10} {'ratio':>7}")
+        for name, path, whole, streamed in cases:
+            size = os.path.getsize(path)
+            whole_peak = peak_of(whole)
+            stream_peak = peak_of(streamed)
+            print(f"{name:<22} {size / 1e6:8.1f} {whole_peak / 1e6:13.1f} {stream_peak / 1e6:10.1f} "
+                  f"{whole_peak / max(stream_peak, 1):6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+ONVIF discovery against a local stand-in responder: cold, cached and one-changed refreshes.
+
+Usage: python3 benchmarks/bench_onvif.py [--devices 10 100 500] [--slow 0.05] [--budget 10]
+
+The responder answers WS-Discovery Probes on a local UDP port (one
+ProbeMatches message per device, as cameras do) and serves each device's
+device and media services over HTTP, checking the WS-Security password
+digest on every request. A --slow fraction of devices answers slower than
+the budget. Reported per scale: wall time and SOAP requests for a cold run
+(empty cache), a repeat run (everything cached) and a run after one device
+bumps its MetadataVersion.
+"""
+
+import argparse
+import base64
+import hashlib
+import http.server
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import xml.etree.ElementTree as ET
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import discover_cameras as dc  # noqa: E402
+
+USERNAME = "admin"
+PASSWORD = "bench-pass"
+
+PROFILES = [("main", 2560, 1440), ("sub", 640, 360)]
+
+
+def envelope(body: str) -> bytes:
+    return (f'<?xml version="1.0" encoding="UTF-8"?><s:Envelope xmlns:s="{dc.SOAP_ENVELOPE_NS}" '
+            f'xmlns:tds="http://www.onvif.org/ver10/device/wsdl" xmlns:trt="http://www.onvif.org/ver10/media/wsdl" '
+            f'xmlns:tt="http://www.onvif.org/ver10/schema"><s:Body>{body}</s:Body></s:Envelope>').encode()
+
+
+FAULT = envelope('<s:Fault><s:Code><s:Value>s:Sender</s:Value></s:Code>'
+                 '<s:Reason><s:Text xml:lang="en">Sender not Authorized</s:Text></s:Reason></s:Fault>')
+
+
+class SoapServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients give up on slow devices; their broken pipes are expected
+        pass
+
+
+class OnvifResponder:
+    """Stand-in ONVIF devices: WS-Discovery over UDP and SOAP over one HTTP server."""
+
+    def __init__(self, devices: int, slow: float = 0.0, slow_delay: float = 30.0):
+        self.versions = [1] * devices
+        slow_every = int(1 / slow) if slow else 0
+        self.delays = [slow_delay if slow_every and i % slow_every == slow_every - 1 else 0.0
+                       for i in range(devices)]
+        self.requests = Counter()
+        self.lock = threading.Lock()
+
+        self.http = SoapServer(("127.0.0.1", 0), SoapHandler)
+        self.http.responder = self
+        threading.Thread(target=self.http.serve_forever, daemon=True).start()
+
+        self.udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.udp.bind(("127.0.0.1", 0))
+        threading.Thread(target=self.serve_discovery, daemon=True).start()
+
+    @property
+    def discovery_address(self):
+        return self.udp.getsockname()
+
+    def xaddr(self, i: int) -> str:
+        return f"http://127.0.0.1:{self.http.server_address[1]}/onvif/{i}/device_service"
+
+    def serve_discovery(self):
+        while True:
+            data, sender = self.udp.recvfrom(65536)
+            if b"Probe" not in data:
+                continue
+            for i, version in enumerate(self.versions):
+                match = (f'<?xml version="1.0"?><s:Envelope xmlns:s="{dc.SOAP_ENVELOPE_NS}" '
+                         'xmlns:a="http://schemas.xmlsoap.org/ws/2004/08/addressing" '
+                         'xmlns:d="http://schemas.xmlsoap.org/ws/2005/04/discovery"><s:Body><d:ProbeMatches>'
+                         f'<d:ProbeMatch><a:EndpointReference><a:Address>urn:uuid:bench-{i:05d}</a:Address>'
+                         '</a:EndpointReference><d:Types>dn:NetworkVideoTransmitter</d:Types>'
+                         f'<d:Scopes>onvif://www.onvif.org/type/video_encoder '
+                         f'onvif://www.onvif.org/name/ONVIF_Camera_{i:04d}</d:Scopes>'
+                         f'<d:XAddrs>{self.xaddr(i)}</d:XAddrs><d:MetadataVersion>{version}</d:MetadataVersion>'
+                         '</d:ProbeMatch></d:ProbeMatches></s:Body></s:Envelope>')
+                self.udp.sendto(match.encode(), sender)
+
+    def shutdown(self):
+        self.http.shutdown()
+        self.udp.close()
+
+
+def digest_ok(request: ET.Element) -> bool:
+    """Check the WS-Security UsernameToken digest against USERNAME/PASSWORD."""
+    token = request.find(".//{*}UsernameToken")
+    if token is None or dc.xml_text(token, "{*}Username") != USERNAME:
+        return False
+    nonce = base64.b64decode(dc.xml_text(token, "{*}Nonce") or "")
+    created = dc.xml_text(token, "{*}Created") or ""
+    expected = base64.b64encode(hashlib.sha1(nonce + created.encode() + PASSWORD.encode()).digest()).decode()
+    return dc.xml_text(token, "{*}Password") == expected
+
+
+class SoapHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        responder = self.server.responder
+        request = ET.fromstring(self.rfile.read(int(self.headers.get("Content-Length") or 0)))
+        body = request.find("{*}Body")
+        operation = body[0].tag.split("}")[-1] if len(body) else ""
+        _, index, _ = self.path.strip("/").split("/")
+        index = int(index)
+        with responder.lock:
+            responder.requests[operation] += 1
+        if responder.delays[index]:
+            time.sleep(responder.delays[index])
+
+        if not digest_ok(request):
+            self.reply(400, FAULT)
+            return
+        base = f"http://127.0.0.1:{self.server.server_address[1]}/onvif/{index}"
+        if operation == "GetCapabilities":
+            answer = (f"<tds:GetCapabilitiesResponse><tds:Capabilities><tt:Media><tt:XAddr>{base}/media_service"
+                      "</tt:XAddr></tt:Media></tds:Capabilities></tds:GetCapabilitiesResponse>")
+        elif operation == "GetProfiles":
+            answer = "<trt:GetProfilesResponse>" + "".join(
+                f'<trt:Profiles token="{token}"><tt:VideoEncoderConfiguration><tt:Encoding>H264</tt:Encoding>'
+                f"<tt:Resolution><tt:Width>{w}</tt:Width><tt:Height>{h}</tt:Height></tt:Resolution>"
+                "</tt:VideoEncoderConfiguration></trt:Profiles>"
+                for token, w, h in PROFILES) + "</trt:GetProfilesResponse>"
+        elif operation == "GetStreamUri":
+            token = dc.xml_text(body, ".//{*}ProfileToken")
+            answer = (f"<trt:GetStreamUriResponse><trt:MediaUri><tt:Uri>rtsp://192.0.2.{index % 250 + 1}:554/"
+                      f"{index}/{token}</tt:Uri></trt:MediaUri></trt:GetStreamUriResponse>")
+        elif operation == "GetNetworkInterfaces":
+            mac = f"{0xE0000000 + index:012x}"
+            answer = ("<tds:GetNetworkInterfacesResponse><tds:NetworkInterfaces><tt:Info><tt:HwAddress>"
+                      + ":".join(mac[j:j + 2] for j in range(0, 12, 2))
+                      + "</tt:HwAddress></tt:Info></tds:NetworkInterfaces></tds:GetNetworkInterfacesResponse>")
+        else:
+            self.reply(400, FAULT)
+            return
+        self.reply(200, envelope(answer))
+
+    def reply(self, status: int, data: bytes):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/soap+xml; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def run(responder: OnvifResponder, budget: float) -> dict:
+    start_requests = sum(responder.requests.values())
+    dc.METRICS.reset()
+    start = time.perf_counter()
+    cameras = dc.find_onvif_cameras("high", [], USERNAME, PASSWORD, multicast=True, budget=budget,
+                                    discovery_address=responder.discovery_address)
+    return {"seconds": time.perf_counter() - start, "cameras": len(cameras),
+            "found": dc.METRICS.snapshot()["counters"].get("onvif_devices", 0),
+            "requests": sum(responder.requests.values()) - start_requests,
+            "cache_hits": dc.METRICS.snapshot()["counters"].get("onvif_cache_hits", 0)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--devices", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--slow", type=float, default=0.05, help="fraction of devices slower than the budget")
+    parser.add_argument("--budget", type=float, default=dc.ONVIF_BUDGET, help="ONVIF_BUDGET seconds")
+    parser.add_argument("--discovery-timeout", type=float, default=0.5, help="WS_DISCOVERY_TIMEOUT seconds")
+    args = parser.parse_args()
+
+    dc.WS_DISCOVERY_TIMEOUT = args.discovery_timeout
+    print(f"{'devices':>7} {'run':<8} {'seconds':>8} {'found':>6} {'cameras':>8} {'SOAP req':>8} {'cached':>7}")
+    for devices in args.devices:
+        with tempfile.TemporaryDirectory() as tmp, open(os.devnull, "w") as quiet:
+            dc.ONVIF_CACHE_FILE = os.path.join(tmp, "onvif_cache.json")
+            dc.CIRCUIT_BREAKER_FILE = os.path.join(tmp, "circuit_breakers.json")
+            dc.CIRCUIT_BREAKERS.breakers = None
+            responder = OnvifResponder(devices, args.slow, slow_delay=args.budget + 2)
+
+            results = []
+            stdout, sys.stdout = sys.stdout, quiet
+            try:
+                results.append(("cold", run(responder, args.budget)))
+                results.append(("cached", run(responder, args.budget)))
+                responder.versions[0] += 1
+                results.append(("changed", run(responder, args.budget)))
+            finally:
+                sys.stdout = stdout
+            responder.shutdown()
+            for label, r in results:
+                print(f"{devices:>7} {label:<8} {r['seconds']:8.3f} {r['found']:>6} {r['cameras']:>8} {r['requests']:>8} "
+                      f"{r['cache_hits']:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+Synthetic Home Assistant, go2rtc and UniFi Protect data for benchmarks.
+
+Camera i is named "Camera NNNN", has MAC NNNNNNNNNNNN (hex) and appears in
+every UniFi source; go2rtc cameras are numbered after the UniFi ones and only
+appear in /api/states and go2rtc. Discovery results can be checked as well
+as timed. Filler entities and devices pad the registries to realistic record
+sizes.
+"""
+
+import json
+import os
+from typing import Dict, List
+
+
+def camera_name(i: int) -> str:
+    return f"Camera {i:04d}"
+
+
+def camera_slug(i: int) -> str:
+    return f"camera_{i:04d}"
+
+
+def camera_mac(i: int) -> str:
+    return f"{0xF0000000 + i:012X}"
+
+
+def make_device_registry(cameras: int, devices: int = 0) -> Dict:
+    """core.device_registry with one device per camera plus filler devices."""
+    records = []
+    for i in range(cameras):
+        mac = camera_mac(i)
+        records.append({
+            "id": f"cam{i:08d}",
+            "name": camera_name(i),
+            "name_by_user": None,
+            "manufacturer": "Ubiquiti",
+            "model": "UVC G4 Bullet",
+            "connections": [["mac", ":".join(mac[j:j + 2] for j in range(0, 12, 2)).lower()]],
+            "identifiers": [["unifiprotect", mac]],
+            "config_entries": ["protect0"],
+            "sw_version": "4.69.55",
+        })
+    for i in range(devices):
+        records.append({
+            "id": f"dev{i:08d}",
+            "name": f"Device {i}",
+            "name_by_user": None,
+            "manufacturer": "Acme",
+            "model": "Sensor",
+            "connections": [],
+            "identifiers": [["acme", str(i)]],
+            "config_entries": ["acme"],
+            "sw_version": "1.0.0",
+        })
+    return {"version": 1, "minor_version": 8, "key": "core.device_registry", "data": {"devices": records}}
+
+
+def make_entity_registry(cameras: int, entities: int) -> Dict:
+    """core.entity_registry with high/medium/low UniFi camera entities plus filler entities."""
+    records = []
+    for i in range(cameras):
+        for channel, quality in enumerate(["high", "medium", "low"]):
+            records.append({
+                "entity_id": f"camera.{camera_slug(i)}_{quality}",
+                "platform": "unifiprotect",
+                "unique_id": f"{camera_mac(i)}_{channel}",
+                "device_id": f"cam{i:08d}",
+                "config_entry_id": "protect0",
+                "original_name": f"{quality.title()} resolution channel",
+                "capabilities": None,
+                "options": {"conversation": {"should_expose": False}},
+            })
+    for i in range(max(0, entities - len(records))):
+        records.append({
+            "entity_id": f"sensor.filler_{i}",
+            "platform": "acme",
+            "unique_id": f"filler-{i}",
+            "device_id": f"dev{i % 1000:08d}",
+            "config_entry_id": "acme",
+            "original_name": f"Filler {i}",
+            "capabilities": {"state_class": "measurement"},
+            "options": {"sensor": {"suggested_display_precision": 1}},
+        })
+    return {"version": 1, "minor_version": 15, "key": "core.entity_registry", "data": {"entities": records}}
+
+
+def make_config_entries(nvr_host: str = "192.0.2.10") -> Dict:
+    """core.config_entries with one UniFi Protect entry."""
+    return {"version": 1, "key": "core.config_entries", "data": {"entries": [
+        {"entry_id": "acme", "domain": "acme", "title": "Acme", "data": {}},
+        {"entry_id": "protect0", "domain": "unifiprotect", "title": "NVR",
+         "data": {"host": nvr_host, "username": "bench", "password": "bench", "port": 443}},
+    ]}}
+
+
+def make_states(cameras: int, entities: int, go2rtc_cameras: int = 0) -> List[Dict]:
+    """/api/states response: one camera state per camera plus filler states."""
+    states = []
+    for i in range(cameras, cameras + go2rtc_cameras):
+        states.append({
+            "entity_id": f"camera.{camera_slug(i)}",
+            "state": "idle",
+            "attributes": {"friendly_name": camera_name(i), "access_token": "x" * 64},
+            "last_changed": "2026-01-01T00:00:00+00:00",
+            "last_updated": "2026-01-01T00:00:00+00:00",
+        })
+    for i in range(cameras):
+        states.append({
+            "entity_id": f"camera.{camera_slug(i)}_high",
+            "state": "idle",
+            "attributes": {"friendly_name": camera_name(i), "access_token": "x" * 64,
+                           "entity_picture": f"/api/camera_proxy/camera.{camera_slug(i)}_high?token=" + "x" * 64},
+            "last_changed": "2026-01-01T00:00:00+00:00",
+            "last_updated": "2026-01-01T00:00:00+00:00",
+        })
+    for i in range(max(0, entities - cameras)):
+        states.append({
+            "entity_id": f"sensor.filler_{i}",
+            "state": "21.5",
+            "attributes": {"friendly_name": f"Filler {i}", "unit_of_measurement": "°C",
+                           "device_class": "temperature", "state_class": "measurement"},
+            "last_changed": "2026-01-01T00:00:00+00:00",
+            "last_updated": "2026-01-01T00:00:00+00:00",
+        })
+    return states
+
+
+def make_bootstrap(cameras: int) -> Dict:
+    """UniFi Protect bootstrap with three channels per camera and bulky non-camera sections."""
+    records = []
+    for i in range(cameras):
+        records.append({
+            "id": f"protect{i:08d}",
+            "mac": camera_mac(i),
+            "name": camera_name(i),
+            "type": "UVC G4 Bullet",
+            "channels": [
+                {"id": channel, "name": quality, "enabled": True, "isRtspEnabled": True,
+                 "rtspAlias": f"{camera_mac(i)[-8:]}{channel}alias", "width": width, "height": height,
+                 "fps": 30, "bitrate": bitrate}
+                for channel, quality, width, height, bitrate in [
+                    (0, "High", 2688, 1512, 10_000_000),
+                    (1, "Medium", 1280, 720, 2_000_000),
+                    (2, "Low", 640, 360, 500_000),
+                ]
+            ],
+            "featureFlags": {f"flag{j}": j % 2 == 0 for j in range(40)},
+            "ispSettings": {f"setting{j}": j for j in range(60)},
+            "stats": {"rxBytes": i * 1000, "txBytes": i * 2000, "video": {"recordingStart": 0}},
+        })
+    return {
+        "lastUpdateId": "00000000-0000-0000-0000-000000000000",
+        "nvr": {"id": "nvr0", "name": "Bench NVR", "ports": {"rtsp": 7447, "rtsps": 7441}},
+        "cameras": records,
+        "users": [{"id": f"user{j}", "name": f"User {j}", "permissions": ["x"] * 20} for j in range(50)],
+        "events": [{"id": f"event{j}", "type": "motion", "score": j % 100} for j in range(cameras * 5)],
+    }
+
+
+def make_go2rtc_streams(start: int, count: int) -> Dict:
+    """go2rtc /api/streams response for cameras start..start+count-1."""
+    return {camera_slug(i): {"producers": [{"url": f"rtsp://192.0.2.20:554/{camera_slug(i)}"}], "consumers": None}
+            for i in range(start, start + count)}
+
+
+def write_fixtures(directory: str, cameras: int, entities: int, go2rtc_cameras: int = 0,
+                   nvr_host: str = "192.0.2.10") -> Dict[str, str]:
+    """Write every fixture as a JSON file under directory and return their paths."""
+    os.makedirs(os.path.join(directory, ".storage"), exist_ok=True)
+    files = {
+        ".storage/core.device_registry": make_device_registry(cameras, entities // 10),
+        ".storage/core.entity_registry": make_entity_registry(cameras, entities),
+        ".storage/core.config_entries": make_config_entries(nvr_host),
+        "states.json": make_states(cameras, entities, go2rtc_cameras),
+        "bootstrap.json": make_bootstrap(cameras),
+        "go2rtc.json": make_go2rtc_streams(cameras, go2rtc_cameras),
+    }
+    paths = {}
+    for name, data in files.items():
+        path = os.path.join(directory, name)
+        with open(path, "w") as f:
+            json.dump(data, f)
+        paths[name] = path
+    return paths
@@ -5,28 +5,757 @@ Supports multiple discovery methods:
 1. go2rtc streams (HA built-in or standalone)
 2. UniFi Protect integration (construct RTSP URLs from storage files)
 3. Generic camera stream_source attributes
+4. ONVIF devices (WS-Discovery and listed hosts)
 """
 
+import argparse
+import base64
+import codecs
+import contextlib
+import cProfile
+import fnmatch
+import hashlib
 import json
 import os
+import pstats
+import random
+import re
+import resource
+import signal
+import socket
+import ssl
+import struct
 import sys
+import threading
+import time
+import tracemalloc
+import unicodedata
+import uuid
+import xml.etree.ElementTree as ET
+import zlib
 import requests
-from typing import Dict, List, Optional, Tuple
+import urllib3
+from concurrent.futures import Executor, ThreadPoolExecutor, as_completed, wait
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from urllib.parse import quote, unquote, urlsplit, urlunsplit
+from xml.sax.saxutils import escape as xml_escape
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from file_utils import write_file_atomic
 
 SUPERVISOR_TOKEN = os.environ.get("SUPERVISOR_TOKEN")
 HA_URL = "http://supervisor/core"
+HA_WS_URL = "ws://supervisor/core/websocket"
 
 # HA storage paths (mapped as homeassistant_config:ro)
 HA_STORAGE_PATH = "/homeassistant/.storage"
 
-def api_get(endpoint: str, timeout: int = 10) -> Optional[Dict]:
-    """Make authenticated GET request to HA API."""
-    headers = {
+
+# =============================================================================
+# Discovery metrics
+# =============================================================================
+
+# Latest run with a rolling history, and the same numbers in Prometheus text format
+DISCOVERY_STATUS_FILE = "/data/discovery_status.json"
+DISCOVERY_METRICS_FILE = "/data/discovery_metrics.prom"
+METRICS_HISTORY = 50
+
+
+class DiscoveryMetrics:
+    """
+    Per-phase timings and counters for one discovery run.
+
+    Each phase ("ha_states", "go2rtc", "protect:<NVR>", "registry:<file>",
+    "match", "probe", "write_config") records "seconds" and, where they apply,
+    "bytes", "records" and "errors". Run-wide counts (matches, misses, cache
+    hits) go in counters. Phases run concurrently in parallel discovery, so
+    every update takes the lock.
+
+    With a profiler set (profiling mode), every phase is also profiled by it.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.profiler: Optional["DiscoveryProfiler"] = None
+        self.reset()
+
+    def reset(self):
+        """Start a new run."""
+        with self.lock:
+            self.started = time.time()
+            self.phases: Dict[str, Dict[str, float]] = {}
+            self.counters: Dict[str, float] = {}
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """Time a block as (part of) a phase; an exception counts as an error and is re-raised."""
+        start = time.perf_counter()
+        try:
+            with self.profiler.phase(name) if self.profiler else contextlib.nullcontext():
+                yield
+        except Exception:
+            self.add(name, "errors")
+            raise
+        finally:
+            self.add(name, "seconds", time.perf_counter() - start)
+
+    def add(self, phase: str, key: str, value: float = 1):
+        """Add to one of a phase's values."""
+        with self.lock:
+            stats = self.phases.setdefault(phase, {"seconds": 0.0})
+            stats[key] = stats.get(key, 0) + value
+
+    def count(self, counter: str, value: float = 1):
+        """Add to a run-wide counter."""
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            return {
+                "time": int(self.started),
+                "duration": round(time.time() - self.started, 3),
+                "phases": {name: {key: round(value, 4) for key, value in stats.items()}
+                           for name, stats in sorted(self.phases.items())},
+                "counters": dict(sorted(self.counters.items())),
+            }
+
+
+# Metrics of the current run (reset at the start of each refresh)
+METRICS = DiscoveryMetrics()
+
+
+def count_records(items: Iterable, phase: str) -> Iterator:
+    """Pass items through, adding how many there were to a phase's records."""
+    n = 0
+    try:
+        for item in items:
+            n += 1
+            yield item
+    finally:
+        METRICS.add(phase, "records", n)
+
+
+def prometheus_metrics(status: Dict) -> str:
+    """Prometheus text exposition of the last run and the run totals."""
+    def label(value: str) -> str:
+        return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    last = status["last"]
+    lines = []
+
+    def metric(name: str, kind: str, help_text: str, samples: List[Tuple[str, float]]):
+        lines.append(f"# HELP auto_monocle_{name} {help_text}")
+        lines.append(f"# TYPE auto_monocle_{name} {kind}")
+        lines.extend(f"auto_monocle_{name}{labels} {value}" for labels, value in samples)
+
+    metric("last_run_timestamp_seconds", "gauge", "Start time of the last discovery run",
+           [("", last["time"])])
+    metric("last_run_duration_seconds", "gauge", "Duration of the last discovery run",
+           [("", last["duration"])])
+    metric("last_run_success", "gauge", "1 if the last discovery run succeeded",
+           [("", 1 if last["result"] == "ok" else 0)])
+    metric("runs_total", "counter", "Discovery runs by result",
+           [(f'{{result="{result}"}}', n) for result, n in sorted(status["totals"].items())])
+    for key, help_text in [("seconds", "Time spent in each phase of the last run"),
+                           ("bytes", "Bytes read by each phase of the last run"),
+                           ("records", "Records read by each phase of the last run"),
+                           ("errors", "Errors in each phase of the last run")]:
+        metric(f"phase_{key}", "gauge", help_text,
+               [(f'{{phase="{label(name)}"}}', stats.get(key, 0)) for name, stats in last["phases"].items()])
+    metric("discovery_count", "gauge", "Counters of the last run (matches, misses, cache hits...)",
+           [(f'{{counter="{label(name)}"}}', value) for name, value in last["counters"].items()])
+    return "\n".join(lines) + "\n"
+
+
+def write_discovery_status(result: str, cameras: Optional[int] = None, changes: str = "",
+                           path: Optional[str] = None, metrics_path: Optional[str] = None):
+    """Append the current run to the status file's history and rewrite both metric files."""
+    path = path or DISCOVERY_STATUS_FILE
+    metrics_path = metrics_path or DISCOVERY_METRICS_FILE
+    run = METRICS.snapshot()
+    run.update({"result": result, "cameras": cameras, "changes": changes})
+    try:
+        with open(path) as f:
+            status = json.load(f)
+    except (OSError, ValueError):
+        status = {}
+    history = (status.get("history") or [])[-(METRICS_HISTORY - 1):] + [run]
+    totals = status.get("totals") or {}
+    totals[result] = totals.get(result, 0) + 1
+    status = {"last": run, "totals": totals, "history": history}
+    try:
+        write_file_atomic(path, json.dumps(status, indent=2))
+        write_file_atomic(metrics_path, prometheus_metrics(status))
+    except OSError as e:
+        print(f"[DEBUG] Could not write discovery status: {e}")
+
+
+# =============================================================================
+# Profiling mode
+# =============================================================================
+
+# Set to 1 to profile every refresh, like the profiling option
+PROFILE_ENV = "AUTO_MONOCLE_PROFILE"
+# Reports are written as /data/discovery_profile-<time>.txt and .json
+PROFILE_DIR = "/data"
+PROFILE_KEEP = 10
+# Functions and allocation sites listed per phase
+PROFILE_TOP = 15
+# Stack frames kept per traced allocation
+PROFILE_TRACEMALLOC_FRAMES = 5
+
+
+def profiling_enabled(options: Dict) -> bool:
+    """The profiling option, or AUTO_MONOCLE_PROFILE set to a true value."""
+    env = os.environ.get(PROFILE_ENV, "").strip().lower()
+    return bool(options.get("profiling", False)) or env in ("1", "true", "yes", "on")
+
+
+def short_path(text: str) -> str:
+    """Drop the script and standard library directories from file names in a report."""
+    return (text.replace(os.path.dirname(os.path.abspath(__file__)) + os.sep, "")
+            .replace(os.path.dirname(os.__file__) + os.sep, ""))
+
+
+def traced_statistics() -> Dict[tracemalloc.Traceback, Tuple[int, int]]:
+    """Traced memory by allocation traceback: (bytes, blocks), leaving out tracemalloc's own."""
+    snapshot = tracemalloc.take_snapshot()
+    return {stat.traceback: (stat.size, stat.count) for stat in snapshot.statistics("traceback")
+            if stat.traceback[-1].filename != tracemalloc.__file__}
+
+
+class DiscoveryProfiler:
+    """
+    cProfile and tracemalloc for each phase of one discovery run.
+
+    A phase is profiled when no other phase is: one that starts inside it (a
+    registry read during matching) or alongside it (a second NVR) is counted
+    as part of it and listed under "includes". Profiling mode runs discovery
+    sequentially so sources don't overlap. From Python 3.12, cProfile sees
+    every thread; before, only the thread that started the phase.
+
+    Per phase: time, peak traced memory, memory still held at the end, the
+    top functions by cumulative time and the top allocation sites of the
+    memory the phase added.
+    """
+
+    def __init__(self, top: int = PROFILE_TOP):
+        self.top = top
+        self.lock = threading.Lock()
+        self.owner: Optional[str] = None
+        self.phases: Dict[str, Dict] = {}
+        self.profiles: List[cProfile.Profile] = []
+        self.started = time.time()
+        self.started_tracemalloc = False
+        self.baseline = 0
+        self.peak_run = 0
+        self.statistics: Optional[Dict[tracemalloc.Traceback, Tuple[int, int]]] = None
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(PROFILE_TRACEMALLOC_FRAMES)
+            self.started_tracemalloc = True
+        self.baseline = tracemalloc.get_traced_memory()[0]
+
+    def stop(self):
+        self.peak_run = max([p.get("peak_bytes", 0) for p in self.phases.values()] or [0])
+        if self.started_tracemalloc:
+            tracemalloc.stop()
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        with self.lock:
+            owned = self.owner is None
+            if owned:
+                self.owner = name
+            elif name != self.owner:
+                includes = self.phases.setdefault(self.owner, {}).setdefault("includes", [])
+                if name not in includes:
+                    includes.append(name)
+        if not owned:
+            yield
+            return
+
+        # Grouping every trace is the slow part of profiling, so each phase starts
+        # from the statistics the last one ended with (anything allocated between
+        # two phases counts towards the second)
+        before = self.statistics if self.statistics is not None else traced_statistics()
+        tracemalloc.reset_peak()
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is active (e.g. the run is under python -m cProfile)
+            profile = None
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            if profile:
+                profile.disable()
+            current, peak = tracemalloc.get_traced_memory()
+            after = self.statistics = traced_statistics()
+            added = sorted(((traceback, size - before.get(traceback, (0, 0))[0],
+                             count - before.get(traceback, (0, 0))[1])
+                            for traceback, (size, count) in after.items()), key=lambda item: -item[1])
+            allocations = [{"site": self.allocation_site(traceback), "bytes": size, "blocks": count}
+                           for traceback, size, count in added[:self.top] if size > 0]
+            with self.lock:
+                stats = self.phases.setdefault(name, {})
+                stats["seconds"] = round(stats.get("seconds", 0) + seconds, 4)
+                stats["peak_bytes"] = max(stats.get("peak_bytes", 0), peak - self.baseline)
+                stats["retained_bytes"] = current - self.baseline
+                stats["allocations"] = allocations
+                if profile:
+                    self.profiles.append(profile)
+                    stats["functions"] = self.top_functions(pstats.Stats(profile))
+                self.owner = None
+
+    @staticmethod
+    def allocation_site(traceback: tracemalloc.Traceback) -> str:
+        """Where the memory was allocated, and the line of this script that led there."""
+        site = short_path(str(traceback[-1]))
+        caller = next((frame for frame in reversed(traceback) if frame.filename == __file__), None)
+        if caller is not None and caller != traceback[-1]:
+            site += f" (from line {caller.lineno})"
+        return site
+
+    def top_functions(self, stats: pstats.Stats) -> List[Dict]:
+        """The top functions of a profile by cumulative time."""
+        rows = sorted(stats.stats.items(), key=lambda item: -item[1][3])[:self.top]
+        return [{"function": short_path(pstats.func_std_string(func)),
+                 "calls": calls, "own_seconds": round(own, 4), "cumulative_seconds": round(cumulative, 4)}
+                for func, (_, calls, own, cumulative, _) in rows]
+
+    def report(self, result: str) -> Dict:
+        """Everything measured, with the run's metrics, as one JSON-serialisable dict."""
+        overall = pstats.Stats(*self.profiles) if self.profiles else None
+        return {
+            "time": int(self.started),
+            "result": result,
+            "python": sys.version.split()[0],
+            "peak_traced_bytes": self.peak_run,
+            "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+            "functions": self.top_functions(overall) if overall else [],
+            "phases": dict(sorted(self.phases.items(), key=lambda item: -item[1].get("seconds", 0))),
+            "metrics": METRICS.snapshot(),
+        }
+
+
+def format_profile_report(report: Dict) -> str:
+    """Plain-text version of a profile report, for reading and attaching to bug reports."""
+    def mb(n: float) -> str:
+        return f"{n / 1048576:.1f} MB"
+
+    def functions(rows: List[Dict]) -> List[str]:
+        lines = [f"    {'cumulative':>10} {'own':>8} {'calls':>8}  function"]
+        lines.extend(f"    {r['cumulative_seconds']:10.3f} {r['own_seconds']:8.3f} {r['calls']:>8}  {r['function']}"
+                     for r in rows)
+        return lines
+
+    lines = [f"Auto-Monocle discovery profile, {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(report['time']))}",
+             f"Result: {report['result']}, {report['metrics']['duration']:.2f}s, Python {report['python']}",
+             f"Peak traced memory: {mb(report['peak_traced_bytes'])}, process peak RSS: {mb(report['peak_rss_bytes'])}",
+             "(phase times include cProfile overhead; the run time also includes memory snapshots)", "",
+             "Phases:"]
+    for name, stats in report["phases"].items():
+        lines.append(f"  {name:<32} {stats.get('seconds', 0):8.3f}s  peak {mb(stats.get('peak_bytes', 0)):>9}"
+                     f"  held {mb(stats.get('retained_bytes', 0)):>9}")
+    lines += ["", "Top functions, all phases:"] + functions(report["functions"])
+    for name, stats in report["phases"].items():
+        lines += ["", f"== {name}"]
+        if stats.get("includes"):
+            lines.append(f"  includes: {', '.join(stats['includes'])}")
+        if stats.get("functions"):
+            lines += ["  Top functions:"] + functions(stats["functions"])
+        if stats.get("allocations"):
+            lines.append("  Top allocation sites (memory added by the phase):")
+            lines.extend(f"    {mb(a['bytes']):>9} {a['blocks']:>8} blocks  {a['site']}" for a in stats["allocations"])
+    lines += ["", "Counters:"]
+    lines.extend(f"  {name}: {value}" for name, value in report["metrics"]["counters"].items())
+    return "\n".join(lines) + "\n"
+
+
+def write_profile_report(report: Dict, directory: Optional[str] = None) -> Optional[str]:
+    """Write a report as .txt and .json, keeping the last PROFILE_KEEP; returns the .txt path."""
+    directory = directory or PROFILE_DIR
+    base = os.path.join(directory, f"discovery_profile-{time.strftime('%Y%m%d-%H%M%S', time.localtime(report['time']))}")
+    try:
+        write_file_atomic(f"{base}.json", json.dumps(report, indent=2))
+        write_file_atomic(f"{base}.txt", format_profile_report(report))
+        reports = sorted(name for name in os.listdir(directory)
+                         if name.startswith("discovery_profile-") and name.endswith(".txt"))
+        for name in reports[:-PROFILE_KEEP]:
+            for old in (name, name[:-4] + ".json"):
+                with contextlib.suppress(OSError):
+                    os.unlink(os.path.join(directory, old))
+    except OSError as e:
+        print(f"[WARN] Could not write profile report: {e}")
+        return None
+    return f"{base}.txt"
+
+
+# =============================================================================
+# HTTP client and circuit breakers
+# =============================================================================
+
+# Retries for connection errors and 502/503/504 answers, with exponential backoff
+# (0.5s, 1s, ...). Read timeouts are not retried: a slow source stays slow.
+HTTP_RETRIES = 2
+HTTP_BACKOFF = 0.5
+# Connections kept alive per host (per-entity state fetches and probes run 16+ at once)
+HTTP_POOL_SIZE = 32
+
+# UniFi Protect NVRs use self-signed certificates (HA doesn't verify them either)
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+
+def make_http_session() -> requests.Session:
+    """Connection-pooled session with keep-alive and bounded retries."""
+    session = requests.Session()
+    retry = Retry(total=HTTP_RETRIES, connect=HTTP_RETRIES, read=0, status=HTTP_RETRIES,
+                  backoff_factor=HTTP_BACKOFF, status_forcelist=(502, 503, 504),
+                  allowed_methods=frozenset({"GET", "POST"}), raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+# Shared HTTP session so connections are kept alive between requests (and
+# between refresh cycles in daemon mode)
+HTTP_SESSION = make_http_session()
+
+
+# Breaker state, kept across processes so poll mode remembers failing sources
+CIRCUIT_BREAKER_FILE = "/data/circuit_breakers.json"
+
+
+class CircuitBreaker:
+    """
+    Skips a failing source for a cooldown instead of paying its timeout every refresh.
+
+    After `threshold` consecutive failures the breaker opens for `cooldown`
+    seconds; then one attempt is let through. Each failure while half-open
+    doubles the cooldown (up to max_cooldown); a success closes it again.
+
+    State changes go through CircuitBreakers.call, which holds its lock.
+    """
+
+    def __init__(self, name: str, threshold: int = 2, cooldown: float = 60, max_cooldown: float = 900):
+        self.name = name
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.failures = 0
+        self.cooldown = cooldown
+        self.open_until = 0.0
+
+    def allow(self) -> bool:
+        """True if the source may be tried now."""
+        return time.time() >= self.open_until
+
+    def record_success(self) -> bool:
+        """Close the breaker; True if it had failures to forget."""
+        changed = bool(self.failures or self.open_until)
+        self.failures = 0
+        self.cooldown = self.base_cooldown
+        self.open_until = 0.0
+        if changed:
+            print(f"[INFO] {self.name} is answering again")
+        return changed
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.threshold:
+            if self.failures > self.threshold:
+                self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+            self.open_until = time.time() + self.cooldown
+            print(f"[WARN] {self.name} failed {self.failures} times in a row, skipping it for {self.cooldown:.0f}s")
+
+
+class CircuitBreakers:
+    """One CircuitBreaker per source name, persisted to CIRCUIT_BREAKER_FILE."""
+
+    def __init__(self, path: Optional[str] = None):
+        # None: CIRCUIT_BREAKER_FILE, looked up when the file is used
+        self._path = path
+        self.lock = threading.Lock()
+        self.breakers: Optional[Dict[str, CircuitBreaker]] = None
+
+    @property
+    def path(self) -> str:
+        return self._path or CIRCUIT_BREAKER_FILE
+
+    def get(self, name: str) -> CircuitBreaker:
+        with self.lock:
+            if self.breakers is None:
+                self.breakers = self._load()
+            breaker = self.breakers.get(name)
+            if breaker is None:
+                breaker = self.breakers[name] = CircuitBreaker(name)
+            return breaker
+
+    def _load(self) -> Dict[str, CircuitBreaker]:
+        try:
+            with open(self.path) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        breakers = {}
+        for name, state in saved.items():
+            breaker = CircuitBreaker(name)
+            breaker.failures = state.get("failures", 0)
+            breaker.cooldown = state.get("cooldown", breaker.cooldown)
+            breaker.open_until = state.get("open_until", 0.0)
+            breakers[name] = breaker
+        return breakers
+
+    def _save(self):
+        """Write every breaker with failures; the caller holds self.lock."""
+        state = {name: {"failures": b.failures, "cooldown": b.cooldown, "open_until": b.open_until}
+                 for name, b in sorted((self.breakers or {}).items()) if b.failures}
+        try:
+            write_file_atomic(self.path, json.dumps(state, indent=2))
+        except OSError as e:
+            print(f"[DEBUG] Could not write {self.path}: {e}")
+
+    def call(self, name: str, fn: Callable, *args, **kwargs):
+        """Run fn through the named breaker; raises SourceSkipped while it is open."""
+        breaker = self.get(name)
+        if not breaker.allow():
+            METRICS.count("breaker_skips")
+            raise SourceSkipped(f"{name} skipped for {breaker.open_until - time.time():.0f}s after "
+                                f"{breaker.failures} failures")
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            # Update and write under one lock, so concurrent sources don't lose each other's failures
+            with self.lock:
+                breaker.record_failure()
+                self._save()
+            raise
+        with self.lock:
+            if breaker.record_success():
+                self._save()
+        return result
+
+
+class SourceSkipped(Exception):
+    """A source was not tried because its circuit breaker is open."""
+
+
+CIRCUIT_BREAKERS = CircuitBreakers()
+
+
+# =============================================================================
+# Streaming JSON extraction
+# =============================================================================
+
+# Next structural character outside a string / end of a string
+_JSON_STRUCTURAL = re.compile(r'[\[\]{}"]')
+_JSON_STRING_END = re.compile(r'["\\]')
+_JSON_SCALAR_END = re.compile(r'[,\]}\s]')
+_JSON_WHITESPACE = " \t\n\r"
+_JSON_DELIMITERS = ",]}:" + _JSON_WHITESPACE
+_JSON_DECODER = json.JSONDecoder()
+
+
+class JsonStreamReader:
+    """
+    Pull-style JSON reader over a byte stream.
+
+    Walks objects and arrays without building them, decoding only the values
+    the caller asks for and skipping the rest. Memory stays bounded by the
+    largest single record read, not by the size of the document:
+
+        reader = JsonStreamReader(response)
+        for key in reader.iter_object():
+            if key == "cameras":
+                for cam in reader.iter_array():
+                    ...
+            # values that aren't read are skipped
+    """
+
+    def __init__(self, source, chunk_size: int = 65536):
+        if hasattr(source, "read"):
+            self.chunks = iter(lambda: source.read(chunk_size), b"")
+        else:
+            self.chunks = iter(source)
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buf = ""
+        self.pos = 0
+        self.bytes_read = 0
+        self.value_pending = False
+
+    def _fill(self) -> int:
+        """Drop consumed text and append the next chunk. Returns how far indexes shifted."""
+        for chunk in self.chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode()
+            self.bytes_read += len(chunk)
+            text = self.decoder.decode(chunk)
+            if text:
+                shift = self.pos
+                self.buf = self.buf[self.pos:] + text
+                self.pos = 0
+                return shift
+        raise ValueError("unexpected end of JSON stream")
+
+    def _peek(self) -> str:
+        """Skip whitespace and return the next character."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _JSON_WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            self._fill()
+
+    def _expect(self, chars: str) -> str:
+        ch = self._peek()
+        if ch not in chars:
+            raise ValueError(f"expected one of {chars!r} in JSON stream, got {ch!r}")
+        self.pos += 1
+        return ch
+
+    def _value_end(self) -> int:
+        """Find the end of the value at pos, releasing scanned text as we go."""
+        self._peek()
+        i = self.pos
+        if self.buf[i] not in '[{"':
+            # Number, true, false or null
+            while True:
+                m = _JSON_SCALAR_END.search(self.buf, i)
+                if m:
+                    return m.start()
+                try:
+                    i -= self._fill()
+                except ValueError:
+                    return len(self.buf)  # scalar at the very end of the document
+
+        depth = 0
+        in_string = False
+        while True:
+            if in_string:
+                m = _JSON_STRING_END.search(self.buf, i)
+                if m and m.group() == "\\":
+                    i = m.end() + 1  # skip the escaped character
+                    continue
+                if m:
+                    in_string = False
+                    i = m.end()
+                    if depth == 0:
+                        return i
+                    continue
+            else:
+                m = _JSON_STRUCTURAL.search(self.buf, i)
+                if m:
+                    i = m.end()
+                    ch = m.group()
+                    if ch == '"':
+                        in_string = True
+                    elif ch in "[{":
+                        depth += 1
+                    else:
+                        depth -= 1
+                        if depth == 0:
+                            return i
+                    continue
+            self.pos = min(i, len(self.buf))
+            i -= self._fill()
+
+    def read_value(self) -> Any:
+        """Decode the next value."""
+        self.value_pending = False
+        self._peek()
+        while True:
+            try:
+                value, end = _JSON_DECODER.raw_decode(self.buf, self.pos)
+                # A number cut at the buffer end ("12", "1.", "1e") decodes early,
+                # so only trust values followed by a delimiter
+                if end < len(self.buf) and self.buf[end] in _JSON_DELIMITERS:
+                    self.pos = end
+                    return value
+            except ValueError:
+                pass
+            try:
+                self._fill()
+            except ValueError:
+                # End of stream: whatever is buffered is all there is
+                value, self.pos = _JSON_DECODER.raw_decode(self.buf, self.pos)
+                return value
+
+    def skip_value(self):
+        """Skip the next value without decoding it."""
+        self.value_pending = False
+        self.pos = self._value_end()
+
+    def iter_object(self) -> Iterator[str]:
+        """Yield the keys of the object at pos; each value is skipped unless the caller reads it."""
+        self._expect("{")
+        if self._peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            self._peek()
+            while True:
+                try:
+                    key, end = json.decoder.scanstring(self.buf, self.pos + 1)
+                    break
+                except ValueError:
+                    self._fill()
+            self.pos = end
+            self._expect(":")
+            self.value_pending = True
+            yield key
+            if self.value_pending:
+                self.skip_value()
+            if self._expect(",}") == "}":
+                return
+
+    def iter_array(self) -> Iterator[Any]:
+        """Decode and yield the elements of the array at pos one at a time."""
+        self.value_pending = False
+        self._expect("[")
+        if self._peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.read_value()
+            if self._expect(",]") == "]":
+                return
+
+    def iter_path(self, path: Tuple[str, ...]) -> Iterator[Any]:
+        """Yield the elements of the array found by following object keys in path."""
+        if not path:
+            yield from self.iter_array()
+            return
+        for key in self.iter_object():
+            if key == path[0]:
+                yield from self.iter_path(path[1:])
+                return
+
+
+def iter_json_array(source, path: Tuple[str, ...] = ()) -> Iterator[Any]:
+    """Stream the elements of the JSON array at path (e.g. ("data", "entities"))."""
+    return JsonStreamReader(source).iter_path(path)
+
+
+def ha_headers() -> Dict[str, str]:
+    """Headers for authenticated HA API requests."""
+    return {
         "Authorization": f"Bearer {SUPERVISOR_TOKEN}",
         "Content-Type": "application/json"
     }
+
+
+def api_get(endpoint: str, timeout: int = 10) -> Optional[Dict]:
+    """Make authenticated GET request to HA API."""
     try:
-        response = requests.get(f"{HA_URL}{endpoint}", headers=headers, timeout=timeout)
+        response = HTTP_SESSION.get(f"{HA_URL}{endpoint}", headers=ha_headers(), timeout=timeout)
         if response.status_code == 200:
             return response.json()
     except Exception as e:
@@ -34,55 +763,299 @@ def api_get(endpoint: str, timeout: int = 10) -> Optional[Dict]:
     return None
 
 
-def read_storage_file(filename: str) -> Optional[Dict]:
-    """Read HA storage file directly (more reliable than API for some data)."""
-    filepath = os.path.join(HA_STORAGE_PATH, filename)
-    try:
-        with open(filepath, 'r') as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"[DEBUG] Storage file error {filename}: {e}")
-    return None
+def api_stream(endpoint: str, path: Tuple[str, ...] = (), timeout: int = 10,
+               phase: Optional[str] = None) -> Iterator[Dict]:
+    """Stream the elements of a JSON array returned by the HA API (raises on errors).
+
+    With phase, the bytes read are added to that metrics phase.
+    """
+    with HTTP_SESSION.get(f"{HA_URL}{endpoint}", headers=ha_headers(), timeout=timeout, stream=True) as response:
+        if response.status_code != 200:
+            raise ValueError(f"HTTP {response.status_code}")
+        reader = JsonStreamReader(response.iter_content(65536))
+        try:
+            yield from reader.iter_path(path)
+        finally:
+            if phase:
+                METRICS.add(phase, "bytes", reader.bytes_read)
+
+
+def index_device_registry(devices: Iterable[Dict]) -> Dict:
+    """Build device_id -> name and MAC -> name lookups from core.device_registry."""
+    names_by_id = {}
+    names_by_mac = {}
+    for dev in devices:
+        # name_by_user is the user's custom alias, name is the original device name
+        name = dev.get("name_by_user") or dev.get("name")
+        if not name:
+            continue
+        dev_id = dev.get("id")
+        if dev_id:
+            names_by_id[dev_id] = name
+        for conn in dev.get("connections", []):
+            if isinstance(conn, list) and len(conn) >= 2 and conn[0] == "mac":
+                mac = conn[1].upper().replace(":", "")
+                if mac:
+                    names_by_mac[mac] = name
+    return {"names_by_id": names_by_id, "names_by_mac": names_by_mac}
+
+
+# UniFi Protect camera entity unique_id: "<MAC>_<channel>"
+_UNIFI_CAMERA_UNIQUE_ID = re.compile(r"^([0-9A-Fa-f]{12})_\d$")
+# HA ONVIF camera entity unique_id: "<mac with colons>" for the first profile,
+# "<mac with colons>_<profile index>" for the others
+_ONVIF_CAMERA_UNIQUE_ID = re.compile(r"^((?:[0-9A-Fa-f]{2}:){5}[0-9A-Fa-f]{2})(?:_\d+)?$")
+
+
+def registry_entity_needed(entity_id: str, platform: str) -> bool:
+    """Entity registry entries discovery reads later: cameras and the UniFi Protect / ONVIF platforms."""
+    return entity_id.startswith("camera.") or "unifi" in platform.lower() or platform == "onvif"
+
+
+def index_entity_registry(entities: Iterable[Dict]) -> Dict:
+    """Group core.entity_registry entries by platform, keeping only the records and fields discovery uses.
+
+    Other entities are dropped as they stream past, so memory grows with the
+    number of cameras rather than the size of the registry. Also maps UniFi
+    Protect and ONVIF camera MACs to their camera entity_ids and lists enabled
+    camera entity_ids.
+    """
+    count = 0
+    by_platform = {}
+    camera_macs = {}
+    camera_ids = []
+    for ent in entities:
+        count += 1
+        platform = ent.get("platform", "")
+        entity_id = ent.get("entity_id", "")
+        if not registry_entity_needed(entity_id, platform):
+            continue
+        unique_id = ent.get("unique_id", "")
+        if entity_id.startswith("camera.") and not ent.get("disabled_by"):
+            camera_ids.append(entity_id)
+        by_platform.setdefault(platform, []).append({
+            "entity_id": entity_id,
+            "platform": platform,
+            "unique_id": unique_id,
+            "device_id": ent.get("device_id"),
+            "config_entry_id": ent.get("config_entry_id"),
+        })
+        if entity_id.startswith("camera.") and "unifi" in platform.lower():
+            m = _UNIFI_CAMERA_UNIQUE_ID.match(str(unique_id))
+            if m:
+                camera_macs.setdefault(m.group(1).upper(), []).append(entity_id)
+        elif entity_id.startswith("camera.") and platform == "onvif":
+            m = _ONVIF_CAMERA_UNIQUE_ID.match(str(unique_id))
+            if m:
+                camera_macs.setdefault(m.group(1).replace(":", "").upper(), []).append(entity_id)
+    return {"count": count, "by_platform": by_platform, "camera_macs": camera_macs, "camera_ids": camera_ids}
+
+
+def index_config_entries(entries: Iterable[Dict]) -> Dict:
+    """Keep the config entry list from core.config_entries."""
+    return {"entries": list(entries)}
+
+
+class RegistryCache:
+    """HA .storage registries, parsed at most once per change and kept as lookup indexes.
+
+    Each file is keyed on (path, mtime, size). When it changes on disk it is
+    streamed again and its indexes rebuilt; otherwise every call is a dict
+    lookup. Records are parsed one at a time, so the whole registry is never
+    held in memory.
+    """
+
+    # filename -> (path of the record array, indexer)
+    INDEXERS = {
+        "core.device_registry": (("data", "devices"), index_device_registry),
+        "core.entity_registry": (("data", "entities"), index_entity_registry),
+        "core.config_entries": (("data", "entries"), index_config_entries),
+    }
+
+    def __init__(self):
+        self._indexes: Dict[str, Tuple[Tuple[int, int], Dict]] = {}
+        self._locks = {filename: threading.Lock() for filename in self.INDEXERS}
+
+    def get(self, filename: str) -> Optional[Dict]:
+        """Return the indexes for a storage file, or None if it can't be read."""
+        filepath = os.path.join(HA_STORAGE_PATH, filename)
+        # One parse per file even when several discovery threads ask at once
+        with self._locks[filename]:
+            try:
+                st = os.stat(filepath)
+            except OSError as e:
+                print(f"[DEBUG] Storage file error {filename}: {e}")
+                return None
+            signature = (st.st_mtime_ns, st.st_size)
+            cached = self._indexes.get(filepath)
+            if cached and cached[0] == signature:
+                METRICS.count("registry_cache_hits")
+                return cached[1]
+
+            path, indexer = self.INDEXERS[filename]
+            phase = f"registry:{filename}"
+            try:
+                with METRICS.phase(phase), open(filepath, "rb") as f:
+                    indexes = indexer(count_records(iter_json_array(f, path), phase))
+                METRICS.add(phase, "bytes", st.st_size)
+            except Exception as e:
+                print(f"[DEBUG] Storage file error {filename}: {e}")
+                return None
+            self._indexes[filepath] = (signature, indexes)
+            return indexes
+
+    def device_names(self) -> Dict[str, str]:
+        """device_id -> device name."""
+        indexes = self.get("core.device_registry")
+        return indexes["names_by_id"] if indexes else {}
+
+    def device_names_by_mac(self) -> Dict[str, str]:
+        """MAC (upper-case, no colons) -> device name."""
+        indexes = self.get("core.device_registry")
+        return indexes["names_by_mac"] if indexes else {}
+
+    def entity_registry(self) -> Optional[Dict]:
+        """{"count": N, "by_platform": {platform: [entity, ...]}}, or None if unreadable."""
+        return self.get("core.entity_registry")
+
+    def camera_entities_by_mac(self) -> Dict[str, List[str]]:
+        """UniFi Protect / ONVIF camera MAC -> camera entity_ids (one per channel or profile)."""
+        indexes = self.get("core.entity_registry")
+        return indexes["camera_macs"] if indexes else {}
+
+    def camera_entity_ids(self) -> List[str]:
+        """entity_ids of enabled camera entities."""
+        indexes = self.get("core.entity_registry")
+        return indexes["camera_ids"] if indexes else []
+
+    def config_entries(self) -> Optional[List[Dict]]:
+        """Config entries from storage, or None if unreadable."""
+        indexes = self.get("core.config_entries")
+        return indexes["entries"] if indexes else None
+
+
+# Shared registry cache (survives between refresh cycles in daemon mode)
+REGISTRY_CACHE = RegistryCache()
 
 
 # =============================================================================
 # Method 1: go2rtc streams
 # =============================================================================
 
+# Candidate go2rtc API endpoints, probed in parallel
+GO2RTC_ENDPOINTS = [
+    "http://supervisor/core/api/go2rtc/streams",  # HA built-in go2rtc
+    "http://localhost:1984/api/streams",           # Standalone go2rtc
+    "http://localhost:11984/api/streams",          # HA go2rtc alternate port
+    "http://homeassistant:1984/api/streams",       # Docker network
+]
+
+# Last endpoint that answered, tried first on the next run
+GO2RTC_ENDPOINT_FILE = "/data/go2rtc_endpoint"
+
+
+def fetch_go2rtc_streams(url: str, timeout: int = 5) -> Dict:
+    """Fetch the raw stream list from one go2rtc endpoint (raises if it isn't valid)."""
+    headers = {"Authorization": f"Bearer {SUPERVISOR_TOKEN}"} if "supervisor" in url else {}
+    response = HTTP_SESSION.get(url, headers=headers, timeout=timeout)
+    METRICS.add("go2rtc", "bytes", len(response.content))
+    if response.status_code != 200:
+        raise ValueError(f"HTTP {response.status_code}")
+    data = response.json()
+    if not isinstance(data, dict):
+        raise ValueError("unexpected response format")
+    return data
+
+
+def probe_go2rtc_endpoints(endpoints: List[str], timeout: int = 5) -> Tuple[Optional[str], Optional[Dict]]:
+    """Probe all endpoints at once and return the first valid (url, data) pair."""
+    if not endpoints:
+        return None, None
+
+    executor = ThreadPoolExecutor(max_workers=len(endpoints), thread_name_prefix="go2rtc")
+    futures = {executor.submit(CIRCUIT_BREAKERS.call, f"go2rtc {url}", fetch_go2rtc_streams, url, timeout): url
+               for url in endpoints}
+    try:
+        for future in as_completed(futures):
+            url = futures[future]
+            try:
+                return url, future.result()
+            except Exception as e:
+                METRICS.add("go2rtc", "errors")
+                print(f"[DEBUG] go2rtc probe {url}: {e}")
+    finally:
+        # Don't wait for the slower endpoints once we have a winner
+        executor.shutdown(wait=False, cancel_futures=True)
+    return None, None
+
+
+def load_go2rtc_endpoint(path: Optional[str] = None) -> Optional[str]:
+    """Read the remembered go2rtc endpoint, if any."""
+    path = path or GO2RTC_ENDPOINT_FILE
+    try:
+        with open(path) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def save_go2rtc_endpoint(url: str, path: Optional[str] = None):
+    """Remember the go2rtc endpoint that answered."""
+    path = path or GO2RTC_ENDPOINT_FILE
+    try:
+        write_file_atomic(path, url)
+    except OSError as e:
+        print(f"[DEBUG] Could not update {path}: {e}")
+
+
 def get_go2rtc_streams() -> Dict[str, str]:
-    """Try to get streams from go2rtc (HA built-in or standalone)."""
-    streams = {}
+    """Try to get streams from go2rtc (HA built-in or standalone).
 
-    # Try various go2rtc endpoints
-    endpoints = [
-        "http://supervisor/core/api/go2rtc/streams",  # HA built-in go2rtc
-        "http://localhost:1984/api/streams",           # Standalone go2rtc
-        "http://localhost:11984/api/streams",          # HA go2rtc alternate port
-        "http://homeassistant:1984/api/streams",       # Docker network
-    ]
+    The endpoint that answered last time is tried first; all candidates are
+    only probed (in parallel) when it fails.
+    """
+    with METRICS.phase("go2rtc"):
+        streams = find_go2rtc_streams()
+    METRICS.add("go2rtc", "records", len(streams))
+    return streams
 
-    for url in endpoints:
-        try:
-            headers = {"Authorization": f"Bearer {SUPERVISOR_TOKEN}"} if "supervisor" in url else {}
-            response = requests.get(url, headers=headers, timeout=5)
-            if response.status_code == 200:
-                data = response.json()
-                print(f"[INFO] Found go2rtc at {url}")
-                # go2rtc returns {stream_name: {producers: [{url: "rtsp://..."}]}}
-                for name, info in data.items():
-                    if isinstance(info, dict):
-                        producers = info.get("producers", [])
-                        for producer in producers:
-                            if isinstance(producer, dict) and "url" in producer:
-                                url = producer["url"]
-                                if "rtsp" in url.lower():
-                                    streams[name] = url
-                                    print(f"[INFO] go2rtc stream: {name} -> {url[:50]}...")
-                return streams
-        except:
-            pass
 
-    print("[INFO] go2rtc not found or no streams configured")
+def find_go2rtc_streams() -> Dict[str, str]:
+    """Locate go2rtc and collect the RTSP producer of each stream."""
+    streams = {}
+
+    url, data = None, None
+    remembered = load_go2rtc_endpoint()
+    if remembered:
+        try:
+            url, data = remembered, CIRCUIT_BREAKERS.call(f"go2rtc {remembered}", fetch_go2rtc_streams, remembered)
+        except Exception as e:
+            METRICS.add("go2rtc", "errors")
+            print(f"[DEBUG] Remembered go2rtc endpoint {remembered} failed: {e}")
+
+    if data is None:
+        # The remembered endpoint was just tried: probing it again would count
+        # a second breaker failure for the same refresh
+        url, data = probe_go2rtc_endpoints([e for e in GO2RTC_ENDPOINTS if e != remembered])
+        # Keep the remembered endpoint when nothing answers (it may be restarting)
+        if url and url != remembered:
+            save_go2rtc_endpoint(url)
+
+    if data is None:
+        print("[INFO] go2rtc not found or no streams configured")
+        return streams
+
+    print(f"[INFO] Found go2rtc at {url}")
+    # go2rtc returns {stream_name: {producers: [{url: "rtsp://..."}]}}
+    for name, info in data.items():
+        if isinstance(info, dict):
+            producers = info.get("producers", [])
+            for producer in producers:
+                if isinstance(producer, dict) and "url" in producer:
+                    producer_url = producer["url"]
+                    if "rtsp" in producer_url.lower():
+                        streams[name] = producer_url
+                        print(f"[INFO] go2rtc stream: {name} -> {producer_url[:50]}...")
     return streams
 
 
@@ -90,14 +1063,11 @@ def get_go2rtc_streams() -> Dict[str, str]:
 # Method 2: UniFi Protect integration (reads from HA storage files)
 # =============================================================================
 
-def get_unifi_protect_config() -> Optional[Dict]:
-    """Get UniFi Protect NVR config from config entries (storage file or API)."""
-    from urllib.parse import quote
-
+def get_unifi_protect_configs() -> List[Dict]:
+    """Get every UniFi Protect NVR config from config entries (storage file or API)."""
     # Try reading from storage file first (more reliable - contains full data)
-    config_data = read_storage_file("core.config_entries")
-    if config_data:
-        entries = config_data.get("data", {}).get("entries", [])
+    entries = REGISTRY_CACHE.config_entries()
+    if entries is not None:
         print(f"[DEBUG] Read {len(entries)} config entries from storage")
     else:
         # Fall back to API
@@ -106,9 +1076,10 @@ def get_unifi_protect_config() -> Optional[Dict]:
 
     if not entries:
         print("[DEBUG] No config entries found")
-        return None
+        return []
 
     # Look for UniFi Protect
+    configs = []
     unifi_domains = ["unifiprotect", "unifi_protect", "ubiquiti_unifi_protect"]
     for entry in entries:
         domain = entry.get("domain", "")
@@ -118,29 +1089,34 @@ def get_unifi_protect_config() -> Optional[Dict]:
             host = data.get("host") or data.get("ip") or data.get("address")
             username = data.get("username", "")
             password = data.get("password", "")
-            # RTSP port is 7441 for secure, 7447 for insecure
+            # Default RTSPS port; replaced by nvr.ports.rtsps once the bootstrap is read
             port = 7441
             if host:
-                print(f"[INFO] Found UniFi Protect NVR: {host}:{port}")
+                print(f"[INFO] Found UniFi Protect NVR: {host}")
                 # URL-encode credentials (password may have special chars)
                 encoded_user = quote(username, safe='') if username else ""
                 encoded_pass = quote(password, safe='') if password else ""
-                return {
+                configs.append({
+                    "entry_id": entry.get("entry_id") or host,
+                    "title": entry.get("title") or host,
                     "host": host,
                     "port": port,
                     "username": encoded_user,
                     "password": encoded_pass
-                }
+                })
 
-    print("[DEBUG] No UniFi Protect config entry found")
-    return None
+    if not configs:
+        print("[DEBUG] No UniFi Protect config entry found")
+    return configs
 
 
-def get_unifi_camera_info_from_entities(stream_quality: str = "high") -> Dict[str, Dict]:
+def get_unifi_camera_info_from_entities(stream_quality: str = "high",
+                                        config_entry_id: Optional[str] = None) -> Dict[str, Dict]:
     """Get UniFi camera MAC addresses from entity registry, with device names from device registry.
 
     Args:
         stream_quality: "high" (channel 0), "medium" (channel 1), or "low" (channel 2)
+        config_entry_id: Only cameras of this UniFi Protect config entry (NVR)
     """
     cameras = {}
 
@@ -149,39 +1125,32 @@ def get_unifi_camera_info_from_entities(stream_quality: str = "high") -> Dict[st
     target_channel = quality_to_channel.get(stream_quality, "0")
     print(f"[INFO] Using stream quality: {stream_quality} (channel {target_channel})")
 
-    # Read device registry to get pretty names (name_by_user or name)
-    device_names = {}
-    device_data = read_storage_file("core.device_registry")
-    if device_data:
-        devices = device_data.get("data", {}).get("devices", [])
-        for dev in devices:
-            dev_id = dev.get("id")
-            # name_by_user is the user's custom alias, name is the original device name
-            name = dev.get("name_by_user") or dev.get("name")
-            if dev_id and name:
-                device_names[dev_id] = name
-        print(f"[DEBUG] Loaded {len(device_names)} device names")
+    # Device registry gives pretty names (name_by_user or name)
+    device_names = REGISTRY_CACHE.device_names()
+    print(f"[DEBUG] Loaded {len(device_names)} device names")
 
     # Read entity registry from storage
-    entity_data = read_storage_file("core.entity_registry")
-    if not entity_data:
+    entity_registry = REGISTRY_CACHE.entity_registry()
+    if not entity_registry:
         print("[DEBUG] Could not read entity registry")
         return cameras
 
-    entities = entity_data.get("data", {}).get("entities", [])
-    print(f"[DEBUG] Read {len(entities)} entities from registry")
+    print(f"[DEBUG] Read {entity_registry['count']} entities from registry")
+
+    # Only UniFi platforms can hold UniFi Protect cameras
+    entities = [ent for platform, platform_entities in entity_registry["by_platform"].items()
+                if "unifi" in platform.lower() for ent in platform_entities
+                if not config_entry_id or ent.get("config_entry_id") in (None, config_entry_id)]
 
     # Track which MACs we've already added (to avoid duplicates across quality levels)
     seen_macs = set()
 
     for ent in entities:
-        entity_id = ent.get("entity_id", "")
-        platform = ent.get("platform", "")
-        unique_id = ent.get("unique_id", "")
+        entity_id = ent["entity_id"]
+        unique_id = ent["unique_id"]
 
         # Look for UniFi Protect camera entities
         if (entity_id.startswith("camera.") and
-            "unifi" in platform.lower() and
             f"_{target_channel}" in unique_id and  # Match target quality channel
             "_insecure" not in unique_id):  # Skip insecure duplicates
 
@@ -215,118 +1184,491 @@ def get_unifi_camera_info_from_entities(stream_quality: str = "high") -> Dict[st
     return cameras
 
 
-def get_unifi_rtsp_urls(stream_quality: str = "high") -> Dict[str, str]:
-    """Get RTSP URLs from UniFi Protect API using rtspAlias."""
-    import ssl
-    import urllib.request
-    import http.cookiejar
-    from urllib.parse import unquote
+def get_device_names_by_mac() -> Dict[str, str]:
+    """Map device MAC addresses (upper-case, no colons) to HA device names."""
+    return REGISTRY_CACHE.device_names_by_mac()
 
-    urls = {}
-    quality_to_channel = {"high": 0, "medium": 1, "low": 2}
-    target_channel = quality_to_channel.get(stream_quality, 0)
 
-    nvr_config = get_unifi_protect_config()
-    if not nvr_config:
-        print("[INFO] UniFi Protect integration not found")
-        return urls
+# Bootstrap camera fields discovery uses (the rest of each record is dropped)
+PROTECT_CAMERA_FIELDS = ["id", "mac", "name", "channels"]
 
-    host = nvr_config["host"]
-    port = nvr_config["port"]
+
+# Daemon mode: follow the Protect updates WebSocket instead of re-downloading
+# the bootstrap, and call PROTECT_CHANGE_CALLBACK(reason) on camera changes
+PROTECT_TRACK_UPDATES = False
+PROTECT_CHANGE_CALLBACK: Optional[Callable[[str], None]] = None
+# Updates stream: ping after this long without a frame; no answer by the next
+# interval means the connection is dead (NVR reboot, half-open TCP)
+PROTECT_PING_INTERVAL = 30.0
+# Download the bootstrap again after this long, even while the stream is live
+PROTECT_BOOTSTRAP_MAX_AGE = 3600.0
+
+
+def project_protect_camera(cam: Dict) -> Dict:
+    """Keep only the camera fields discovery uses."""
+    return {field: cam[field] for field in PROTECT_CAMERA_FIELDS if field in cam}
+
+
+def read_protect_bootstrap(source) -> Dict:
+    """Stream a Protect bootstrap, keeping only the camera fields discovery uses and the NVR's ports."""
+    reader = JsonStreamReader(source)
+    bootstrap = {"cameras": [], "lastUpdateId": None, "nvr": {}}
+    for key in reader.iter_object():
+        if key == "cameras":
+            for cam in reader.iter_array():
+                bootstrap["cameras"].append(project_protect_camera(cam))
+        elif key == "lastUpdateId":
+            bootstrap["lastUpdateId"] = reader.read_value()
+        elif key == "nvr":
+            nvr = reader.read_value()
+            bootstrap["nvr"] = {field: nvr[field] for field in ("id", "name", "ports") if field in nvr}
+    bootstrap["bytes"] = reader.bytes_read
+    return bootstrap
+
+
+def read_until(chunks: Iterable[bytes], deadline: float) -> Iterator[bytes]:
+    """Pass chunks through until time.monotonic() passes deadline, then raise TimeoutError.
+
+    A request timeout only limits each socket read, so a server that keeps
+    trickling data would otherwise hold the download open indefinitely.
+    """
+    for chunk in chunks:
+        if time.monotonic() > deadline:
+            raise TimeoutError("download took too long")
+        yield chunk
+
+
+def decode_protect_packet(packet: bytes) -> Tuple[Dict, Any]:
+    """Decode a Protect updates WebSocket message into (action frame, data frame).
+
+    Each frame is an 8-byte header (packet type, payload format, deflated flag,
+    reserved, big-endian payload size) followed by the payload. Format 1 is
+    JSON, 2 is UTF-8 text, 3 is raw bytes.
+    """
+    frames = []
+    offset = 0
+    while offset + 8 <= len(packet) and len(frames) < 2:
+        _, payload_format, deflated, _, size = struct.unpack(">BBBBI", packet[offset:offset + 8])
+        payload = packet[offset + 8:offset + 8 + size]
+        offset += 8 + size
+        if deflated:
+            payload = zlib.decompress(payload)
+        if payload_format == 1:
+            frames.append(json.loads(payload))
+        elif payload_format == 2:
+            frames.append(payload.decode())
+        else:
+            frames.append(payload)
+    if len(frames) != 2 or not isinstance(frames[0], dict):
+        raise ValueError("malformed UniFi Protect update packet")
+    return frames[0], frames[1]
+
+
+class ProtectSessionExpired(Exception):
+    """The NVR rejected the session cookie (401/403)."""
+
+
+class ProtectClient:
+    """Authenticated UniFi Protect API session, reused until the NVR rejects it."""
+
+    def __init__(self, host: str, username: str, password: str):
+        self.host = host
+        self.username = username
+        self.password = password
+        self.logged_in = False
+
+        # Own pooled session per NVR: it holds the login cookie
+        self.session = make_http_session()
+        self.lock = threading.Lock()
+
+        # Camera state kept in sync by the updates stream (daemon mode)
+        self.state_lock = threading.Lock()
+        self.cameras: Dict[str, Dict] = {}
+        self.last_update_id = None
+        self.nvr: Dict = {}
+        self.live = False
+        self.bootstrap_time = 0.0
+
+    def login(self, timeout: Union[float, Tuple[float, float]] = 10):
+        """Authenticate and keep the session cookie."""
+        # Certificates aren't verified, like HA does (passed per request: REQUESTS_CA_BUNDLE
+        # would override a session-level setting)
+        response = self.session.post(f"https://{self.host}/api/auth/login", verify=False,
+                                     json={"username": self.username, "password": self.password}, timeout=timeout)
+        response.raise_for_status()
+        self.logged_in = True
+
+    def _get(self, path: str, handler: Callable, timeout: Union[float, Tuple[float, float]]):
+        with self.session.get(f"https://{self.host}{path}", timeout=timeout, stream=True, verify=False) as response:
+            if response.status_code in (401, 403):
+                raise ProtectSessionExpired(response.status_code)
+            response.raise_for_status()
+            return handler(response)
+
+    def get(self, path: str, handler: Callable, timeout: float = 30):
+        """GET a Protect API path and return handler(response).
+
+        Logs in first, or again if the session expired. Every request (logins
+        included) gets what is left of `timeout` as its read timeout, and a
+        share of it per connection attempt (HTTP_RETRIES retries).
+        """
+        deadline = time.monotonic() + timeout
+
+        def remaining(cap: float = timeout) -> Tuple[float, float]:
+            left = min(deadline - time.monotonic(), cap)
+            if left <= 0:
+                raise TimeoutError(f"no answer within {timeout:.0f}s")
+            return left / (HTTP_RETRIES + 1), left
+
+        with self.lock:
+            if not self.logged_in:
+                self.login(remaining(10))
+            try:
+                return self._get(path, handler, remaining())
+            except ProtectSessionExpired:
+                print("[DEBUG] UniFi Protect session expired, logging in again")
+                self.logged_in = False
+                self.login(remaining(10))
+                return self._get(path, handler, remaining())
+
+    def bootstrap(self, timeout: float = 30) -> Dict:
+        """Download the Protect bootstrap (contains all cameras), taking at most about `timeout` seconds."""
+        deadline = time.monotonic() + timeout
+        return self.get("/proxy/protect/api/bootstrap",
+                        lambda response: read_protect_bootstrap(read_until(response.iter_content(65536), deadline)),
+                        timeout)
+
+    def current_bootstrap(self, timeout: float = 30) -> Dict:
+        """Current camera state.
+
+        While the updates stream is connected this is served from memory
+        without touching the NVR (for up to PROTECT_BOOTSTRAP_MAX_AGE);
+        otherwise the bootstrap is downloaded and, in daemon mode, the stream
+        is (re)started from its lastUpdateId.
+        """
+        with self.state_lock:
+            if self.live and time.monotonic() - self.bootstrap_time < PROTECT_BOOTSTRAP_MAX_AGE:
+                return {"cameras": list(self.cameras.values()), "lastUpdateId": self.last_update_id,
+                        "nvr": self.nvr}
+
+        bootstrap = self.bootstrap(timeout)
+        with self.state_lock:
+            self.cameras = {cam.get("id"): cam for cam in bootstrap["cameras"]}
+            self.last_update_id = bootstrap.get("lastUpdateId")
+            self.nvr = bootstrap.get("nvr", {})
+            self.bootstrap_time = time.monotonic()
+        if PROTECT_TRACK_UPDATES and self.last_update_id:
+            self.start_updates()
+        return bootstrap
+
+    def apply_update(self, action: Dict, data: Any) -> Optional[str]:
+        """Apply one update to the camera state; returns a description if discovery-relevant."""
+        with self.state_lock:
+            if action.get("newUpdateId"):
+                self.last_update_id = action["newUpdateId"]
+            if action.get("modelKey") != "camera" or not isinstance(data, dict):
+                return None
+
+            cam_id = action.get("id")
+            kind = action.get("action")
+            if kind == "add":
+                cam = project_protect_camera(data)
+                self.cameras[cam_id] = cam
+                return f"camera {cam.get('name', cam_id)} added"
+            if kind == "remove":
+                cam = self.cameras.pop(cam_id, None)
+                return f"camera {cam.get('name', cam_id)} removed" if cam else None
+            cam = self.cameras.get(cam_id)
+            if cam is None:
+                return None
+            # Most updates are stats or motion; only name/mac/channel changes matter
+            changed = [field for field, value in project_protect_camera(data).items() if cam.get(field) != value]
+            if not changed:
+                return None
+            cam.update(project_protect_camera(data))
+            return f"camera {cam.get('name', cam_id)} {', '.join(changed)} changed"
+
+    def start_updates(self):
+        """Follow the updates WebSocket in a background thread."""
+        try:
+            import websocket  # noqa: F401
+        except ImportError:
+            return
+        with self.state_lock:
+            if self.live:
+                return
+            self.live = True
+        threading.Thread(target=self._follow_updates, name=f"protect-{self.host}", daemon=True).start()
+
+    def _follow_updates(self):
+        import websocket
+
+        ws = None
+        try:
+            cookie = "; ".join(f"{c.name}={c.value}" for c in self.session.cookies)
+            url = f"wss://{self.host}/proxy/protect/ws/updates?lastUpdateId={self.last_update_id}"
+            ws = websocket.create_connection(
+                url, header=[f"Cookie: {cookie}"], timeout=30,
+                sslopt={"cert_reqs": ssl.CERT_NONE, "check_hostname": False})
+            print(f"[INFO] Following UniFi Protect updates from {self.host}")
+            ws.settimeout(PROTECT_PING_INTERVAL)
+            pinged = False
+            while True:
+                try:
+                    opcode, packet = ws.recv_data(control_frame=True)
+                except websocket.WebSocketTimeoutException:
+                    if pinged:
+                        raise ConnectionError(f"no answer to ping within {PROTECT_PING_INTERVAL:.0f}s")
+                    ws.ping()
+                    pinged = True
+                    continue
+                pinged = False
+                if opcode == websocket.ABNF.OPCODE_CLOSE:
+                    raise ConnectionError("connection closed")
+                if opcode != websocket.ABNF.OPCODE_BINARY:
+                    continue
+                reason = self.apply_update(*decode_protect_packet(packet))
+                if reason:
+                    print(f"[DEBUG] UniFi Protect: {reason}")
+                    if PROTECT_CHANGE_CALLBACK:
+                        PROTECT_CHANGE_CALLBACK(f"UniFi Protect: {reason}")
+        except Exception as e:
+            print(f"[WARN] UniFi Protect updates from {self.host} stopped: {e}")
+        finally:
+            # Next refresh downloads a fresh bootstrap and reconnects
+            with self.state_lock:
+                self.live = False
+            if ws:
+                ws.close()
+
+
+# ProtectClient per (host, username, password), kept for the process lifetime
+_protect_clients: Dict[Tuple[str, str, str], ProtectClient] = {}
+_protect_clients_lock = threading.Lock()
+
+
+def get_protect_client(nvr_config: Dict) -> ProtectClient:
+    """Return the shared ProtectClient for an NVR config, creating it on first use."""
     username = unquote(nvr_config["username"])  # Decode for API auth
     password = unquote(nvr_config["password"])
+    key = (nvr_config["host"], username, password)
+    with _protect_clients_lock:
+        client = _protect_clients.get(key)
+        if client is None:
+            client = ProtectClient(nvr_config["host"], username, password)
+            _protect_clients[key] = client
+        return client
 
-    print(f"[INFO] Querying UniFi Protect API for camera streams (quality: {stream_quality})...")
-
-    # Get device names from HA device registry
-    device_names = {}
-    device_data = read_storage_file("core.device_registry")
-    if device_data:
-        for dev in device_data.get("data", {}).get("devices", []):
-            # Map MAC to device name
-            for conn in dev.get("connections", []):
-                if isinstance(conn, list) and len(conn) >= 2 and conn[0] == "mac":
-                    mac = conn[1].upper().replace(":", "")
-                    name = dev.get("name_by_user") or dev.get("name")
-                    if mac and name:
-                        device_names[mac] = name
 
-    try:
-        # SSL context (ignore cert verification like HA does)
-        ctx = ssl.create_default_context()
-        ctx.check_hostname = False
-        ctx.verify_mode = ssl.CERT_NONE
-
-        cj = http.cookiejar.CookieJar()
-        opener = urllib.request.build_opener(
-            urllib.request.HTTPSHandler(context=ctx),
-            urllib.request.HTTPCookieProcessor(cj)
-        )
-
-        # Authenticate
-        auth_url = f"https://{host}/api/auth/login"
-        auth_data = json.dumps({"username": username, "password": password}).encode()
-        req = urllib.request.Request(auth_url, data=auth_data, method='POST')
-        req.add_header('Content-Type', 'application/json')
-        opener.open(req, timeout=10)
-
-        # Get bootstrap (contains all cameras)
-        bootstrap_url = f"https://{host}/proxy/protect/api/bootstrap"
-        req = urllib.request.Request(bootstrap_url)
-        with opener.open(req, timeout=30) as resp:
-            bootstrap = json.loads(resp.read())
+def fetch_unifi_bootstrap(nvr_config: Dict, timeout: float = 30) -> Dict:
+    """Current UniFi Protect camera state over the shared session (raises on failure)."""
+    return get_protect_client(nvr_config).current_bootstrap(timeout)
 
-        cameras = bootstrap.get("cameras", [])
-        print(f"[INFO] Found {len(cameras)} cameras in UniFi Protect")
 
+def build_unifi_rtsp_urls(nvr_bootstraps: List[Tuple[Dict, Dict]], device_names: Dict[str, str],
+                          stream_quality: str = "high",
+                          channel_selector: Optional["ChannelSelector"] = None,
+                          entity_ids_by_mac: Optional[Dict[str, List[str]]] = None) -> Dict[str, Dict]:
+    """Build RTSP URLs from each NVR's Protect bootstrap using each camera's rtspAlias.
+
+    Args:
+        nvr_bootstraps: (nvr_config, bootstrap) per NVR, in config entry order
+        entity_ids_by_mac: Camera MAC -> its HA camera entity_ids (registry index), so
+                           camera_priorities match real entity_ids; cameras without
+                           one are matched on the entity_id their name would give
+    """
+    urls = {}
+    taken = set()
+    selector = channel_selector or ChannelSelector(stream_quality)
+
+    # Channels are chosen across all NVRs at once, so the bandwidth budget is shared
+    entries = []
+    for nvr_config, bootstrap in nvr_bootstraps:
+        cameras = bootstrap.get("cameras", [])
+        print(f"[INFO] Found {len(cameras)} cameras in UniFi Protect ({nvr_config['title']})")
         for cam in cameras:
             cam_id = cam.get("id", "")
             mac = cam.get("mac", "").upper()
             cam_name = device_names.get(mac) or cam.get("name", cam_id)
+            entity_ids = (entity_ids_by_mac or {}).get(mac) or [f"camera.{cam_name.lower().replace(' ', '_')}"]
+            entries.append((f"{nvr_config['entry_id']}/{cam_id}", cam_name, mac, entity_ids,
+                            cam.get("channels", []), nvr_config, bootstrap))
+
+    plan = selector.select([(key, entity_ids, name, channels)
+                            for key, name, _, entity_ids, channels, _, _ in entries])
+
+    for plan_key, cam_name, mac, entity_ids, _, nvr_config, bootstrap in entries:
+        channel = plan.get(plan_key)
+        rtsp_alias = channel.get("rtspAlias") if channel else None
+        host = nvr_config["host"]
+        port = bootstrap.get("nvr", {}).get("ports", {}).get("rtsps") or nvr_config["port"]
+
+        if rtsp_alias:
+            # RTSP URL format: rtsps://host:7441/rtspAlias
+            # Auth is handled via the rtspAlias token, no user/pass needed in URL
+            rtsp_url = f"rtsps://{host}:{port}/{rtsp_alias}"
+            add_unifi_camera(urls, cam_name, {"url": rtsp_url, "mac": mac}, nvr_config, taken)
+            print(f"[INFO] UniFi RTSP: {cam_name} -> rtsps://{host}:{port}/{rtsp_alias} "
+                  f"({channel.get('name', channel.get('id'))}, {selector.channel_kbps(channel) / 1000:.1f} Mbps)")
+        else:
+            print(f"[WARN] No rtspAlias for {cam_name} channel {selector.wanted_channel(entity_ids, cam_name)}")
 
-            # Get rtspAlias for the target channel
-            channels = cam.get("channels", [])
-            rtsp_alias = None
-            for ch in channels:
-                if ch.get("id") == target_channel:
-                    rtsp_alias = ch.get("rtspAlias")
-                    break
+    return urls
 
-            if rtsp_alias:
-                # RTSP URL format: rtsps://host:7441/rtspAlias
-                # Auth is handled via the rtspAlias token, no user/pass needed in URL
-                rtsp_url = f"rtsps://{host}:{port}/{rtsp_alias}"
-                urls[f"camera.{cam_name.lower().replace(' ', '_')}"] = {
-                    "name": cam_name,
-                    "url": rtsp_url
-                }
-                print(f"[INFO] UniFi RTSP: {cam_name} -> rtsps://{host}:{port}/{rtsp_alias}")
-            else:
-                print(f"[WARN] No rtspAlias for {cam_name} channel {target_channel}")
 
-    except Exception as e:
-        print(f"[ERROR] Failed to query UniFi Protect API: {e}")
-        # Fall back to MAC-based URLs
-        print("[INFO] Falling back to MAC-based RTSP URLs...")
-        return get_unifi_rtsp_urls_fallback(stream_quality)
+def unifi_camera_key(name: str) -> str:
+    """Key for a UniFi camera with no entity_id: camera.<name slug>."""
+    return "camera." + re.sub(r"[^a-z0-9]+", "_", name.lower()).strip("_")
+
+
+def add_unifi_camera(urls: Dict[str, Dict], name: str, camera: Dict, nvr_config: Dict,
+                     taken: set, key: Optional[str] = None):
+    """Add a UniFi camera to the merged result, renaming it if the name or key is already taken.
+
+    The first NVR (in config entry order) keeps plain names; a camera whose
+    name, or the key it gives ("Front-Door" and "Front Door" are both
+    camera.front_door), is already used by another one becomes
+    "<name> (<NVR title>)".
+
+    Args:
+        taken: Lower-case names in urls; the caller keeps one set across calls
+        key: The camera's entity_id, if it has one
+    """
+    if name.lower() in taken or (key or unifi_camera_key(name)) in urls:
+        name = f"{name} ({nvr_config['title']})"
+        key = None
+    suffix = 2
+    unique = name
+    while unique.lower() in taken or (key or unifi_camera_key(unique)) in urls:
+        unique = f"{name} {suffix}"
+        suffix += 1
+    taken.add(unique.lower())
+    urls[key or unifi_camera_key(unique)] = {"name": unique, **camera, "nvr": nvr_config["title"]}
+
+
+# Seconds each NVR gets to answer (login and bootstrap download); slower ones are
+# served from their last bootstrap
+PROTECT_NVR_BUDGET = 20.0
+
+# entry_id -> last bootstrap successfully read from that NVR
+_last_nvr_bootstraps: Dict[str, Dict] = {}
+
+
+def is_timeout(error: BaseException) -> bool:
+    """Whether a request failed by running out of time.
+
+    With connection retries set, requests reports a read timeout as a
+    ConnectionError wrapping urllib3's MaxRetryError.
+    """
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(error, (TimeoutError, requests.Timeout)) or isinstance(reason, urllib3.exceptions.TimeoutError)
+
+
+def fetch_nvr_bootstraps(nvr_configs: List[Dict],
+                         budget: float = PROTECT_NVR_BUDGET) -> Tuple[List[Tuple[Dict, Dict]], List[Dict]]:
+    """
+    Fetch every NVR's bootstrap concurrently, each within `budget` seconds.
+
+    The budget is every request's timeout (login, bootstrap headers and
+    download), so no request outlives the call. An NVR that fails or runs out
+    of time is served from its last bootstrap if there is one.
+
+    Returns:
+        ([(nvr_config, bootstrap)], [nvr_configs with no bootstrap at all])
+    """
+    def fetch(nvr_config):
+        phase = f"protect:{nvr_config['title']}"
+        with METRICS.phase(phase):
+            bootstrap = CIRCUIT_BREAKERS.call(f"UniFi Protect {nvr_config['host']}", fetch_unifi_bootstrap,
+                                              nvr_config, budget)
+        # No bytes when served from the updates stream
+        METRICS.add(phase, "bytes", bootstrap.get("bytes", 0))
+        METRICS.add(phase, "records", len(bootstrap.get("cameras", [])))
+        _last_nvr_bootstraps[nvr_config["entry_id"]] = bootstrap
+        return bootstrap
+
+    with ThreadPoolExecutor(max_workers=len(nvr_configs), thread_name_prefix="protect-nvr") as pool:
+        futures = {pool.submit(fetch, nvr_config): nvr_config for nvr_config in nvr_configs}
+
+    bootstraps = []
+    missing = []
+    for future, nvr_config in futures.items():
+        error = future.exception()
+        if error is None:
+            bootstraps.append((nvr_config, future.result()))
+            continue
+        if isinstance(error, SourceSkipped):
+            print(f"[INFO] {error}")
+        elif is_timeout(error):
+            METRICS.count("protect_nvr_timeouts")
+            print(f"[WARN] UniFi Protect ({nvr_config['title']}) did not answer within {budget:.0f}s")
+        else:
+            print(f"[ERROR] Failed to query UniFi Protect API ({nvr_config['title']}): {error}")
+        last = _last_nvr_bootstraps.get(nvr_config["entry_id"])
+        if last is not None:
+            print(f"[INFO] Using last known cameras for {nvr_config['title']}")
+            bootstraps.append((nvr_config, last))
+        else:
+            missing.append(nvr_config)
+    return bootstraps, missing
+
+
+def get_unifi_rtsp_urls(stream_quality: str = "high", executor: Optional[Executor] = None,
+                        channel_selector: Optional["ChannelSelector"] = None) -> Dict[str, Dict]:
+    """Get RTSP URLs from every UniFi Protect NVR using rtspAlias.
+
+    Args:
+        stream_quality: "high", "medium", "low" or "auto"
+        executor: If given, the registries are read on it while the NVRs are queried
+        channel_selector: Per-camera channel choice (overrides, bandwidth budget)
+    """
+    nvr_configs = get_unifi_protect_configs()
+    if not nvr_configs:
+        print("[INFO] UniFi Protect integration not found")
+        return {}
 
+    print(f"[INFO] Querying {len(nvr_configs)} UniFi Protect NVR(s) for camera streams (quality: {stream_quality})...")
+
+    # Device names from the HA device registry, entity_ids from the entity registry
+    if executor:
+        device_names_future = executor.submit(get_device_names_by_mac)
+        entity_ids_future = executor.submit(REGISTRY_CACHE.camera_entities_by_mac)
+    else:
+        device_names = get_device_names_by_mac()
+        entity_ids_by_mac = REGISTRY_CACHE.camera_entities_by_mac()
+
+    bootstraps, missing = fetch_nvr_bootstraps(nvr_configs)
+    if executor:
+        device_names = device_names_future.result()
+        entity_ids_by_mac = entity_ids_future.result()
+    urls = build_unifi_rtsp_urls(bootstraps, device_names, stream_quality, channel_selector, entity_ids_by_mac)
+
+    taken = {camera["name"].lower() for camera in urls.values()}
+    for nvr_config in missing:
+        # Fall back to MAC-based URLs
+        print(f"[INFO] Falling back to MAC-based RTSP URLs for {nvr_config['title']}...")
+        for entity_id, camera in get_unifi_rtsp_urls_fallback(stream_quality, nvr_config).items():
+            add_unifi_camera(urls, camera.pop("name"), camera, nvr_config, taken, entity_id)
     return urls
 
 
-def get_unifi_rtsp_urls_fallback(stream_quality: str = "high") -> Dict[str, str]:
+def get_unifi_rtsp_urls_fallback(stream_quality: str = "high",
+                                 nvr_config: Optional[Dict] = None) -> Dict[str, Dict]:
     """Fallback: Construct RTSP URLs using MAC addresses (may not work on all setups)."""
     urls = {}
 
-    nvr_config = get_unifi_protect_config()
-    if not nvr_config:
-        return urls
+    if nvr_config is None:
+        nvr_configs = get_unifi_protect_configs()
+        if not nvr_configs:
+            return urls
+        nvr_config = nvr_configs[0]
 
     host = nvr_config["host"]
     port = nvr_config["port"]
     username = nvr_config["username"]
     password = nvr_config["password"]
 
-    cameras = get_unifi_camera_info_from_entities(stream_quality)
+    cameras = get_unifi_camera_info_from_entities(stream_quality, nvr_config.get("entry_id"))
 
     for entity_id, cam_info in cameras.items():
         mac = cam_info["mac"]
@@ -338,7 +1680,7 @@ def get_unifi_rtsp_urls_fallback(stream_quality: str = "high") -> Dict[str, str]
         else:
             rtsp_url = f"rtsps://{host}:{port}/{mac}?channel={channel}"
 
-        urls[entity_id] = {"name": name, "url": rtsp_url}
+        urls[entity_id] = {"name": name, "url": rtsp_url, "mac": mac}
 
     return urls
 
@@ -347,25 +1689,129 @@ def get_unifi_rtsp_urls_fallback(stream_quality: str = "high") -> Dict[str, str]
 # Method 3: Camera entity attributes
 # =============================================================================
 
-def get_camera_entities() -> List[Dict]:
-    """Get all camera entities from HA."""
-    states = api_get("/api/states", timeout=30)
-    if not states:
-        return []
+# Camera attributes that may hold an RTSP URL
+STREAM_URL_ATTRIBUTES = ["stream_source", "rtsp_url", "video_url", "stream_url", "rtsp_stream"]
+
+# Rendered by HA itself: only camera.* states, with only the attributes discovery reads
+CAMERA_STATES_TEMPLATE = """
+{%- set keys = KEYS -%}
+[{%- for s in states.camera -%}
+{{ "," if not loop.first }}{"entity_id": {{ s.entity_id | tojson }}, "state": {{ s.state | tojson }},
+"attributes": { {%- for k in keys if s.attributes[k] is defined -%}
+{{ "," if not loop.first }}{{ k | tojson }}: {{ s.attributes[k] | tojson }}
+{%- endfor -%} }}
+{%- endfor -%}]
+""".replace("KEYS", json.dumps(["friendly_name"] + STREAM_URL_ATTRIBUTES))
+
+# Per-entity /api/states/<id> requests in flight at once
+STATE_FETCH_CONCURRENCY = 16
+# Seconds the camera list of a complete read (template or full dump) vouches for the registry
+CAMERA_LIST_MAX_AGE = 3600.0
+
+# Camera entity_ids from the last complete read of the camera states, and when it was made
+_complete_camera_list: Dict[str, Any] = {}
+
+
+def get_camera_states_via_template() -> List[Dict]:
+    """Camera states rendered server-side by POST /api/template (raises on errors)."""
+    response = HTTP_SESSION.post(f"{HA_URL}/api/template", headers=ha_headers(),
+                                 json={"template": CAMERA_STATES_TEMPLATE}, timeout=15)
+    METRICS.add("ha_states", "bytes", len(response.content))
+    if response.status_code != 200:
+        raise ValueError(f"HTTP {response.status_code}")
+    return json.loads(response.text)
+
+
+def get_camera_states_by_id() -> Optional[List[Dict]]:
+    """Camera states fetched one by one for the camera entity_ids in the entity registry.
+
+    Cameras without a unique_id (YAML) are not in the registry, so this is only
+    used while a complete read from the last CAMERA_LIST_MAX_AGE seconds found
+    no camera outside it. Returns None otherwise, when the registry lists no
+    cameras, or when none of them has a state.
+    """
+    entity_ids = REGISTRY_CACHE.camera_entity_ids()
+    if not entity_ids:
+        return None
+    if not _complete_camera_list or time.monotonic() - _complete_camera_list["time"] > CAMERA_LIST_MAX_AGE:
+        print("[DEBUG] No recent complete camera list to check the entity registry against")
+        return None
+    unregistered = _complete_camera_list["entity_ids"] - set(entity_ids)
+    if unregistered:
+        print(f"[DEBUG] {len(unregistered)} cameras are not in the entity registry (YAML)")
+        return None
+
+    def fetch(entity_id: str) -> Optional[Dict]:
+        response = HTTP_SESSION.get(f"{HA_URL}/api/states/{entity_id}", headers=ha_headers(), timeout=10)
+        METRICS.add("ha_states", "bytes", len(response.content))
+        if response.status_code == 404:
+            return None  # Registered but has no state (disabled)
+        if response.status_code != 200:
+            raise ValueError(f"HTTP {response.status_code} for {entity_id}")
+        return response.json()
 
+    with ThreadPoolExecutor(max_workers=min(STATE_FETCH_CONCURRENCY, len(entity_ids)),
+                            thread_name_prefix="ha-state") as executor:
+        states = [state for state in executor.map(fetch, entity_ids) if state]
+    return states or None
+
+
+def get_camera_states_from_dump() -> List[Dict]:
+    """Every state from /api/states, streamed, keeping only camera.* states."""
     cameras = []
-    for state in states:
+    for state in count_records(api_stream("/api/states", timeout=30, phase="ha_states"), "ha_states"):
         entity_id = state.get("entity_id", "")
         if entity_id.startswith("camera."):
             cameras.append(state)
     return cameras
 
+
+def get_camera_entities() -> List[Dict]:
+    """Get all camera entities from HA.
+
+    Only camera states are requested: HA renders them itself (template), or
+    they are fetched by entity_id from the entity registry. The full
+    /api/states dump, every entity in the house, is the last resort; it is
+    streamed so memory doesn't grow with it.
+
+    Moving on to the next method is expected (old HA versions, YAML cameras)
+    and counted as ha_states_fallback; only all of them failing is an error.
+    The template and the full dump list every camera; their camera list is
+    remembered to tell whether the registry alone covers them all.
+    """
+    methods = [("template", get_camera_states_via_template),
+               ("registry", get_camera_states_by_id),
+               ("full dump", get_camera_states_from_dump)]
+    for method, fetch in methods:
+        with METRICS.phase("ha_states"):
+            try:
+                cameras = fetch()
+            except Exception as e:
+                print(f"[DEBUG] Camera states via {method} failed: {e}")
+                cameras = None
+        if cameras is None:
+            if method != methods[-1][0]:
+                METRICS.count("ha_states_fallback")
+            continue
+        if method != "registry":
+            _complete_camera_list.update(time=time.monotonic(),
+                                         entity_ids={state.get("entity_id") for state in cameras})
+        if method != "full dump":
+            METRICS.add("ha_states", "records", len(cameras))
+        METRICS.count(f"ha_states_via_{method.replace(' ', '_')}")
+        print(f"[DEBUG] Read {len(cameras)} camera states via {method}")
+        return cameras
+    METRICS.add("ha_states", "errors")
+    print("[WARN] Could not read camera states from HA")
+    return []
+
+
 def get_stream_url_from_attributes(state: Dict) -> Optional[str]:
     """Try to get RTSP URL from camera entity attributes."""
     attrs = state.get("attributes", {})
 
     # Check common attribute names
-    for attr in ["stream_source", "rtsp_url", "video_url", "stream_url", "rtsp_stream"]:
+    for attr in STREAM_URL_ATTRIBUTES:
         if attr in attrs and attrs[attr]:
             url = attrs[attr]
             if isinstance(url, str) and "://" in url:
@@ -374,121 +1820,1369 @@ def get_stream_url_from_attributes(state: Dict) -> Optional[str]:
     return None
 
 
+# =============================================================================
+# Method 4: ONVIF devices
+# =============================================================================
+
+# WS-Discovery multicast group; ONVIF cameras answer a Probe with ProbeMatches
+WS_DISCOVERY_ADDRESS = ("239.255.255.250", 3702)
+# Seconds spent collecting ProbeMatches
+WS_DISCOVERY_TIMEOUT = 2.0
+# Seconds discovery waits for all devices; slower ones are served from the cache
+ONVIF_BUDGET = 10.0
+# Deadline for one SOAP request
+ONVIF_TIMEOUT = 3.0
+# Devices resolved at once
+ONVIF_CONCURRENCY = 16
+
+# Resolved devices, reused while the device's address, WS-Discovery metadata
+# version, credentials and stream_quality are unchanged (and for ONVIF_CACHE_MAX_AGE)
+ONVIF_CACHE_FILE = "/data/onvif_cache.json"
+ONVIF_CACHE_MAX_AGE = 6 * 3600
+
+SOAP_ENVELOPE_NS = "http://www.w3.org/2003/05/soap-envelope"
+WSSE_NS = "http://docs.oasis-open.org/wss/2004/01/oasis-200401-wss-wssecurity-secext-1.0.xsd"
+WSU_NS = "http://docs.oasis-open.org/wss/2004/01/oasis-200401-wss-wssecurity-utility-1.0.xsd"
+WSSE_PROFILE = "http://docs.oasis-open.org/wss/2004/01/oasis-200401-wss-username-token-profile-1.0"
+
+WS_DISCOVERY_PROBE = """<?xml version="1.0" encoding="UTF-8"?>
+<s:Envelope xmlns:s="http://www.w3.org/2003/05/soap-envelope"
+    xmlns:a="http://schemas.xmlsoap.org/ws/2004/08/addressing"
+    xmlns:d="http://schemas.xmlsoap.org/ws/2005/04/discovery"
+    xmlns:dn="http://www.onvif.org/ver10/network/wsdl">
+  <s:Header>
+    <a:Action s:mustUnderstand="1">http://schemas.xmlsoap.org/ws/2005/04/discovery/Probe</a:Action>
+    <a:MessageID>uuid:{message_id}</a:MessageID>
+    <a:ReplyTo><a:Address>http://schemas.xmlsoap.org/ws/2004/08/addressing/role/anonymous</a:Address></a:ReplyTo>
+    <a:To s:mustUnderstand="1">urn:schemas-xmlsoap-org:ws:2005:04:discovery</a:To>
+  </s:Header>
+  <s:Body><d:Probe><d:Types>dn:NetworkVideoTransmitter</d:Types></d:Probe></s:Body>
+</s:Envelope>"""
+
+ONVIF_NAME_SCOPE = "onvif://www.onvif.org/name/"
+
+
+def xml_text(element: Optional[ET.Element], path: str) -> Optional[str]:
+    """Stripped text of the first element at path (namespace-agnostic, e.g. ".//{*}Uri")."""
+    if element is None:
+        return None
+    found = element.find(path)
+    if found is None or found.text is None:
+        return None
+    return found.text.strip()
+
+
+def parse_probe_matches(data: bytes) -> List[Dict]:
+    """Devices in a WS-Discovery ProbeMatches message.
+
+    Returns:
+        [{"endpoint": EndpointReference address, "xaddr": device service URL,
+          "version": MetadataVersion, "name": from the onvif name scope}]
+    """
+    root = ET.fromstring(data)
+    devices = []
+    for match in root.findall(".//{*}ProbeMatch"):
+        xaddrs = (xml_text(match, "{*}XAddrs") or "").split()
+        # Prefer an IPv4 address over IPv6 and link-local ones
+        xaddrs.sort(key=lambda url: (not re.match(r"https?://\d+\.\d+\.\d+\.\d+", url), url))
+        if not xaddrs:
+            continue
+        name = None
+        for scope in (xml_text(match, "{*}Scopes") or "").split():
+            if scope.startswith(ONVIF_NAME_SCOPE):
+                name = unquote(scope[len(ONVIF_NAME_SCOPE):]).replace("_", " ")
+        devices.append({
+            "endpoint": xml_text(match, "{*}EndpointReference/{*}Address") or xaddrs[0],
+            "xaddr": xaddrs[0],
+            "version": xml_text(match, "{*}MetadataVersion"),
+            "name": name,
+        })
+    return devices
+
+
+def ws_discover(timeout: Optional[float] = None, address: Optional[Tuple[str, int]] = None) -> List[Dict]:
+    """Send a WS-Discovery Probe for NetworkVideoTransmitters and collect the answers.
+
+    Args:
+        timeout: Seconds to collect answers (default WS_DISCOVERY_TIMEOUT)
+        address: Where the Probe is sent (default WS_DISCOVERY_ADDRESS, the multicast group)
+
+    Returns:
+        Devices (see parse_probe_matches), one per endpoint
+    """
+    timeout = timeout or WS_DISCOVERY_TIMEOUT
+    address = address or WS_DISCOVERY_ADDRESS
+    devices = {}
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    try:
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 2)
+        # Every camera answers at once; don't drop answers on a busy network
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        sock.sendto(WS_DISCOVERY_PROBE.format(message_id=uuid.uuid4()).encode(), address)
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            sock.settimeout(remaining)
+            try:
+                data, _ = sock.recvfrom(65536)
+            except socket.timeout:
+                break
+            try:
+                for device in parse_probe_matches(data):
+                    devices.setdefault(device["endpoint"], device)
+            except ET.ParseError as e:
+                print(f"[DEBUG] Ignoring malformed WS-Discovery answer: {e}")
+    except OSError as e:
+        print(f"[WARN] WS-Discovery failed: {e}")
+    finally:
+        sock.close()
+    return list(devices.values())
+
+
+def onvif_security_header(username: str, password: str) -> str:
+    """WS-Security UsernameToken with a password digest: base64(sha1(nonce + created + password))."""
+    nonce = os.urandom(16)
+    created = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    digest = base64.b64encode(hashlib.sha1(nonce + created.encode() + password.encode()).digest()).decode()
+    return (f'<wsse:Security s:mustUnderstand="1" xmlns:wsse="{WSSE_NS}" xmlns:wsu="{WSU_NS}">'
+            f'<wsse:UsernameToken><wsse:Username>{xml_escape(username)}</wsse:Username>'
+            f'<wsse:Password Type="{WSSE_PROFILE}#PasswordDigest">{digest}</wsse:Password>'
+            f'<wsse:Nonce EncodingType="http://docs.oasis-open.org/wss/2004/01/'
+            f'oasis-200401-wss-soap-message-security-1.0#Base64Binary">{base64.b64encode(nonce).decode()}</wsse:Nonce>'
+            f'<wsu:Created>{created}</wsu:Created></wsse:UsernameToken></wsse:Security>')
+
+
+def onvif_request(url: str, body: str, username: str = "", password: str = "",
+                  timeout: float = ONVIF_TIMEOUT) -> ET.Element:
+    """POST one SOAP request to an ONVIF service and return the parsed response (raises on faults)."""
+    header = onvif_security_header(username, password) if username else ""
+    envelope = (f'<?xml version="1.0" encoding="UTF-8"?>'
+                f'<s:Envelope xmlns:s="{SOAP_ENVELOPE_NS}" xmlns:tds="http://www.onvif.org/ver10/device/wsdl" '
+                f'xmlns:trt="http://www.onvif.org/ver10/media/wsdl" xmlns:tt="http://www.onvif.org/ver10/schema">'
+                f'<s:Header>{header}</s:Header><s:Body>{body}</s:Body></s:Envelope>')
+    response = HTTP_SESSION.post(url, data=envelope.encode(), timeout=timeout,
+                                 headers={"Content-Type": "application/soap+xml; charset=utf-8"})
+    METRICS.add("onvif", "bytes", len(response.content))
+    try:
+        root = ET.fromstring(response.content)
+    except ET.ParseError:
+        raise ValueError(f"HTTP {response.status_code}, not a SOAP response")
+    fault = root.find(".//{*}Fault")
+    if fault is not None:
+        reason = xml_text(fault, ".//{*}Reason/{*}Text") or xml_text(fault, ".//{*}Value") or "unknown"
+        raise ValueError(f"SOAP fault: {reason}")
+    if response.status_code != 200:
+        raise ValueError(f"HTTP {response.status_code}")
+    return root
+
+
+def select_onvif_profile(profiles: List[Tuple[int, str]], stream_quality: str) -> str:
+    """Profile token for stream_quality from (pixels, token) pairs: high = largest, low = smallest."""
+    ordered = [token for _, token in sorted(profiles, key=lambda p: -p[0])]
+    if stream_quality == "low":
+        return ordered[-1]
+    if stream_quality == "medium":
+        return ordered[len(ordered) // 2]
+    return ordered[0]
+
+
+def resolve_onvif_device(device: Dict, stream_quality: str = "high", timeout: float = ONVIF_TIMEOUT) -> Dict:
+    """Ask a device for its media profiles and the RTSP URI of the one matching stream_quality.
+
+    Returns:
+        {"name", "url" (with the device credentials), "mac" (or None), "profile"}
+    """
+    xaddr, username, password = device["xaddr"], device.get("username", ""), device.get("password", "")
+
+    def call(url: str, body: str) -> ET.Element:
+        return onvif_request(url, body, username, password, timeout)
+
+    capabilities = call(xaddr, "<tds:GetCapabilities><tds:Category>Media</tds:Category></tds:GetCapabilities>")
+    media_xaddr = xml_text(capabilities, ".//{*}Media/{*}XAddr") or xaddr
+
+    profiles = []
+    for profile in call(media_xaddr, "<trt:GetProfiles/>").findall(".//{*}Profiles"):
+        resolution = profile.find(".//{*}VideoEncoderConfiguration/{*}Resolution")
+        width = int(xml_text(resolution, "{*}Width") or 0)
+        height = int(xml_text(resolution, "{*}Height") or 0)
+        if profile.get("token"):
+            profiles.append((width * height, profile.get("token")))
+    if not profiles:
+        raise ValueError("no media profiles")
+    token = select_onvif_profile(profiles, stream_quality)
+
+    uri = xml_text(call(media_xaddr,
+                        "<trt:GetStreamUri><trt:StreamSetup><tt:Stream>RTP-Unicast</tt:Stream>"
+                        "<tt:Transport><tt:Protocol>RTSP</tt:Protocol></tt:Transport></trt:StreamSetup>"
+                        f"<trt:ProfileToken>{xml_escape(token)}</trt:ProfileToken></trt:GetStreamUri>"),
+                   ".//{*}MediaUri/{*}Uri")
+    if not uri:
+        raise ValueError(f"no stream URI for profile {token}")
+    parts = urlsplit(uri)
+    if username and not parts.username:
+        # Monocle needs the credentials in the URL; ONVIF returns it without them
+        uri = urlunsplit(parts._replace(netloc=f"{quote(username, safe='')}:{quote(password, safe='')}@{parts.netloc}"))
+
+    mac = None
+    try:
+        hw_address = xml_text(call(xaddr, "<tds:GetNetworkInterfaces/>"), ".//{*}HwAddress")
+        if hw_address:
+            mac = re.sub(r"[^0-9A-Fa-f]", "", hw_address).upper() or None
+    except Exception as e:
+        print(f"[DEBUG] ONVIF {xaddr}: no MAC address ({e})")
+
+    name = device.get("name")
+    if not name:
+        for scope in call(xaddr, "<tds:GetScopes/>").findall(".//{*}ScopeItem"):
+            if (scope.text or "").strip().startswith(ONVIF_NAME_SCOPE):
+                name = unquote(scope.text.strip()[len(ONVIF_NAME_SCOPE):]).replace("_", " ")
+    return {"name": name or urlsplit(xaddr).hostname, "url": uri, "mac": mac, "profile": token}
+
+
+def parse_onvif_host(entry: str, username: str = "", password: str = "") -> Dict:
+    """Device for an onvif_hosts entry: "host", "host:port", "user:pass@host[:port]" or a device service URL."""
+    url = entry if "://" in entry else f"http://{entry}"
+    parts = urlsplit(url)
+    if parts.username:
+        username, password = unquote(parts.username), unquote(parts.password or "")
+    host = parts.hostname + (f":{parts.port}" if parts.port else "")
+    path = parts.path if parts.path not in ("", "/") else "/onvif/device_service"
+    xaddr = urlunsplit((parts.scheme, host, path, "", ""))
+    return {"endpoint": xaddr, "xaddr": xaddr, "version": None, "name": None,
+            "username": username, "password": password}
+
+
+def load_onvif_cache(path: Optional[str] = None) -> Dict[str, Dict]:
+    path = path or ONVIF_CACHE_FILE
+    try:
+        with open(path) as f:
+            cache = json.load(f)
+        return cache if isinstance(cache, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def save_onvif_cache(cache: Dict[str, Dict], path: Optional[str] = None):
+    path = path or ONVIF_CACHE_FILE
+    try:
+        # Stream URLs carry the device credentials
+        write_file_atomic(path, json.dumps(cache, indent=2, sort_keys=True), mode=0o600)
+    except OSError as e:
+        print(f"[DEBUG] Could not write {path}: {e}")
+
+
+def onvif_cache_key(device: Dict, stream_quality: str) -> Dict:
+    """What a cached result depends on; any difference means the device is resolved again."""
+    auth = f"{device.get('username', '')}:{device.get('password', '')}"
+    return {"xaddr": device["xaddr"], "version": device.get("version"), "quality": stream_quality,
+            "auth": hashlib.sha1(auth.encode()).hexdigest()}
+
+
+def get_onvif_cameras(stream_quality: str = "high", hosts: Iterable[str] = (), username: str = "",
+                      password: str = "", multicast: bool = True) -> Dict[str, Dict]:
+    """Find ONVIF cameras (WS-Discovery and onvif_hosts) and resolve their RTSP URLs.
+
+    Returns:
+        device endpoint -> {"name", "url", "mac", "profile"}
+    """
+    with METRICS.phase("onvif"):
+        cameras = find_onvif_cameras(stream_quality, hosts, username, password, multicast)
+    METRICS.add("onvif", "records", len(cameras))
+    return cameras
+
+
+def find_onvif_cameras(stream_quality: str, hosts: Iterable[str], username: str, password: str,
+                       multicast: bool, budget: float = ONVIF_BUDGET,
+                       discovery_address: Optional[Tuple[str, int]] = None) -> Dict[str, Dict]:
+    devices = {}
+    if multicast:
+        for device in ws_discover(address=discovery_address):
+            devices[device["endpoint"]] = {**device, "username": username, "password": password}
+        print(f"[INFO] WS-Discovery found {len(devices)} ONVIF devices")
+    by_host = {urlsplit(device["xaddr"]).hostname: device for device in devices.values()}
+    for entry in hosts or []:
+        device = parse_onvif_host(entry, username, password)
+        discovered = by_host.get(urlsplit(device["xaddr"]).hostname)
+        if discovered:
+            # Same camera found by WS-Discovery: keep its metadata, use the listed credentials
+            discovered.update(username=device["username"], password=device["password"])
+        else:
+            devices[device["endpoint"]] = device
+    METRICS.count("onvif_devices", len(devices))
+    if not devices:
+        return {}
+
+    cache = load_onvif_cache()
+    now = time.time()
+    cameras = {}
+    stale = {}
+    for endpoint, device in devices.items():
+        cached = cache.get(endpoint)
+        if (cached and cached.get("key") == onvif_cache_key(device, stream_quality)
+                and now - cached.get("time", 0) < ONVIF_CACHE_MAX_AGE):
+            cameras[endpoint] = cached["camera"]
+        else:
+            stale[endpoint] = device
+    METRICS.count("onvif_cache_hits", len(cameras))
+
+    if stale:
+        print(f"[INFO] Resolving {len(stale)} ONVIF devices ({len(cameras)} unchanged, from cache)...")
+        executor = ThreadPoolExecutor(max_workers=min(ONVIF_CONCURRENCY, len(stale)), thread_name_prefix="onvif")
+        futures = {executor.submit(CIRCUIT_BREAKERS.call, f"ONVIF {device['xaddr']}",
+                                   resolve_onvif_device, device, stream_quality): endpoint
+                   for endpoint, device in stale.items()}
+        done, not_done = wait(futures, timeout=budget)
+        # Unfinished requests end on their own timeout; don't start queued ones
+        executor.shutdown(wait=False, cancel_futures=True)
+
+        for future in futures:
+            endpoint = futures[future]
+            device = stale[endpoint]
+            try:
+                if future not in done:
+                    raise TimeoutError(f"not resolved within {budget:.0f}s")
+                camera = future.result()
+            except Exception as e:
+                METRICS.add("onvif", "errors")
+                cached = cache.get(endpoint)
+                if cached:
+                    print(f"[WARN] ONVIF {device['xaddr']}: {e} (using last known stream)")
+                    cameras[endpoint] = cached["camera"]
+                else:
+                    print(f"[WARN] ONVIF {device['xaddr']}: {e}")
+                continue
+            cameras[endpoint] = camera
+            cache[endpoint] = {"key": onvif_cache_key(device, stream_quality), "time": int(now), "camera": camera}
+            print(f"[INFO] ONVIF camera {camera['name']}: profile {camera['profile']}")
+
+    # Devices that didn't answer this time stay cached for a while (WS-Discovery is UDP)
+    save_onvif_cache({endpoint: entry for endpoint, entry in cache.items()
+                      if endpoint in devices or now - entry.get("time", 0) < ONVIF_CACHE_MAX_AGE})
+    return cameras
+
+
+# =============================================================================
+# Camera name matching
+# =============================================================================
+
+_NAME_SEPARATORS = re.compile(r"[^a-z0-9]+")
+
+# Words that describe the stream rather than which camera it is
+MATCH_STOPWORDS = {"camera", "cam", "high", "medium", "low", "resolution", "channel", "insecure", "stream"}
+
+
+def name_tokens(name: str) -> Tuple[str, ...]:
+    """Normalize a camera name, entity_id or stream name into match tokens.
+
+    "camera.front_door_high", "Front Door" and "front-door" all give ("front", "door").
+    """
+    name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode().lower()
+    if name.startswith("camera."):
+        name = name[len("camera."):]
+    words = [w for w in _NAME_SEPARATORS.split(name) if w]
+    meaningful = [w for w in words if w not in MATCH_STOPWORDS]
+    return tuple(meaningful or words)
+
+
+class CameraMatcher:
+    """
+    Index of HA camera entities for matching go2rtc stream and UniFi camera names.
+
+    Each entity's friendly name and entity_id are normalized once and indexed
+    by compact name ("frontdoor"), by token and by MAC, so a lookup only
+    scores the few entities that share tokens with the query. Scores:
+
+        3.0  MAC match (UniFi cameras)
+        2.0  same normalized name or entity_id
+        0-1  token overlap (Jaccard), only when one name's tokens contain the other's
+
+    The best score wins and ties go to the lowest entity_id, so results don't
+    depend on the order entities or streams were seen ("Garage" picks
+    camera.garage over camera.garage_side).
+    """
+
+    def __init__(self, names: Dict[str, str], macs: Optional[Dict[str, List[str]]] = None):
+        """
+        Args:
+            names: entity_id -> display name
+            macs: MAC -> entity_ids, from the entity registry
+        """
+        self.by_compact: Dict[str, set] = {}
+        self.by_token: Dict[str, List[int]] = {}
+        self.by_anchor: Dict[str, List[int]] = {}
+        self.variants: List[Tuple[str, frozenset]] = []  # (entity_id, tokens)
+
+        for entity_id, name in names.items():
+            for variant in {name_tokens(name), name_tokens(entity_id)}:
+                if not variant:
+                    continue
+                self.by_compact.setdefault("".join(variant), set()).add(entity_id)
+                index = len(self.variants)
+                self.variants.append((entity_id, frozenset(variant)))
+                for token in set(variant):
+                    self.by_token.setdefault(token, []).append(index)
+
+        # Anchor each variant on its rarest token, so "which names are contained
+        # in the query" only looks at short posting lists
+        for index, (_, tokens) in enumerate(self.variants):
+            anchor = min(sorted(tokens), key=lambda t: len(self.by_token[t]))
+            self.by_anchor.setdefault(anchor, []).append(index)
+
+        self.by_mac = {}
+        for mac, entity_ids in (macs or {}).items():
+            known = sorted(e for e in entity_ids if e in names)
+            if known:
+                self.by_mac[mac.upper()] = known
+
+    def candidates(self, name: str, mac: Optional[str] = None) -> Dict[str, float]:
+        """Score every plausible entity for a name (and optional MAC)."""
+        scores: Dict[str, float] = {}
+        for entity_id in self.by_mac.get((mac or "").upper().replace(":", ""), []):
+            scores[entity_id] = 3.0
+
+        query = name_tokens(name)
+        if not query:
+            return scores
+        for entity_id in self.by_compact.get("".join(query), ()):
+            scores[entity_id] = max(scores.get(entity_id, 0), 2.0)
+
+        query_set = set(query)
+        postings = [self.by_token.get(token) for token in query_set]
+        matches = set()
+        if all(postings):
+            # Names containing every query token
+            postings.sort(key=len)
+            matches = set(postings[0]).intersection(*postings[1:])
+        for token in query_set:
+            # Names whose tokens are all in the query
+            for index in self.by_anchor.get(token, ()):
+                if self.variants[index][1] <= query_set:
+                    matches.add(index)
+        for index in matches:
+            entity_id, tokens = self.variants[index]
+            score = len(tokens & query_set) / len(tokens | query_set)
+            if score > scores.get(entity_id, 0):
+                scores[entity_id] = score
+        return scores
+
+    def best_match(self, name: str, mac: Optional[str] = None) -> Optional[str]:
+        """Best-scoring entity for a name, or None."""
+        scores = self.candidates(name, mac)
+        if not scores:
+            return None
+        return min(scores, key=lambda entity_id: (-scores[entity_id], entity_id))
+
+    def assign(self, queries: Dict[str, Tuple[str, Optional[str]]],
+               available: Optional[Callable[[str], bool]] = None) -> Dict[str, str]:
+        """Match many names at once, giving each entity to at most one query.
+
+        Args:
+            queries: key -> (name, MAC or None)
+            available: entities for which this returns False are skipped
+
+        Returns:
+            key -> entity_id for every query that found a match
+        """
+        pairs = []
+        for key, (name, mac) in queries.items():
+            for entity_id, score in self.candidates(name, mac).items():
+                if available is None or available(entity_id):
+                    pairs.append((-score, key, entity_id))
+        pairs.sort()
+
+        assigned: Dict[str, str] = {}
+        claimed = set()
+        for _, key, entity_id in pairs:
+            if key in assigned or entity_id in claimed:
+                continue
+            assigned[key] = entity_id
+            claimed.add(entity_id)
+        return assigned
+
+
+# =============================================================================
+# Camera filters
+# =============================================================================
+
+class CameraFilter:
+    """
+    camera_filters compiled into one include and one exclude regex.
+
+    Each filter is matched case-insensitively against a camera's entity_id and name:
+
+        "front"          substring
+        "camera.*_hd"    glob (*, ?, [...]) on the whole entity_id or name
+        "!doorbell"      exclude (substring or glob)
+
+    A camera is kept if it matches any include filter (or there are none) and
+    no exclude filter. The same filter applies to every discovery source; a
+    UniFi or ONVIF camera added as a new camera is also checked against the
+    entity_ids its MAC has in HA, so excluding camera.front_door excludes the
+    Protect camera behind it too.
+    """
+
+    def __init__(self, filters: List[str]):
+        includes = []
+        excludes = []
+        for f in filters:
+            f = (f or "").strip()
+            target = includes
+            if f.startswith("!"):
+                f = f[1:].strip()
+                target = excludes
+            if f:
+                target.append(self.pattern(f))
+        self.include = re.compile("|".join(includes), re.IGNORECASE) if includes else None
+        self.exclude = re.compile("|".join(excludes), re.IGNORECASE) if excludes else None
+
+    @staticmethod
+    def pattern(f: str) -> str:
+        """Regex for one filter: anchored glob if it has wildcards, else a literal substring."""
+        if any(c in f for c in "*?["):
+            return r"\A" + fnmatch.translate(f)
+        return re.escape(f)
+
+    def matches(self, entity_id: str, name: str, aliases: Iterable[str] = ()) -> bool:
+        """True if a camera passes the filters.
+
+        Args:
+            aliases: Other entity_ids of the same camera, matched like entity_id
+        """
+        targets = [entity_id, name, *aliases]
+        if self.include and not any(self.include.search(target) for target in targets):
+            return False
+        if self.exclude and any(self.exclude.search(target) for target in targets):
+            return False
+        return True
+
+
+# =============================================================================
+# UniFi channel selection
+# =============================================================================
+
+QUALITY_CHANNELS = {"high": 0, "medium": 1, "low": 2}
+
+# Bits per pixel per frame used to estimate a channel's bitrate when Protect doesn't report one
+ESTIMATED_BITS_PER_PIXEL = 0.1
+
+
+class ChannelSelector:
+    """
+    Chooses which UniFi Protect channel each camera is published with.
+
+    stream_quality "high", "medium" or "low" picks channel 0, 1 or 2 for every
+    camera. "auto" starts every camera on its cheapest channel, then upgrades
+    cameras in priority order to the best channel that still fits
+    budget_mbps (0 = no limit). Channel bitrates come from the bootstrap
+    (bitrate, or width x height x fps when missing).
+
+    camera_priorities entries are "<filter>=<value>", with the filter matched
+    like camera_filters; the first matching entry wins:
+
+        "Front Door=high"     always channel 0 (still counted against the budget)
+        "camera.garage*=10"   priority 10 in auto mode (default 0, higher first)
+    """
+
+    def __init__(self, stream_quality: str = "high", budget_mbps: float = 0,
+                 priorities: Optional[List[str]] = None):
+        self.stream_quality = stream_quality
+        self.budget_kbps = (budget_mbps or 0) * 1000
+        # (CameraFilter, fixed quality or None, priority)
+        self.rules: List[Tuple[CameraFilter, Optional[str], int]] = []
+        for entry in priorities or []:
+            pattern, _, value = (entry or "").rpartition("=")
+            pattern, value = pattern.strip(), value.strip().lower()
+            if not pattern:
+                print(f"[WARN] Ignoring camera priority {entry!r} (expected <filter>=<value>)")
+            elif value in QUALITY_CHANNELS or value == "auto":
+                self.rules.append((CameraFilter([pattern]), value, 0))
+            elif re.fullmatch(r"-?\d+", value):
+                self.rules.append((CameraFilter([pattern]), None, int(value)))
+            else:
+                print(f"[WARN] Ignoring camera priority {entry!r} (expected high, medium, low, auto or a number)")
+
+    def rule_for(self, entity_ids: List[str], name: str) -> Tuple[str, int]:
+        """(quality, priority) for a camera, matching its name and any of its entity_ids."""
+        for camera_filter, quality, priority in self.rules:
+            if any(camera_filter.matches(entity_id, name) for entity_id in entity_ids):
+                return quality or self.stream_quality, priority
+        return self.stream_quality, 0
+
+    def wanted_channel(self, entity_ids: List[str], name: str) -> Any:
+        quality, _ = self.rule_for(entity_ids, name)
+        return QUALITY_CHANNELS.get(quality, "auto")
+
+    @staticmethod
+    def channel_kbps(channel: Dict) -> float:
+        """Channel bitrate in kbps, reported or estimated."""
+        if channel.get("bitrate"):
+            return channel["bitrate"] / 1000
+        pixels = (channel.get("width") or 0) * (channel.get("height") or 0)
+        return pixels * (channel.get("fps") or 30) * ESTIMATED_BITS_PER_PIXEL / 1000
+
+    def select(self, cameras: List[Tuple[str, List[str], str, List[Dict]]]) -> Dict[str, Optional[Dict]]:
+        """
+        Choose a channel for each (key, entity_ids, name, channels) camera.
+
+        Returns key -> channel dict, or None if the wanted channel has no rtspAlias.
+        """
+        plan: Dict[str, Optional[Dict]] = {}
+        upgradable = []
+        for key, entity_ids, name, channels in cameras:
+            usable = sorted((ch for ch in channels if ch.get("rtspAlias") and ch.get("enabled", True)),
+                            key=self.channel_kbps)
+            quality, priority = self.rule_for(entity_ids, name)
+            if quality in QUALITY_CHANNELS:
+                wanted = QUALITY_CHANNELS[quality]
+                plan[key] = next((ch for ch in usable if ch.get("id") == wanted), None)
+            elif usable:
+                plan[key] = usable[0]
+                upgradable.append((-priority, name, key, usable))
+            else:
+                plan[key] = None
+
+        if not upgradable:
+            return plan
+
+        budget = self.budget_kbps or float("inf")
+        used = sum(self.channel_kbps(ch) for ch in plan.values() if ch)
+        for _, name, key, usable in sorted(upgradable):
+            current = self.channel_kbps(plan[key])
+            # Best channel whose extra bitrate still fits
+            for ch in reversed(usable):
+                extra = self.channel_kbps(ch) - current
+                if used + extra <= budget:
+                    plan[key] = ch
+                    used += extra
+                    break
+
+        if used > budget:
+            print(f"[WARN] Cameras need {used / 1000:.1f} Mbps on their lowest channels, "
+                  f"over the {budget / 1000:.1f} Mbps budget")
+        else:
+            limit = f"{budget / 1000:.1f} Mbps budget" if self.budget_kbps else "no budget"
+            print(f"[INFO] Channel selection: {used / 1000:.1f} Mbps ({limit})")
+        return plan
+
+
 # =============================================================================
 # Main discovery logic
 # =============================================================================
 
-def discover_cameras(filters: List[str] = None, stream_quality: str = "high") -> List[Dict]:
+def fetch_discovery_sources(stream_quality: str = "high", parallel: bool = True,
+                            channel_selector: Optional["ChannelSelector"] = None,
+                            onvif: Optional[Dict] = None
+                            ) -> Tuple[List[Dict], Dict[str, str], Dict[str, Dict], Dict[str, Dict]]:
+    """
+    Fetch raw data from every discovery source.
+
+    In parallel mode HA states, go2rtc streams, the UniFi Protect bootstrap,
+    ONVIF devices and the .storage registries are fetched at the same time, so
+    a refresh takes as long as the slowest source instead of the sum of all of them.
+
+    Args:
+        onvif: get_onvif_cameras arguments (hosts, username, password), or None when ONVIF is off
+
+    Returns:
+        (camera entity states, go2rtc streams, UniFi cameras, ONVIF cameras)
+    """
+    if not parallel:
+        camera_entities = get_camera_entities()
+        print("[INFO] Checking go2rtc streams...")
+        go2rtc_streams = get_go2rtc_streams()
+        print("[INFO] Checking UniFi Protect integration...")
+        unifi_cameras = get_unifi_rtsp_urls(stream_quality, channel_selector=channel_selector)
+        onvif_cameras = {}
+        if onvif is not None:
+            print("[INFO] Checking ONVIF devices...")
+            onvif_cameras = get_onvif_cameras(stream_quality, **onvif)
+        return camera_entities, go2rtc_streams, unifi_cameras, onvif_cameras
+
+    print("[INFO] Fetching camera entities, go2rtc streams, UniFi Protect and ONVIF in parallel...")
+    # 4 sources + the two registry reads submitted by get_unifi_rtsp_urls
+    with ThreadPoolExecutor(max_workers=6, thread_name_prefix="discovery") as executor:
+        entities_future = executor.submit(get_camera_entities)
+        go2rtc_future = executor.submit(get_go2rtc_streams)
+        unifi_future = executor.submit(get_unifi_rtsp_urls, stream_quality, executor, channel_selector)
+        onvif_future = executor.submit(get_onvif_cameras, stream_quality, **onvif) if onvif is not None else None
+        return (entities_future.result(), go2rtc_future.result(), unifi_future.result(),
+                onvif_future.result() if onvif_future else {})
+
+
+def discover_cameras(filters: List[str] = None, stream_quality: str = "high",
+                     parallel: bool = True, channel_selector: Optional["ChannelSelector"] = None,
+                     onvif: Optional[Dict] = None) -> List[Dict]:
     """
     Discover cameras using multiple methods:
     1. go2rtc streams
     2. UniFi Protect integration
     3. Camera entity attributes
+    4. ONVIF devices
 
     Args:
-        filters: List of filter strings to match camera names/entity_ids
-        stream_quality: "high", "medium", or "low" for UniFi cameras
+        filters: camera_filters (see CameraFilter) to match camera names/entity_ids
+        stream_quality: "high", "medium", "low" or "auto" for UniFi cameras
+        parallel: Fetch all sources concurrently before matching
+        channel_selector: Per-camera UniFi channel choice (see ChannelSelector)
+        onvif: get_onvif_cameras arguments, or None when ONVIF discovery is off
     """
-    discovered = {}  # name -> {entity_id, name, stream_url}
+    camera_filter = CameraFilter(filters) if filters else None
+    camera_entities, go2rtc_streams, unifi_cameras, onvif_cameras = fetch_discovery_sources(
+        stream_quality, parallel, channel_selector, onvif)
+    # MAC -> entity_id lets UniFi and ONVIF cameras match their own entities regardless of names
+    entity_macs = REGISTRY_CACHE.camera_entities_by_mac() if unifi_cameras or onvif_cameras else {}
+    return merge_discovery_results(camera_entities, go2rtc_streams, unifi_cameras, camera_filter, entity_macs,
+                                   onvif_cameras)
+
+
+def merge_discovery_results(camera_entities: List[Dict], go2rtc_streams: Dict[str, str],
+                            unifi_cameras: Dict[str, Dict], camera_filter: Optional[CameraFilter] = None,
+                            entity_macs: Optional[Dict[str, List[str]]] = None,
+                            onvif_cameras: Optional[Dict[str, Dict]] = None) -> List[Dict]:
+    """Match go2rtc streams, UniFi cameras, entity attributes and ONVIF devices to HA camera entities."""
+    with METRICS.phase("match"):
+        return match_discovery_sources(camera_entities, go2rtc_streams, unifi_cameras, camera_filter,
+                                       entity_macs or {}, onvif_cameras or {})
+
+
+def match_discovery_sources(camera_entities: List[Dict], go2rtc_streams: Dict[str, str],
+                            unifi_cameras: Dict[str, Dict], camera_filter: Optional[CameraFilter],
+                            entity_macs: Dict[str, List[str]],
+                            onvif_cameras: Optional[Dict[str, Dict]] = None) -> List[Dict]:
+    discovered = {}  # entity_id -> {entity_id, name, stream_url, sources}
 
-    # Get all camera entities first
-    camera_entities = get_camera_entities()
     print(f"[INFO] Found {len(camera_entities)} camera entities in HA")
 
-    # Build entity lookup by name
-    entity_lookup = {}  # name variations -> entity_id
+    entity_states = {}  # entity_id -> state
     for state in camera_entities:
         entity_id = state.get("entity_id", "")
         attrs = state.get("attributes", {})
         friendly_name = attrs.get("friendly_name", "")
 
         # Apply filters
-        if filters:
-            match = False
-            for f in filters:
-                if f.lower() in entity_id.lower() or f.lower() in friendly_name.lower():
-                    match = True
-                    break
-            if not match:
-                continue
+        if camera_filter and not camera_filter.matches(entity_id, friendly_name):
+            METRICS.count("filtered_out")
+            continue
 
-        # Store with various name keys for matching
-        entity_lookup[entity_id] = state
-        entity_lookup[friendly_name.lower()] = state
-        entity_lookup[entity_id.replace("camera.", "")] = state
+        entity_states[entity_id] = state
 
         # Initialize camera info
         discovered[entity_id] = {
             "entity_id": entity_id,
             "name": friendly_name or entity_id.replace("camera.", "").replace("_", " ").title(),
-            "stream_url": None
+            "stream_url": None,
+            # Source records the camera was resolved from, for its fingerprint
+            "sources": [{"entity": entity_id,
+                         "attributes": {k: attrs[k] for k in CAMERA_CONFIG_ATTRIBUTES if k in attrs}}],
         }
 
+    matcher = CameraMatcher({entity_id: camera["name"] for entity_id, camera in discovered.items()},
+                            entity_macs)
+
+    def own_entities(cam_data: Dict) -> List[str]:
+        """HA camera entity_ids of a UniFi or ONVIF camera, by MAC (including filtered-out ones)."""
+        return entity_macs.get((cam_data.get("mac") or "").upper().replace(":", ""), [])
+
     # Method 1: Try go2rtc
-    print("[INFO] Checking go2rtc streams...")
-    go2rtc_streams = get_go2rtc_streams()
+    matches = matcher.assign({stream_name: (stream_name, None) for stream_name in go2rtc_streams})
+    METRICS.count("matched_go2rtc", len(matches))
+    METRICS.count("unmatched_go2rtc", len(go2rtc_streams) - len(matches))
     for stream_name, rtsp_url in go2rtc_streams.items():
-        # Try to match stream name to camera entity
-        for entity_id, camera in discovered.items():
-            if (stream_name.lower() in entity_id.lower() or
-                stream_name.lower() in camera["name"].lower() or
-                entity_id.replace("camera.", "") == stream_name):
-                camera["stream_url"] = rtsp_url
-                print(f"[INFO] Matched go2rtc stream '{stream_name}' to {entity_id}")
-                break
+        entity_id = matches.get(stream_name)
+        if entity_id:
+            discovered[entity_id]["stream_url"] = rtsp_url
+            discovered[entity_id]["sources"].append({"go2rtc": stream_name, "url": rtsp_url})
+            discovered[entity_id]["go2rtc_stream"] = stream_name
+            print(f"[INFO] Matched go2rtc stream '{stream_name}' to {entity_id}")
 
     # Method 2: Try UniFi Protect (queries API for rtspAlias)
-    print("[INFO] Checking UniFi Protect integration...")
-    unifi_cameras = get_unifi_rtsp_urls(stream_quality)
+    matches = matcher.assign(
+        {unifi_key: (cam_data["name"], cam_data.get("mac")) for unifi_key, cam_data in unifi_cameras.items()},
+        available=lambda entity_id: not discovered[entity_id]["stream_url"])
+    METRICS.count("matched_unifi", len(matches))
     for unifi_key, cam_data in unifi_cameras.items():
         cam_name = cam_data["name"]
         rtsp_url = cam_data["url"]
 
-        # Try to match to existing HA camera entity
-        matched = False
-        for entity_id, camera in discovered.items():
-            if camera["stream_url"]:
-                continue
-            # Match by name similarity
-            entity_name = camera["name"].lower()
-            unifi_name = cam_name.lower()
-            if (unifi_name in entity_name or entity_name in unifi_name or
-                unifi_name.replace(" ", "_") in entity_id.lower()):
-                camera["stream_url"] = rtsp_url
-                print(f"[INFO] Matched UniFi '{cam_name}' to {entity_id}")
-                matched = True
-                break
-
-        # If no match found, add as new camera
-        if not matched:
+        # Matched an existing HA camera entity
+        entity_id = matches.get(unifi_key)
+        if entity_id:
+            discovered[entity_id]["stream_url"] = rtsp_url
+            discovered[entity_id]["sources"].append({"unifi": unifi_key, "camera": cam_data})
+            print(f"[INFO] Matched UniFi '{cam_name}' to {entity_id}")
+        elif any(own in discovered for own in own_entities(cam_data)):
+            # Its own entity (by MAC) already streams through go2rtc: same camera
+            print(f"[DEBUG] UniFi camera {cam_name} already streams through another method")
+        else:
+            # No match found, add as new camera
             new_entity_id = f"camera.unifi_{cam_name.lower().replace(' ', '_')}"
+            if camera_filter and not camera_filter.matches(new_entity_id, cam_name, own_entities(cam_data)):
+                METRICS.count("filtered_out")
+                print(f"[DEBUG] Skipping UniFi camera {cam_name} (camera_filters)")
+                continue
             discovered[new_entity_id] = {
                 "entity_id": new_entity_id,
                 "name": cam_name,
-                "stream_url": rtsp_url
+                "stream_url": rtsp_url,
+                "sources": [{"unifi": unifi_key, "camera": cam_data}],
             }
+            METRICS.count("added_unifi")
             print(f"[INFO] Added UniFi camera: {cam_name}")
 
     # Method 3: Check entity attributes
     print("[INFO] Checking camera entity attributes...")
     for entity_id, camera in discovered.items():
-        if camera["stream_url"]:
-            continue  # Already has URL
-
-        state = entity_lookup.get(entity_id)
-        if state:
-            url = get_stream_url_from_attributes(state)
-            if url:
-                camera["stream_url"] = url
-                print(f"[INFO] Found stream_source for {entity_id}")
+        state = entity_states.get(entity_id)
+        if not state:
+            continue
+        url = get_stream_url_from_attributes(state)
+        if not url:
+            continue
+        if not camera["stream_url"]:
+            camera["stream_url"] = url
+            METRICS.count("matched_attributes")
+            print(f"[INFO] Found stream_source for {entity_id}")
+        elif url != camera["stream_url"]:
+            # Kept as a fallback in case the primary URL fails its health probe
+            camera["fallback_urls"] = [url]
+
+    # Method 4: ONVIF devices, for cameras still without a URL
+    if onvif_cameras:
+        # A device whose host already streams through another method is the same camera
+        used_hosts = {urlsplit(url).hostname for camera in discovered.values()
+                      for url in [camera["stream_url"]] + camera.get("fallback_urls", []) if url}
+        matches = matcher.assign(
+            {key: (cam_data["name"], cam_data.get("mac")) for key, cam_data in onvif_cameras.items()},
+            available=lambda entity_id: not discovered[entity_id]["stream_url"])
+        METRICS.count("matched_onvif", len(matches))
+        for key, cam_data in onvif_cameras.items():
+            cam_name = cam_data["name"]
+            entity_id = matches.get(key)
+            if entity_id:
+                discovered[entity_id]["stream_url"] = cam_data["url"]
+                discovered[entity_id]["sources"].append({"onvif": key, "camera": cam_data})
+                print(f"[INFO] Matched ONVIF '{cam_name}' to {entity_id}")
+                continue
+            if (urlsplit(cam_data["url"]).hostname in used_hosts
+                    or any(own in discovered for own in own_entities(cam_data))):
+                print(f"[DEBUG] ONVIF device {cam_name} already streams through another method")
+                continue
+            new_entity_id = f"camera.onvif_{re.sub(r'[^a-z0-9]+', '_', cam_name.lower()).strip('_')}"
+            if camera_filter and not camera_filter.matches(new_entity_id, cam_name, own_entities(cam_data)):
+                METRICS.count("filtered_out")
+                print(f"[DEBUG] Skipping ONVIF camera {cam_name} (camera_filters)")
+                continue
+            if new_entity_id in discovered:
+                new_entity_id += f"_{hashlib.sha1(key.encode()).hexdigest()[:6]}"
+            discovered[new_entity_id] = {
+                "entity_id": new_entity_id,
+                "name": cam_name,
+                "stream_url": cam_data["url"],
+                "sources": [{"onvif": key, "camera": cam_data}],
+            }
+            METRICS.count("added_onvif")
+            print(f"[INFO] Added ONVIF camera: {cam_name}")
 
     # Summary
+    for camera in discovered.values():
+        camera["fingerprint"] = source_fingerprint(camera.pop("sources"))
     with_urls = sum(1 for c in discovered.values() if c["stream_url"])
+    METRICS.count("cameras_without_url", len(discovered) - with_urls)
     print(f"[INFO] Discovery complete: {len(discovered)} cameras, {with_urls} with RTSP URLs")
 
     return list(discovered.values())
 
 
+# =============================================================================
+# Stream health probing
+# =============================================================================
+
+# Total time the probing stage may take, however many cameras there are
+PROBE_BUDGET = 10.0
+# Deadline for a single URL (connect + OPTIONS + DESCRIBE, including auth retry)
+PROBE_TIMEOUT = 3.0
+# Probes in flight at once
+PROBE_CONCURRENCY = 32
+# A passed probe is reused while the camera's sources are unchanged, up to this age (seconds)
+PROBE_REUSE_MAX_AGE = 3600
+
+# Latest probe results, for troubleshooting
+STREAM_HEALTH_FILE = "/data/stream_health.json"
+
+RTSP_DEFAULT_PORTS = {"rtsp": 554, "rtsps": 322}
+
+
+def redact_url(url: str) -> str:
+    """URL with any password replaced, for logs."""
+    parts = urlsplit(url)
+    if parts.password is None:
+        return url
+    netloc = f"{parts.username}:***@{parts.hostname}" + (f":{parts.port}" if parts.port else "")
+    return urlunsplit(parts._replace(netloc=netloc))
+
+
+def parse_sdp_codecs(sdp: str) -> Dict[str, str]:
+    """Media type -> codec name from an SDP body, e.g. {"video": "H264", "audio": "MPEG4-GENERIC"}."""
+    codecs_by_media = {}
+    payload_media = {}
+    for line in sdp.splitlines():
+        line = line.strip()
+        if line.startswith("m="):
+            fields = line[2:].split()
+            if len(fields) >= 4:
+                for payload in fields[3:]:
+                    payload_media[payload] = fields[0]
+        elif line.startswith("a=rtpmap:"):
+            payload, _, encoding = line[len("a=rtpmap:"):].partition(" ")
+            media = payload_media.get(payload)
+            if media and media not in codecs_by_media:
+                codecs_by_media[media] = encoding.split("/")[0].upper()
+    return codecs_by_media
+
+
+class RtspProbe:
+    """One RTSP(S) control connection used to send OPTIONS and DESCRIBE."""
+
+    def __init__(self, url: str, deadline: float):
+        self.parts = urlsplit(url)
+        self.deadline = deadline
+        self.cseq = 0
+        host = self.parts.hostname
+        port = self.parts.port or RTSP_DEFAULT_PORTS.get(self.parts.scheme, 554)
+        # Credentials go in the Authorization header, never the request URL
+        self.request_url = urlunsplit(self.parts._replace(netloc=f"{host}:{port}"))
+        self.username = unquote(self.parts.username or "")
+        self.password = unquote(self.parts.password or "")
+
+        self.sock = socket.create_connection((host, port), timeout=self.remaining())
+        if self.parts.scheme == "rtsps":
+            ctx = ssl.create_default_context()
+            ctx.check_hostname = False
+            ctx.verify_mode = ssl.CERT_NONE
+            self.sock = ctx.wrap_socket(self.sock, server_hostname=host)
+        self.rfile = self.sock.makefile("rb")
+
+    def remaining(self) -> float:
+        remaining = self.deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError("probe deadline exceeded")
+        return remaining
+
+    def close(self):
+        try:
+            self.rfile.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+    def request(self, method: str, headers: Optional[Dict[str, str]] = None) -> Tuple[int, Dict[str, str], str]:
+        """Send a request and return (status, headers, body)."""
+        self.cseq += 1
+        lines = [f"{method} {self.request_url} RTSP/1.0", f"CSeq: {self.cseq}", "User-Agent: auto-monocle"]
+        lines += [f"{k}: {v}" for k, v in (headers or {}).items()]
+        self.sock.settimeout(self.remaining())
+        self.sock.sendall(("\r\n".join(lines) + "\r\n\r\n").encode())
+
+        self.sock.settimeout(self.remaining())
+        status_line = self.rfile.readline(1024).decode(errors="replace")
+        if not status_line.startswith("RTSP/"):
+            raise ValueError(f"not an RTSP response: {status_line.strip()[:40]!r}")
+        status = int(status_line.split()[1])
+        response_headers = {}
+        while True:
+            self.sock.settimeout(self.remaining())
+            line = self.rfile.readline(4096).decode(errors="replace").strip()
+            if not line:
+                break
+            key, _, value = line.partition(":")
+            response_headers[key.strip().lower()] = value.strip()
+        body = ""
+        length = int(response_headers.get("content-length", 0) or 0)
+        if length:
+            self.sock.settimeout(self.remaining())
+            body = self.rfile.read(min(length, 65536)).decode(errors="replace")
+        return status, response_headers, body
+
+    def authorization(self, method: str, challenge: str) -> Optional[str]:
+        """Authorization header answering a WWW-Authenticate challenge (Basic or Digest)."""
+        if not self.username:
+            return None
+        scheme, _, params = challenge.partition(" ")
+        if scheme.lower() == "basic":
+            token = base64.b64encode(f"{self.username}:{self.password}".encode()).decode()
+            return f"Basic {token}"
+        if scheme.lower() != "digest":
+            return None
+        fields = dict(re.findall(r'(\w+)="?([^",]*)"?', params))
+        realm, nonce = fields.get("realm", ""), fields.get("nonce", "")
+        md5 = lambda text: hashlib.md5(text.encode()).hexdigest()  # noqa: E731
+        ha1 = md5(f"{self.username}:{realm}:{self.password}")
+        ha2 = md5(f"{method}:{self.request_url}")
+        header = f'Digest username="{self.username}", realm="{realm}", nonce="{nonce}", uri="{self.request_url}"'
+        if "auth" in fields.get("qop", "").split(","):
+            cnonce = os.urandom(8).hex()
+            response = md5(f"{ha1}:{nonce}:00000001:{cnonce}:auth:{ha2}")
+            header += f', qop=auth, nc=00000001, cnonce="{cnonce}"'
+        else:
+            response = md5(f"{ha1}:{nonce}:{ha2}")
+        return header + f', response="{response}"'
+
+
+def probe_rtsp_url(url: str, timeout: float = PROBE_TIMEOUT) -> Dict:
+    """
+    Check that an RTSP(S) URL serves a video stream (OPTIONS then DESCRIBE).
+
+    Returns:
+        {"ok": bool, "status": DESCRIBE status or None, "latency_ms": time to the
+         DESCRIBE answer, "codecs": {"video": "H264", ...}, "error": str or None,
+         "time": when the probe ran (epoch seconds)}
+    """
+    result = {"ok": False, "status": None, "latency_ms": None, "codecs": {}, "error": None,
+              "time": int(time.time())}
+    start = time.monotonic()
+    probe = None
+    try:
+        if urlsplit(url).scheme not in RTSP_DEFAULT_PORTS:
+            result["error"] = "not an RTSP URL"
+            return result
+        probe = RtspProbe(url, start + timeout)
+        probe.request("OPTIONS")
+        describe_headers = {"Accept": "application/sdp"}
+        status, headers, body = probe.request("DESCRIBE", describe_headers)
+        if status == 401 and headers.get("www-authenticate"):
+            authorization = probe.authorization("DESCRIBE", headers["www-authenticate"])
+            if authorization:
+                describe_headers["Authorization"] = authorization
+                status, headers, body = probe.request("DESCRIBE", describe_headers)
+        result["status"] = status
+        result["latency_ms"] = round((time.monotonic() - start) * 1000, 1)
+        if status != 200:
+            result["error"] = f"DESCRIBE returned {status}"
+            return result
+        result["codecs"] = parse_sdp_codecs(body)
+        result["ok"] = "video" in result["codecs"]
+        if not result["ok"]:
+            result["error"] = "no video track in SDP"
+    except Exception as e:
+        result["error"] = str(e) or type(e).__name__
+    finally:
+        if probe:
+            probe.close()
+    return result
+
+
+def probe_camera_streams(cameras: List[Dict], mode: str = "demote", budget: float = PROBE_BUDGET,
+                         timeout: float = PROBE_TIMEOUT, concurrency: int = PROBE_CONCURRENCY,
+                         previous: Optional[Dict[str, Dict]] = None) -> List[Dict]:
+    """
+    Probe every candidate URL of every camera in parallel before publishing.
+
+    Each camera's primary stream_url and fallback_urls are probed with at most
+    `concurrency` probes in flight; the whole stage returns within `budget`
+    seconds. URLs not probed in time, and non-RTSP URLs, are treated as
+    unknown and left alone.
+
+    Modes:
+        demote: failing URLs move behind working ones; a camera with no working
+                URL keeps its primary URL
+        drop:   failing URLs are removed; a camera with no working URL is skipped
+
+    The result of the chosen URL is stored in camera["probe"].
+
+    Args:
+        previous: fingerprint -> camera from the last discovery snapshot. A camera
+                  whose sources are unchanged and whose chosen URL passed its probe
+                  less than PROBE_REUSE_MAX_AGE ago keeps that result unprobed.
+    """
+    reused = set()
+    for camera in cameras:
+        known = (previous or {}).get(camera.get("fingerprint"))
+        probe = (known or {}).get("probe")
+        if probe and probe.get("ok") and time.time() - probe.get("time", 0) < PROBE_REUSE_MAX_AGE:
+            camera["stream_url"], camera["fallback_urls"] = known["stream_url"], list(known.get("fallback_urls", []))
+            camera["probe"] = probe
+            reused.add(camera["entity_id"])
+    METRICS.count("probe_reused", len(reused))
+    if reused:
+        print(f"[INFO] Reusing stream checks for {len(reused)} unchanged cameras")
+
+    urls = sorted({url for camera in cameras if camera["entity_id"] not in reused
+                   for url in [camera.get("stream_url")] + camera.get("fallback_urls", [])
+                   if url and urlsplit(url).scheme in RTSP_DEFAULT_PORTS})
+    if not urls:
+        return cameras
+
+    print(f"[INFO] Probing {len(urls)} stream URLs (budget {budget:.0f}s)...")
+    with METRICS.phase("probe"):
+        results = run_stream_probes(urls, budget, timeout, concurrency)
+    METRICS.add("probe", "records", len(results))
+    METRICS.add("probe", "errors", sum(1 for result in results.values() if not result["ok"]))
+    METRICS.count("probe_unfinished", len(urls) - len(results))
+
+    kept = []
+    for camera in cameras:
+        candidates = [url for url in [camera.get("stream_url")] + camera.get("fallback_urls", []) if url]
+        if not candidates or camera["entity_id"] in reused:
+            kept.append(camera)
+            continue
+        healthy = [url for url in candidates if results.get(url, {"ok": True})["ok"]]
+        failed = [url for url in candidates if url not in healthy]
+        for url in failed:
+            print(f"[WARN] Stream check failed for {camera['name']}: {redact_url(url)} ({results[url]['error']})")
+
+        if not healthy and mode == "drop":
+            print(f"[WARN] Dropping {camera['name']} - no working RTSP URL")
+            continue
+        ordered = healthy + failed
+        if mode == "drop":
+            ordered = healthy
+        camera["stream_url"], camera["fallback_urls"] = ordered[0], ordered[1:]
+        camera["probe"] = results.get(camera["stream_url"])
+        probe = camera["probe"]
+        if probe and probe["ok"]:
+            codecs = "/".join(probe["codecs"].values())
+            print(f"[INFO] Stream OK: {camera['name']} ({codecs}, {probe['latency_ms']:.0f} ms)")
+        kept.append(camera)
+
+    write_stream_health(results)
+    return kept
+
+
+def run_stream_probes(urls: List[str], budget: float, timeout: float, concurrency: int) -> Dict[str, Dict]:
+    """Probe URLs concurrently; returns url -> result for the probes that finished within budget."""
+    results: Dict[str, Dict] = {}
+    executor = ThreadPoolExecutor(max_workers=min(concurrency, len(urls)), thread_name_prefix="rtsp-probe")
+    futures = {executor.submit(probe_rtsp_url, url, timeout): url for url in urls}
+    done, not_done = wait(futures, timeout=budget)
+    # Unfinished probes end on their own deadline; don't start queued ones
+    executor.shutdown(wait=False, cancel_futures=True)
+    for future in done:
+        results[futures[future]] = future.result()
+    if not_done:
+        print(f"[WARN] Probe budget exhausted, {len(not_done)} URLs left unprobed")
+    return results
+
+
+def write_stream_health(results: Dict[str, Dict], path: Optional[str] = None):
+    """Save the latest probe results (URLs redacted)."""
+    path = path or STREAM_HEALTH_FILE
+    try:
+        write_file_atomic(path, json.dumps({
+            "time": int(time.time()),
+            "results": {redact_url(url): result for url, result in sorted(results.items())},
+        }, indent=2))
+    except OSError as e:
+        print(f"[DEBUG] Could not write {path}: {e}")
+
+
+# =============================================================================
+# Discovery snapshot
+# =============================================================================
+
+# Last good discovery result, used to start the gateway before discovery runs
+DISCOVERY_SNAPSHOT_FILE = "/data/discovery_snapshot.json"
+
+SNAPSHOT_CAMERA_FIELDS = ["entity_id", "name", "stream_url", "fallback_urls", "probe", "fingerprint"]
+# Probe result fields that differ on every run; they are saved (the time decides
+# whether a probe can be reused) but not compared, so a snapshot that differs
+# only in them isn't rewritten
+PROBE_VOLATILE_FIELDS = ("time", "latency_ms")
+
+
+def source_fingerprint(records: List[Dict]) -> str:
+    """Stable hash of the source records (HA state, go2rtc stream, UniFi camera) a camera came from."""
+    return hashlib.sha1(json.dumps(records, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def snapshot_camera_data(cameras: List[Dict]) -> List[Dict]:
+    """Snapshot cameras without their volatile probe fields, for comparing snapshots."""
+    return [{**camera, "probe": {k: v for k, v in camera["probe"].items() if k not in PROBE_VOLATILE_FIELDS}}
+            if camera.get("probe") else camera for camera in cameras]
+
+
+def snapshot_unchanged(previous: Dict, snapshot: Dict) -> bool:
+    """Whether a new snapshot only differs from the saved one in probe times and latencies.
+
+    A saved passed probe that is too old to be reused counts as a change, so
+    the fresh probe that replaced it gets saved.
+    """
+    if set(previous) - {"time"} != set(snapshot):
+        return False
+    if any(previous[k] != v for k, v in snapshot.items() if k != "cameras"):
+        return False
+    now = time.time()
+    if any(camera.get("probe") and camera["probe"].get("ok")
+           and now - camera["probe"].get("time", 0) >= PROBE_REUSE_MAX_AGE for camera in previous["cameras"]):
+        return False
+    return snapshot_camera_data(previous["cameras"]) == snapshot_camera_data(snapshot["cameras"])
+
+
+def load_discovery_snapshot(path: Optional[str] = None) -> Optional[Dict]:
+    """Read the discovery snapshot; None if there is none or it is unreadable."""
+    path = path or DISCOVERY_SNAPSHOT_FILE
+    try:
+        with open(path) as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(snapshot, dict) or not isinstance(snapshot.get("config", {}).get("cameras"), list):
+        return None
+    return snapshot
+
+
+def save_discovery_snapshot(config: Dict, cameras: List[Dict], restream: Optional[Dict[str, str]] = None,
+                            path: Optional[str] = None) -> bool:
+    """Save the config, the cameras it came from and the restream streams, only if any changed
+    (see snapshot_unchanged).
+
+    Returns:
+        True if the snapshot was written
+    """
+    path = path or DISCOVERY_SNAPSHOT_FILE
+    snapshot = {
+        "config": canonical_config(config),
+        "cameras": sorted(({k: camera[k] for k in SNAPSHOT_CAMERA_FIELDS if k in camera} for camera in cameras),
+                          key=lambda c: c["entity_id"]),
+    }
+    if restream is not None:
+        snapshot["restream"] = restream
+    previous = load_discovery_snapshot(path)
+    if previous and snapshot_unchanged(previous, snapshot):
+        return False
+    snapshot["time"] = int(time.time())
+    try:
+        # Stream URLs can carry camera credentials
+        write_file_atomic(path, json.dumps(snapshot, indent=2), mode=0o600)
+    except OSError as e:
+        print(f"[DEBUG] Could not write {path}: {e}")
+        return False
+    return True
+
+
+def restore_monocle_config(restream: bool = False, path: str = "/etc/monocle/monocle.json",
+                           snapshot_path: Optional[str] = None) -> bool:
+    """Write the Monocle config (and go2rtc config) from the discovery snapshot, without running discovery.
+
+    Args:
+        restream: The restream option; a snapshot taken with the other setting isn't used
+
+    Returns:
+        False if there is no usable snapshot
+    """
+    snapshot = load_discovery_snapshot(snapshot_path)
+    if snapshot is None:
+        print("[INFO] No discovery snapshot yet")
+        return False
+    if ("restream" in snapshot) != restream:
+        print("[INFO] Discovery snapshot was taken with a different restream setting, not using it")
+        return False
+    saved = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(snapshot.get("time", 0)))
+    print(f"[INFO] Restoring {len(snapshot['config']['cameras'])} cameras from the discovery snapshot ({saved})")
+    if restream:
+        write_restream_config(snapshot["restream"])
+    write_monocle_config(snapshot["config"], path)
+    return True
+
+
+# =============================================================================
+# go2rtc restream
+# =============================================================================
+
+# Config for the add-on's own go2rtc (restream option), read by run.sh
+RESTREAM_CONFIG_FILE = "/etc/monocle/go2rtc.yaml"
+# Its RTSP server; only the gateway in this container connects to it
+RESTREAM_RTSP_LISTEN = "127.0.0.1:8554"
+
+RESTREAM_NAME_RE = re.compile(r"^[A-Za-z0-9._-]+$")
+
+
+def restream_name(camera: Dict, taken: set) -> str:
+    """go2rtc stream name for a camera: its go2rtc stream's name if it has one, else its entity slug."""
+    name = camera.get("go2rtc_stream") or ""
+    if not RESTREAM_NAME_RE.match(name):
+        name = re.sub(r"[^a-z0-9]+", "_", camera["entity_id"].replace("camera.", "").lower()).strip("_") or "camera"
+    unique, n = name, 2
+    while unique in taken:
+        unique, n = f"{name}_{n}", n + 1
+    taken.add(unique)
+    return unique
+
+
+def restream_source(url: str) -> str:
+    """go2rtc source for an upstream URL (rtspx:// is RTSPS without certificate checks, e.g. UniFi Protect)."""
+    if url.lower().startswith("rtsps://"):
+        return "rtspx://" + url[len("rtsps://"):]
+    return url
+
+
+def restream_cameras(cameras: List[Dict]) -> Tuple[List[Dict], Dict[str, str]]:
+    """Point each camera at a local go2rtc restream of its stream URL.
+
+    go2rtc keeps one upstream connection per camera however many clients
+    watch it. The camera's fallback URLs are dropped, since go2rtc would
+    merge several sources rather than fail over between them.
+
+    Returns:
+        (cameras with restream stream_urls and "restream" names, stream name -> upstream URL)
+    """
+    taken = set()
+    streams = {}
+    restreamed = []
+    for camera in sorted(cameras, key=lambda c: c["entity_id"]):
+        if not camera.get("stream_url"):
+            restreamed.append(camera)
+            continue
+        name = restream_name(camera, taken)
+        streams[name] = camera["stream_url"]
+        restreamed.append({**camera, "restream": name, "fallback_urls": [],
+                           "stream_url": f"rtsp://{RESTREAM_RTSP_LISTEN}/{name}"})
+    return restreamed, streams
+
+
+def generate_restream_config(streams: Dict[str, str]) -> Dict:
+    """go2rtc config serving the streams over RTSP on localhost only.
+
+    The API is off so discovery never finds this go2rtc at localhost:1984 and
+    restreams its own restreams; WebRTC and HomeKit (SRTP, port 8443 - the
+    gateway's) are off too.
+    """
+    return {
+        "api": {"listen": ""},
+        "rtsp": {"listen": RESTREAM_RTSP_LISTEN},
+        "webrtc": {"listen": ""},
+        "srtp": {"listen": ""},
+        "log": {"level": "warn"},
+        "streams": {name: restream_source(url) for name, url in sorted(streams.items())},
+    }
+
+
+def write_restream_config(streams: Dict[str, str], path: Optional[str] = None) -> List[str]:
+    """Write the go2rtc config if its streams changed.
+
+    JSON is valid YAML, so the config is written as JSON.
+
+    Returns:
+        Names of the streams added, removed or pointed at another upstream
+    """
+    path = path or RESTREAM_CONFIG_FILE
+    previous = {}
+    try:
+        with open(path) as f:
+            previous = json.load(f).get("streams", {})
+    except (OSError, ValueError, AttributeError):
+        pass
+    config = generate_restream_config(streams)
+    changed = sorted(name for name in set(previous) | set(config["streams"])
+                     if previous.get(name) != config["streams"].get(name))
+    if changed or not os.path.exists(path):
+        # Upstream URLs can carry camera credentials
+        write_file_atomic(path, json.dumps(config, indent=2), mode=0o600)
+        print(f"[INFO] Wrote go2rtc restream config with {len(streams)} streams")
+    return changed
+
+
 def generate_monocle_config(cameras: List[Dict]) -> Dict:
     """Generate Monocle Gateway configuration."""
     config = {"cameras": []}
@@ -516,26 +3210,567 @@ def write_monocle_token(token: str, path: str = "/etc/monocle/monocle.token"):
     print("[INFO] Wrote Monocle token file")
 
 
-def write_monocle_config(config: Dict, path: str = "/etc/monocle/monocle.json"):
-    """Write Monocle configuration to file."""
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "w") as f:
-        json.dump(config, f, indent=2)
-    print(f"[INFO] Wrote Monocle config with {len(config.get('cameras', []))} cameras")
+def canonical_config(config: Dict) -> Dict:
+    """Order-independent form of a Monocle config: cameras sorted by name and URL, tags sorted."""
+    cameras = []
+    for camera in config.get("cameras", []):
+        camera = dict(camera)
+        if "tags" in camera:
+            camera["tags"] = sorted(camera["tags"])
+        cameras.append(camera)
+    cameras.sort(key=lambda c: (c.get("name", ""), c.get("url", ""), json.dumps(c, sort_keys=True)))
+    return {**config, "cameras": cameras}
+
+
+def diff_monocle_configs(old: Optional[Dict], new: Dict) -> Dict[str, List[str]]:
+    """Camera names added, removed or changed (URL, tags…) between two configs."""
+    def by_name(config):
+        cameras = {}
+        for camera in canonical_config(config or {}).get("cameras", []):
+            cameras.setdefault(camera.get("name", ""), []).append(json.dumps(camera, sort_keys=True))
+        return cameras
+
+    old_cameras = by_name(old)
+    new_cameras = by_name(new)
+    return {
+        "added": sorted(set(new_cameras) - set(old_cameras)),
+        "removed": sorted(set(old_cameras) - set(new_cameras)),
+        "changed": sorted(name for name in set(old_cameras) & set(new_cameras)
+                          if old_cameras[name] != new_cameras[name]),
+    }
 
 
-def main():
-    """Main entry point."""
-    options_path = "/data/options.json"
+def format_config_diff(diff: Dict[str, List[str]]) -> str:
+    """One-line summary of a config diff, e.g. "+Porch -Garage ~Front Door"."""
+    parts = [f"{sign}{name}" for key, sign in [("added", "+"), ("removed", "-"), ("changed", "~")]
+             for name in diff[key]]
+    return " ".join(parts) or "no changes"
+
+
+def write_monocle_config(config: Dict, path: str = "/etc/monocle/monocle.json",
+                         previous: Optional[Dict] = None) -> Dict[str, List[str]]:
+    """Write Monocle configuration to file, only if cameras were added, removed or changed.
+
+    The file is replaced atomically (temp file + rename), so the gateway never
+    sees a half-written config.
+
+    Args:
+        previous: Config currently in effect (read from path if not given)
+
+    Returns:
+        The diff against the previous config (see diff_monocle_configs)
+    """
+    if previous is None:
+        previous = read_monocle_config(path)
+    diff = diff_monocle_configs(previous, config)
+    if previous is not None and canonical_config(previous) == canonical_config(config):
+        print(f"[INFO] Monocle config unchanged ({len(config.get('cameras', []))} cameras)")
+        return diff
+
+    write_file_atomic(path, json.dumps(canonical_config(config), indent=2))
+    print(f"[INFO] Wrote Monocle config with {len(config.get('cameras', []))} cameras ({format_config_diff(diff)})")
+    return diff
+
+
+def read_monocle_config(path: str = "/etc/monocle/monocle.json") -> Optional[Dict]:
+    """Read the Monocle configuration currently on disk."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def load_options(options_path: str = "/data/options.json") -> Dict:
+    """Load add-on options."""
     options = {}
     if os.path.exists(options_path):
         with open(options_path) as f:
             options = json.load(f)
+    return options
 
-    monocle_token = options.get("monocle_token", "")
+
+def build_monocle_config(options: Dict, snapshot: Optional[Dict] = None
+                         ) -> Tuple[Dict, List[Dict], Optional[Dict[str, str]]]:
+    """Run discovery (if enabled) and return the Monocle configuration and the cameras behind it.
+
+    Args:
+        snapshot: Last discovery snapshot; cameras whose sources are unchanged
+                  since then keep their stream checks (see probe_camera_streams)
+
+    Returns:
+        (config, discovered cameras, go2rtc restream streams or None when restream is off)
+    """
     auto_discover = options.get("auto_discover", True)
     stream_quality = options.get("stream_quality", "high")
     camera_filters = options.get("camera_filters", [])
+    parallel_discovery = options.get("parallel_discovery", True)
+    stream_probe = options.get("stream_probe", "demote")
+    channel_selector = ChannelSelector(stream_quality, options.get("bandwidth_budget_mbps", 0),
+                                       options.get("camera_priorities", []))
+
+    if not auto_discover:
+        print("[INFO] Auto-discovery disabled")
+        return {"cameras": []}, [], None
+
+    onvif = None
+    if options.get("onvif", False):
+        onvif = {"hosts": options.get("onvif_hosts", []), "username": options.get("onvif_username", ""),
+                 "password": options.get("onvif_password", "")}
+
+    cameras = discover_cameras(camera_filters if camera_filters else None, stream_quality,
+                               parallel_discovery, channel_selector, onvif)
+    if stream_probe != "off":
+        previous = {camera["fingerprint"]: camera for camera in (snapshot or {}).get("cameras", [])
+                    if camera.get("fingerprint")}
+        cameras = probe_camera_streams(cameras, stream_probe, previous=previous)
+    if not options.get("restream", False):
+        return generate_monocle_config(cameras), cameras, None
+    restreamed, streams = restream_cameras(cameras)
+    return generate_monocle_config(restreamed), cameras, streams
+
+
+def refresh_monocle_config(options: Dict, path: str = "/etc/monocle/monocle.json",
+                           previous: Optional[Dict] = None) -> Dict[str, List[str]]:
+    """Run discovery, write the config and snapshot if they changed and record the run's metrics.
+
+    Returns:
+        The diff against the previous config (see write_monocle_config)
+    """
+    METRICS.reset()
+    if profiling_enabled(options):
+        print("[INFO] Profiling this refresh (sources are queried one after another)")
+        options = {**options, "parallel_discovery": False}
+        METRICS.profiler = DiscoveryProfiler()
+        METRICS.profiler.start()
+    result = "error"
+    try:
+        config, cameras, restream = build_monocle_config(options, load_discovery_snapshot())
+        with METRICS.phase("write_config"):
+            if restream is not None:
+                changed_streams = write_restream_config(restream)
+            diff = write_monocle_config(config, path, previous)
+            if restream is not None:
+                # An upstream URL change only shows in the go2rtc config: report it so the
+                # supervisor is signalled and restarts go2rtc. monocle.json is unchanged
+                # (it points at the restream), so the gateway keeps running
+                prefix = f"rtsp://{RESTREAM_RTSP_LISTEN}/"
+                names = {camera["url"][len(prefix):]: camera["name"] for camera in config["cameras"]}
+                diff["changed"] = sorted(set(diff["changed"]) | {
+                    names[stream] for stream in changed_streams
+                    if stream in names and names[stream] not in diff["added"]})
+            if options.get("auto_discover", True):
+                save_discovery_snapshot(config, cameras, restream)
+        result = "ok"
+    except Exception:
+        write_discovery_status("error")
+        raise
+    finally:
+        if METRICS.profiler:
+            write_profile(result)
+    write_discovery_status("ok", len(config["cameras"]), format_config_diff(diff))
+    return diff
+
+
+def write_profile(result: str):
+    """Stop profiling the current run and write its report."""
+    profiler, METRICS.profiler = METRICS.profiler, None
+    profiler.stop()
+    path = write_profile_report(profiler.report(result))
+    if path:
+        print(f"[INFO] Profile report written to {path}")
+
+
+# =============================================================================
+# Daemon mode
+# =============================================================================
+
+class DiscoveryScheduler:
+    """Decide when the next refresh runs: refresh_interval with jitter, backoff after failures."""
+
+    def __init__(self, interval: float, jitter: float = 0.1, backoff_base: float = 15,
+                 rng: Optional[random.Random] = None):
+        self.interval = interval
+        self.jitter = jitter
+        self.backoff_base = backoff_base
+        self.rng = rng or random.Random()
+        self.failures = 0
+
+    def next_delay(self) -> float:
+        """Seconds until the next cycle."""
+        if self.failures:
+            # Retry sooner than the full interval, doubling on every consecutive failure
+            delay = min(self.interval, self.backoff_base * 2 ** (self.failures - 1))
+        else:
+            delay = self.interval
+        return delay * self.rng.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def record_success(self):
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+
+
+# Events mode: wait this long after the last relevant event before refreshing,
+# but never more than DEBOUNCE_MAX_DELAY after the first one of a burst
+DEBOUNCE_QUIET = 5.0
+DEBOUNCE_MAX_DELAY = 30.0
+
+# Camera attributes whose change can change the generated config
+CAMERA_CONFIG_ATTRIBUTES = ["friendly_name"] + STREAM_URL_ATTRIBUTES
+
+# Device registry fields that affect camera names or MAC matching
+DEVICE_CONFIG_FIELDS = {"name", "name_by_user", "connections", "disabled_by"}
+
+# Integrations whose config entries can change the camera list
+CAMERA_CONFIG_DOMAINS = {"unifiprotect", "unifi_protect", "ubiquiti_unifi_protect", "onvif", "generic", "go2rtc"}
+
+CAMERA_IDS_TEMPLATE = "{{ states.camera | map(attribute='entity_id') | list | tojson }}"
+
+
+class RefreshTrigger:
+    """Collect change events and release one refresh per burst (debounced)."""
+
+    def __init__(self, quiet: float = DEBOUNCE_QUIET, max_delay: float = DEBOUNCE_MAX_DELAY):
+        self.quiet = quiet
+        self.max_delay = max_delay
+        self.cond = threading.Condition()
+        self.first_event = None
+        self.last_event = None
+        self.reasons = []
+
+    def fire(self, reason: str):
+        """Record a relevant change."""
+        with self.cond:
+            now = time.monotonic()
+            if self.first_event is None:
+                self.first_event = now
+            self.last_event = now
+            self.reasons.append(reason)
+            self.cond.notify_all()
+
+    def wait(self, timeout: float) -> List[str]:
+        """Block until a burst of events has settled or timeout expires.
+
+        Returns the reasons collected for the burst (empty when the timer expired).
+        """
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            while True:
+                now = time.monotonic()
+                if self.first_event is not None:
+                    ready_at = min(self.last_event + self.quiet, self.first_event + self.max_delay)
+                    if now >= ready_at:
+                        reasons = self.reasons
+                        self.first_event = self.last_event = None
+                        self.reasons = []
+                        return reasons
+                    wake_at = ready_at
+                else:
+                    if now >= deadline:
+                        return []
+                    wake_at = deadline
+                self.cond.wait(wake_at - now)
+
+
+def relevant_change(kind: str, data) -> Optional[str]:
+    """Return a short description if an HA event can change the camera list, else None."""
+    if kind == "entity_registry_updated":
+        entity_id = data.get("entity_id", "")
+        if entity_id.startswith("camera."):
+            return f"entity registry: {entity_id} {data.get('action', 'update')}"
+
+    elif kind == "device_registry_updated":
+        action = data.get("action", "update")
+        changes = data.get("changes") or {}
+        if action != "update" or DEVICE_CONFIG_FIELDS & set(changes):
+            return f"device registry: {data.get('device_id', '?')} {action}"
+
+    elif kind == "state_changed":
+        entity_id = data.get("entity_id", "")
+        if not entity_id.startswith("camera."):
+            return None
+        old_state = data.get("old_state")
+        new_state = data.get("new_state")
+        if old_state is None:
+            return f"{entity_id} added"
+        if new_state is None:
+            return f"{entity_id} removed"
+        old_attrs = old_state.get("attributes", {})
+        new_attrs = new_state.get("attributes", {})
+        for attr in CAMERA_CONFIG_ATTRIBUTES:
+            if old_attrs.get(attr) != new_attrs.get(attr):
+                return f"{entity_id} {attr} changed"
+
+    elif kind == "config_entries":
+        # First message lists every entry with type None; later ones are real changes
+        for change in data:
+            entry = change.get("entry", {})
+            if change.get("type") and entry.get("domain") in CAMERA_CONFIG_DOMAINS:
+                return f"config entry: {entry['domain']} {change['type']}"
+
+    return None
+
+
+def camera_registry_change(data: Dict, entity_ids: set) -> bool:
+    """Apply an entity_registry_updated event to the set of camera entity_ids; True if it changed."""
+    entity_id = data.get("entity_id", "")
+    if not entity_id.startswith("camera."):
+        return False
+    before = set(entity_ids)
+    action = data.get("action")
+    if action == "create":
+        entity_ids.add(entity_id)
+    elif action == "remove":
+        entity_ids.discard(entity_id)
+    elif data.get("old_entity_id"):
+        entity_ids.discard(data["old_entity_id"])
+        entity_ids.add(entity_id)
+    return entity_ids != before
+
+
+def get_camera_entity_ids() -> List[str]:
+    """entity_ids of every camera state (rendered by HA), or of the registry's cameras if that fails."""
+    try:
+        response = HTTP_SESSION.post(f"{HA_URL}/api/template", headers=ha_headers(),
+                                     json={"template": CAMERA_IDS_TEMPLATE}, timeout=15)
+        if response.status_code != 200:
+            raise ValueError(f"HTTP {response.status_code}")
+        return json.loads(response.text)
+    except Exception as e:
+        print(f"[DEBUG] Camera entity_ids via template failed: {e}")
+        return REGISTRY_CACHE.camera_entity_ids()
+
+
+class HAEventListener(threading.Thread):
+    """Subscribe to HA WebSocket events and fire the trigger on camera-relevant changes.
+
+    Camera states are followed with a state trigger per config attribute on
+    the camera entity_ids rather than every state_changed event, so other
+    entities (and camera state or access token updates) never reach the add-on.
+    The trigger is renewed when a camera entity is added, removed or renamed.
+
+    After ping_interval seconds without a message it pings HA; a connection
+    that doesn't answer within another ping_interval is dropped (half-open
+    after an HA restart or a network change). Reconnects with backoff; while
+    disconnected the daemon still refreshes on its timer.
+    """
+
+    def __init__(self, trigger: RefreshTrigger, url: str = HA_WS_URL, token: Optional[str] = None,
+                 ping_interval: float = 60, entity_ids: Callable[[], Iterable[str]] = get_camera_entity_ids):
+        super().__init__(name="ha-events", daemon=True)
+        self.trigger = trigger
+        self.url = url
+        self.token = token or SUPERVISOR_TOKEN
+        self.ping_interval = ping_interval
+        self.entity_ids = entity_ids
+        self.message_id = 0
+
+    def run(self):
+        backoff = 5
+        while True:
+            try:
+                self.listen()
+                backoff = 5
+            except Exception as e:
+                print(f"[WARN] HA event subscription lost: {e} (retrying in {backoff}s)")
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 300)
+
+    def send(self, ws, message: Dict) -> int:
+        self.message_id += 1
+        message["id"] = self.message_id
+        ws.send(json.dumps(message))
+        return self.message_id
+
+    def subscribe_camera_states(self, ws, entity_ids: set) -> Optional[int]:
+        """Subscribe to config attribute changes of the given cameras; None if there are none."""
+        if not entity_ids:
+            return None
+        return self.send(ws, {"type": "subscribe_trigger", "trigger": [
+            {"platform": "state", "entity_id": sorted(entity_ids), "attribute": attr}
+            for attr in CAMERA_CONFIG_ATTRIBUTES]})
+
+    def listen(self):
+        """Connect, authenticate, subscribe and process events until the connection drops."""
+        import websocket
+
+        ws = websocket.create_connection(self.url, timeout=30)
+        try:
+            self.message_id = 0
+            if json.loads(ws.recv()).get("type") != "auth_required":
+                raise ValueError("unexpected WebSocket greeting")
+            ws.send(json.dumps({"type": "auth", "access_token": self.token}))
+            reply = json.loads(ws.recv())
+            if reply.get("type") != "auth_ok":
+                raise ValueError(f"authentication failed: {reply.get('message', reply.get('type'))}")
+
+            subscriptions = {}
+            for event_type in ["entity_registry_updated", "device_registry_updated"]:
+                sub_id = self.send(ws, {"type": "subscribe_events", "event_type": event_type})
+                subscriptions[sub_id] = event_type
+            subscriptions[self.send(ws, {"type": "config_entries/subscribe"})] = "config_entries"
+            cameras = set(self.entity_ids())
+            states_id = self.subscribe_camera_states(ws, cameras)
+            if states_id is not None:
+                subscriptions[states_id] = "state_changed"
+            print(f"[INFO] Subscribed to HA registry, config entry and camera state events ({len(cameras)} cameras)")
+
+            ws.settimeout(self.ping_interval)
+            pinged = False
+            while True:
+                try:
+                    msg = json.loads(ws.recv())
+                except websocket.WebSocketTimeoutException:
+                    if pinged:
+                        raise ConnectionError(f"no answer to ping within {self.ping_interval:.0f}s")
+                    self.send(ws, {"type": "ping"})
+                    pinged = True
+                    continue
+                pinged = False
+
+                if msg.get("type") == "result" and not msg.get("success", True):
+                    print(f"[WARN] HA subscription {subscriptions.get(msg.get('id'))} failed: {msg.get('error')}")
+                if msg.get("type") != "event":
+                    continue
+                kind = subscriptions.get(msg.get("id"))
+                event = msg.get("event")
+                if kind == "state_changed":
+                    # State trigger variables -> state_changed event data
+                    fired = ((event or {}).get("variables") or {}).get("trigger") or {}
+                    event = {"entity_id": fired.get("entity_id", ""), "old_state": fired.get("from_state"),
+                             "new_state": fired.get("to_state")}
+                elif kind != "config_entries":
+                    event = (event or {}).get("data", {})
+                reason = relevant_change(kind, event or {})
+                if reason:
+                    print(f"[DEBUG] Change detected: {reason}")
+                    self.trigger.fire(reason)
+                if kind == "entity_registry_updated" and camera_registry_change(event, cameras):
+                    if states_id is not None:
+                        self.send(ws, {"type": "unsubscribe_events", "subscription": states_id})
+                        del subscriptions[states_id]
+                    states_id = self.subscribe_camera_states(ws, cameras)
+                    if states_id is not None:
+                        subscriptions[states_id] = "state_changed"
+        finally:
+            ws.close()
+
+
+def start_event_listener(url: str = HA_WS_URL) -> Optional[RefreshTrigger]:
+    """Start listening for HA events; returns None if WebSocket support is unavailable."""
+    try:
+        import websocket  # noqa: F401
+    except ImportError:
+        print("[WARN] websocket-client not installed, falling back to timed refresh")
+        return None
+    trigger = RefreshTrigger()
+    HAEventListener(trigger, url).start()
+    return trigger
+
+
+def notify_config_changed(pid: Optional[int]):
+    """Tell run.sh (SIGHUP) that monocle.json changed and the gateway needs a restart."""
+    if not pid:
+        return
+    try:
+        os.kill(pid, signal.SIGHUP)
+    except OSError as e:
+        print(f"[WARN] Could not notify process {pid}: {e}")
+
+
+def run_daemon(options: Dict, notify_pid: Optional[int] = None,
+               config_path: str = "/etc/monocle/monocle.json", refresh_now: bool = False,
+               scheduler: Optional[DiscoveryScheduler] = None, stop: Optional[threading.Event] = None):
+    """
+    Refresh the camera list forever in one process.
+
+    HTTP sessions, the UniFi Protect login and parsed registries survive between
+    cycles. The config is only written, and notify_pid signalled, when the
+    generated config differs from the one on disk.
+
+    With refresh_mode "events", HA WebSocket events trigger a (debounced)
+    refresh as soon as cameras change; the timer stays as a safety net.
+
+    refresh_now runs the first cycle right away, for when run.sh started the
+    gateway from the discovery snapshot instead of a fresh discovery.
+
+    Runs until stop is set; timed waits go through stop.wait().
+    """
+    scheduler = scheduler or DiscoveryScheduler(options.get("refresh_interval", 300))
+    stop = stop or threading.Event()
+    last_config = read_monocle_config(config_path)
+    trigger = start_event_listener() if options.get("refresh_mode") == "events" else None
+
+    # Keep UniFi Protect camera state current from its updates stream
+    global PROTECT_TRACK_UPDATES, PROTECT_CHANGE_CALLBACK
+    PROTECT_TRACK_UPDATES = True
+    if trigger:
+        PROTECT_CHANGE_CALLBACK = trigger.fire
+    print(f"[INFO] Discovery daemon started (refresh every ~{scheduler.interval}s"
+          f"{' or on HA events' if trigger else ''})")
+
+    while not stop.is_set():
+        # Unless warm-started, run.sh has just done the initial discovery, so wait first
+        delay = 0 if refresh_now else scheduler.next_delay()
+        refresh_now = False
+        if trigger:
+            reasons = trigger.wait(delay)
+        else:
+            stop.wait(delay)
+            reasons = []
+        if stop.is_set():
+            break
+        if reasons:
+            print(f"[INFO] Refreshing camera list ({len(reasons)} change(s), e.g. {reasons[0]})...")
+        else:
+            print("[INFO] Refreshing camera list...")
+        try:
+            diff = refresh_monocle_config(options, config_path, last_config)
+        except Exception as e:
+            scheduler.record_failure()
+            print(f"[ERROR] Camera discovery failed (attempt {scheduler.failures}): {e}")
+            continue
+        scheduler.record_success()
+
+        last_config = read_monocle_config(config_path)
+        if not any(diff.values()):
+            print("[INFO] No camera changes detected")
+            continue
+
+        print(f"[INFO] Camera configuration changed: {format_config_diff(diff)}")
+        notify_config_changed(notify_pid)
+    print("[INFO] Discovery daemon stopped")
+
+
+# Exit status of a one-shot run with --exit-code when the camera list changed
+EXIT_CONFIG_CHANGED = 3
+# Exit status of --from-snapshot when there is no snapshot to start from
+EXIT_NO_SNAPSHOT = 4
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(description="Discover HA cameras and write the Monocle config")
+    parser.add_argument("--daemon", action="store_true",
+                        help="keep running and refresh every refresh_interval seconds")
+    parser.add_argument("--notify-pid", type=int,
+                        help="send SIGHUP to this PID when the config changes (daemon mode)")
+    parser.add_argument("--exit-code", action="store_true",
+                        help=f"exit with {EXIT_CONFIG_CHANGED} if cameras were added, removed or changed")
+    parser.add_argument("--from-snapshot", action="store_true",
+                        help=f"write the config from the last discovery snapshot and exit "
+                             f"({EXIT_NO_SNAPSHOT} if there is none)")
+    parser.add_argument("--refresh-now", action="store_true",
+                        help="run the first daemon refresh immediately instead of after refresh_interval")
+    args = parser.parse_args()
+
+    # The daemon runs for the life of the add-on: its logs go to the add-on log as they happen
+    sys.stdout.reconfigure(line_buffering=True)
+
+    options = load_options()
+    monocle_token = options.get("monocle_token", "")
 
     if not monocle_token:
         print("[ERROR] Monocle token not configured", file=sys.stderr)
@@ -545,19 +3780,24 @@ def main():
         print("[ERROR] SUPERVISOR_TOKEN not available", file=sys.stderr)
         sys.exit(1)
 
-    print("[INFO] Starting camera discovery...")
-    write_monocle_token(monocle_token)
+    if args.daemon:
+        run_daemon(options, args.notify_pid, refresh_now=args.refresh_now)
+        return
 
-    if auto_discover:
-        cameras = discover_cameras(camera_filters if camera_filters else None, stream_quality)
-        config = generate_monocle_config(cameras)
-        write_monocle_config(config)
-    else:
-        print("[INFO] Auto-discovery disabled")
-        write_monocle_config({"cameras": []})
+    if args.from_snapshot:
+        write_monocle_token(monocle_token)
+        if not restore_monocle_config(options.get("restream", False)):
+            sys.exit(EXIT_NO_SNAPSHOT)
+        return
 
+    print("[INFO] Starting camera discovery...")
+    write_monocle_token(monocle_token)
+    diff = refresh_monocle_config(options)
     print("[INFO] Camera discovery complete")
 
+    if args.exit_code and any(diff.values()):
+        sys.exit(EXIT_CONFIG_CHANGED)
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,23 @@
+"""
+File helpers shared by discover_cameras.py and gateway_supervisor.py.
+"""
+
+import os
+import tempfile
+
+
+def write_file_atomic(path: str, text: str, mode: int = 0o644):
+    """Replace a file atomically (temp file + fsync + rename)."""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}-")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""
+Monocle Gateway process supervisor for the Auto-Monocle add-on.
+
+Runs monocle-gateway (and the go2rtc restream and discovery daemon, when
+enabled) and:
+- restarts a process only when its config file's contents changed (on SIGHUP
+  from discovery, or found by a periodic check), after checking the new config
+  parses, and without fixed sleeps: the old process is stopped, the new one
+  started at once and its port polled on every main loop tick until it
+  accepts connections (never blocking the loop, so crashes and config
+  changes of the other processes are still handled meanwhile)
+- restarts crashed processes with exponential backoff (so a discovery daemon
+  that dies doesn't leave the gateway on a stale config)
+- records restarts and outages (from stop or crash until the port is back)
+  in /data/gateway_status.json
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+from file_utils import write_file_atomic
+
+# Status file for troubleshooting
+GATEWAY_STATUS_FILE = "/data/gateway_status.json"
+# Outages kept per process in the status file
+OUTAGE_HISTORY = 20
+
+# Seconds a process may take to accept connections after starting; a config
+# change waits this long at most for a starting process before restarting it
+READY_TIMEOUT = 60.0
+# Main loop tick, and the shorter one while a process is starting (its port
+# is polled once per tick, so this is how late readiness is noticed)
+TICK = 0.5
+READY_POLL_INTERVAL = 0.2
+# Seconds between SIGTERM and SIGKILL when stopping a process
+STOP_TIMEOUT = 10.0
+# Crash restarts wait CRASH_BACKOFF_BASE * 2^n seconds, up to CRASH_BACKOFF_MAX;
+# n resets once a process has run for STABLE_AFTER seconds
+CRASH_BACKOFF_BASE = 1.0
+CRASH_BACKOFF_MAX = 60.0
+STABLE_AFTER = 60.0
+# Config files are also checked on this interval, in case a SIGHUP was missed
+CONFIG_CHECK_INTERVAL = 10.0
+
+
+def port_open(port: int, host: str = "127.0.0.1", timeout: float = 1.0) -> bool:
+    """True if something accepts TCP connections on host:port."""
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+class ManagedProcess:
+    """One supervised child process, restarted when its config changes or it crashes."""
+
+    def __init__(self, name: str, argv: List[str], config_path: Optional[str], ready_port: Optional[int],
+                 cwd: Optional[str] = None, wait_for_config: bool = False,
+                 restart_argv: Optional[List[str]] = None):
+        """
+        Args:
+            config_path: File whose changes restart the process (None: never reloaded)
+            ready_port: Local TCP port that accepts connections once the process is ready
+                        (None: ready as soon as it has started)
+            wait_for_config: Don't start the process until config_path exists
+            restart_argv: Command line for every start after the first (default argv)
+        """
+        self.name = name
+        self.argv = argv
+        self.restart_argv = restart_argv or argv
+        self.config_path = config_path
+        self.ready_port = ready_port
+        self.cwd = cwd
+        self.wait_for_config = wait_for_config
+        self.process: Optional[subprocess.Popen] = None
+        self.started_at: Optional[float] = None
+        self.ready_at: Optional[float] = None
+        self.ready_warned = False
+        self.config_hash: Optional[str] = None
+        self.crashes_in_row = 0
+        self.restart_at: Optional[float] = None  # pending crash restart
+        self.outage_start: Optional[float] = None
+        self.outage_reason = ""
+        self.status = {"restarts": {"reload": 0, "crash": 0}, "last_exit": None,
+                       "outage_seconds_total": 0.0, "outages": []}
+
+    def read_config_hash(self) -> Optional[str]:
+        """sha256 of the config file, or None if it doesn't exist or there is none."""
+        if not self.config_path:
+            return None
+        try:
+            with open(self.config_path, "rb") as f:
+                return hashlib.sha256(f.read()).hexdigest()
+        except OSError:
+            return None
+
+    def config_valid(self) -> bool:
+        """The config parses as JSON (monocle.json, and go2rtc.yaml as discovery writes it)."""
+        try:
+            with open(self.config_path) as f:
+                json.load(f)
+            return True
+        except (OSError, ValueError) as e:
+            print(f"[ERROR] {self.name}: not applying invalid config {self.config_path}: {e}")
+            return False
+
+    @property
+    def running(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        self.config_hash = self.read_config_hash()
+        argv = self.argv if self.process is None else self.restart_argv
+        self.process = subprocess.Popen(argv, cwd=self.cwd)
+        self.started_at = time.monotonic()
+        self.ready_at = None
+        self.ready_warned = False
+        self.restart_at = None
+        print(f"[INFO] Started {self.name} (pid {self.process.pid})")
+
+    def stop(self, timeout: float = STOP_TIMEOUT):
+        """SIGTERM, then SIGKILL if the process hasn't exited within timeout."""
+        if not self.running:
+            return
+        self.process.terminate()
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            print(f"[WARN] {self.name} didn't stop within {timeout:.0f}s, killing it")
+            self.process.kill()
+            self.process.wait()
+
+    @property
+    def starting(self) -> bool:
+        """Running, not accepting connections yet, and still within READY_TIMEOUT of starting."""
+        return (self.running and self.ready_at is None
+                and time.monotonic() - self.started_at < READY_TIMEOUT)
+
+    def check_ready(self) -> bool:
+        """Whether the process is ready; if it isn't yet, its port is tried once, without waiting."""
+        if self.ready_at is not None:
+            return True
+        if not self.running:
+            return False
+        if self.ready_port is not None and not port_open(self.ready_port, timeout=READY_POLL_INTERVAL):
+            if not self.ready_warned and time.monotonic() - self.started_at >= READY_TIMEOUT:
+                print(f"[WARN] {self.name} not accepting connections on port {self.ready_port} "
+                      f"after {READY_TIMEOUT:.0f}s")
+                self.ready_warned = True
+            return False
+        self.ready_at = time.monotonic()
+        if self.ready_port is not None:
+            print(f"[INFO] {self.name} ready on port {self.ready_port} "
+                  f"({self.ready_at - self.started_at:.1f}s after start)")
+        self.end_outage()
+        return True
+
+    def begin_outage(self, reason: str):
+        if self.outage_start is None:
+            self.outage_start = time.monotonic()
+            self.outage_reason = reason
+
+    def end_outage(self):
+        if self.outage_start is None:
+            return
+        seconds = round(time.monotonic() - self.outage_start, 2)
+        now = time.time()
+        self.status["outages"] = (self.status["outages"] + [
+            {"start": int(now - seconds), "end": int(now), "seconds": seconds, "reason": self.outage_reason}
+        ])[-OUTAGE_HISTORY:]
+        self.status["outage_seconds_total"] = round(self.status["outage_seconds_total"] + seconds, 2)
+        print(f"[INFO] {self.name} outage ({self.outage_reason}): {seconds:.1f}s")
+        self.outage_start = None
+
+    def restart(self, reason: str):
+        """Stop and start again; the outage lasts until the new process is ready."""
+        self.status["restarts"][reason] += 1
+        self.begin_outage(reason)
+        stop_start = time.monotonic()
+        self.stop()
+        self.start()
+        print(f"[INFO] Restarted {self.name} ({reason}, stopped in {time.monotonic() - stop_start:.1f}s)")
+        self.check_ready()
+
+    def snapshot(self) -> Dict:
+        return {
+            **self.status,
+            "pid": self.process.pid if self.running else None,
+            "running": self.running,
+            "ready": self.ready_at is not None,
+            "uptime_seconds": round(time.monotonic() - self.started_at, 1) if self.running else 0,
+            "config_hash": self.config_hash,
+        }
+
+
+class GatewaySupervisor:
+    """Keep the managed processes running and apply config changes."""
+
+    def __init__(self, processes: List[ManagedProcess], status_path: str = GATEWAY_STATUS_FILE):
+        self.processes = processes
+        self.status_path = status_path
+        self.reload_requested = False
+        self.stop_requested = False
+
+    def request_reload(self, *_):
+        self.reload_requested = True
+
+    def request_stop(self, *_):
+        self.stop_requested = True
+
+    def write_status(self):
+        status = {"time": int(time.time()), "processes": {p.name: p.snapshot() for p in self.processes}}
+        try:
+            write_file_atomic(self.status_path, json.dumps(status, indent=2))
+        except OSError as e:
+            print(f"[DEBUG] Could not write {self.status_path}: {e}")
+
+    def apply_config_changes(self):
+        """Restart the processes whose config file changed since they started.
+
+        A process that is still coming up isn't pulled: the change is applied
+        on a later tick, once it is ready (or READY_TIMEOUT has passed).
+        """
+        for proc in self.processes:
+            current = proc.read_config_hash()
+            if current is None or current == proc.config_hash:
+                continue
+            if not proc.config_valid():
+                # Remember it so an invalid file isn't re-reported every check
+                proc.config_hash = current
+                continue
+            if proc.starting:
+                self.reload_requested = True
+                continue
+            if proc.process is None:
+                print(f"[INFO] {proc.config_path} appeared, starting {proc.name}")
+                proc.start()
+                proc.check_ready()
+            else:
+                print(f"[INFO] {proc.config_path} changed, restarting {proc.name}")
+                proc.restart("reload")
+            self.write_status()
+
+    def check_crashes(self):
+        """Schedule a backoff restart for each process that exited, and run the ones that are due."""
+        now = time.monotonic()
+        for proc in self.processes:
+            if proc.process is None or proc.running:
+                if proc.running and proc.crashes_in_row and now - proc.started_at >= STABLE_AFTER:
+                    proc.crashes_in_row = 0
+                continue
+            if proc.restart_at is None:
+                code = proc.process.returncode
+                proc.status["last_exit"] = code
+                proc.begin_outage("crash")
+                delay = min(CRASH_BACKOFF_MAX, CRASH_BACKOFF_BASE * 2 ** proc.crashes_in_row)
+                proc.crashes_in_row += 1
+                proc.restart_at = now + delay
+                print(f"[WARN] {proc.name} exited with status {code}, restarting in {delay:.0f}s")
+                self.write_status()
+            elif now >= proc.restart_at:
+                proc.status["restarts"]["crash"] += 1
+                proc.start()
+                proc.check_ready()
+                self.write_status()
+
+    def check_readiness(self):
+        """Try the port of every process that isn't ready yet; write the status if one now is."""
+        became_ready = [proc for proc in self.processes
+                        if proc.running and proc.ready_at is None and proc.check_ready()]
+        if became_ready:
+            self.write_status()
+
+    def run(self) -> int:
+        signal.signal(signal.SIGHUP, self.request_reload)
+        signal.signal(signal.SIGTERM, self.request_stop)
+        signal.signal(signal.SIGINT, self.request_stop)
+
+        for proc in self.processes:
+            if proc.wait_for_config and proc.read_config_hash() is None:
+                print(f"[INFO] {proc.config_path} not found, {proc.name} starts once it exists")
+                continue
+            proc.start()
+        self.check_readiness()
+        self.write_status()
+
+        next_check = time.monotonic() + CONFIG_CHECK_INTERVAL
+        while not self.stop_requested:
+            if self.reload_requested or time.monotonic() >= next_check:
+                self.reload_requested = False
+                next_check = time.monotonic() + CONFIG_CHECK_INTERVAL
+                self.apply_config_changes()
+            self.check_crashes()
+            self.check_readiness()
+            time.sleep(READY_POLL_INTERVAL if any(proc.starting for proc in self.processes) else TICK)
+
+        print("[INFO] Stopping...")
+        # Discovery first, then the gateway, so it doesn't see its restream sources vanish
+        for proc in reversed(self.processes):
+            proc.stop()
+        self.write_status()
+        return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run Monocle Gateway and apply config changes")
+    parser.add_argument("--gateway", default="/opt/monocle/monocle-gateway", help="gateway binary")
+    parser.add_argument("--gateway-config", default="/etc/monocle/monocle.json")
+    parser.add_argument("--gateway-port", type=int, default=443, help="port polled for gateway readiness")
+    parser.add_argument("--restream-config",
+                        help="also run go2rtc with this config (restream option)")
+    parser.add_argument("--go2rtc", default="/opt/monocle/go2rtc", help="go2rtc binary")
+    parser.add_argument("--restream-port", type=int, default=8554, help="port polled for go2rtc readiness")
+    parser.add_argument("--discovery-daemon", action="store_true",
+                        help="also run discover_cameras.py --daemon, signalling this process on changes")
+    parser.add_argument("--discovery", default="/opt/monocle/discover_cameras.py", help="discovery script")
+    parser.add_argument("--refresh-now", action="store_true",
+                        help="first discovery daemon refresh right away (warm start)")
+    parser.add_argument("--status-file", default=GATEWAY_STATUS_FILE)
+    args = parser.parse_args()
+
+    # Logs go to the add-on log as they happen
+    sys.stdout.reconfigure(line_buffering=True)
+
+    processes = []
+    # go2rtc first: the gateway's streams come from it
+    if args.restream_config:
+        processes.append(ManagedProcess("go2rtc", [args.go2rtc, "-config", args.restream_config],
+                                        args.restream_config, args.restream_port, wait_for_config=True))
+    processes.append(ManagedProcess("monocle-gateway", [args.gateway], args.gateway_config, args.gateway_port,
+                                    cwd=os.path.dirname(args.gateway)))
+    if args.discovery_daemon:
+        # Config changes come back to this process as SIGHUP. A restarted daemon
+        # refreshes right away: the config may have gone stale while it was down
+        argv = [sys.executable, args.discovery, "--daemon", "--notify-pid", str(os.getpid())]
+        processes.append(ManagedProcess("discovery", argv + (["--refresh-now"] if args.refresh_now else []),
+                                        None, None, restart_argv=argv + ["--refresh-now"]))
+    sys.exit(GatewaySupervisor(processes, args.status_file).run())
+
+
+if __name__ == "__main__":
+    main()
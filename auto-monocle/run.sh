@@ -6,11 +6,14 @@ echo "  Auto-Monocle Add-on Starting"
 echo "========================================"
 
 MONOCLE_CONFIG="/etc/monocle/monocle.json"
+RESTREAM_CONFIG="/etc/monocle/go2rtc.yaml"
 
 # Read configuration
 MONOCLE_TOKEN=$(bashio::config 'monocle_token')
 AUTO_DISCOVER=$(bashio::config 'auto_discover')
 REFRESH_INTERVAL=$(bashio::config 'refresh_interval')
+REFRESH_MODE=$(bashio::config 'refresh_mode')
+RESTREAM=$(bashio::config 'restream')
 
 if [ -z "$MONOCLE_TOKEN" ] || [ "$MONOCLE_TOKEN" = "null" ]; then
     bashio::log.error "Monocle token not configured!"
@@ -18,9 +21,17 @@ if [ -z "$MONOCLE_TOKEN" ] || [ "$MONOCLE_TOKEN" = "null" ]; then
     exit 1
 fi
 
-# Run camera discovery (also writes token file)
-bashio::log.info "Running camera discovery..."
-python3 /opt/monocle/discover_cameras.py
+# Start from the last discovery snapshot if there is one, so the gateway comes
+# up right away and discovery refreshes it in the background; otherwise run
+# discovery now (both also write the token file)
+WARM_START=0
+if [ "$AUTO_DISCOVER" = "true" ] && python3 /opt/monocle/discover_cameras.py --from-snapshot; then
+    bashio::log.info "Started from the discovery snapshot, refreshing cameras in the background..."
+    WARM_START=1
+else
+    bashio::log.info "Running camera discovery..."
+    python3 /opt/monocle/discover_cameras.py
+fi
 
 if [ ! -f "/etc/monocle/monocle.token" ]; then
     bashio::log.error "Monocle token file not created!"
@@ -32,29 +43,33 @@ if [ "$AUTO_DISCOVER" = "true" ] && [ ! -f "$MONOCLE_CONFIG" ]; then
     exit 1
 fi
 
-# Get initial config hash
-CONFIG_HASH=$(md5sum "$MONOCLE_CONFIG" 2>/dev/null | cut -d' ' -f1 || echo "none")
-
-# Start camera refresh in background (restarts gateway on changes)
-if [ "$AUTO_DISCOVER" = "true" ]; then
+# Poll mode refreshes from a background loop here; the daemon modes run under
+# the gateway supervisor below. Config changes reach the supervisor (this PID
+# once exec'd) as SIGHUP; it restarts whatever process's config changed, and
+# also notices changes on its own
+if [ "$AUTO_DISCOVER" = "true" ] && [ "$REFRESH_MODE" = "poll" ]; then
+    # After a warm start, refresh as soon as the gateway is up
+    REFRESH_DELAY="$REFRESH_INTERVAL"
+    if [ "$WARM_START" = "1" ]; then
+        REFRESH_DELAY=5
+    fi
     (
         while true; do
-            sleep "$REFRESH_INTERVAL"
+            sleep "$REFRESH_DELAY"
+            REFRESH_DELAY="$REFRESH_INTERVAL"
             bashio::log.info "Refreshing camera list..."
-            python3 /opt/monocle/discover_cameras.py
 
-            # Check if config changed
-            NEW_HASH=$(md5sum "$MONOCLE_CONFIG" 2>/dev/null | cut -d' ' -f1 || echo "none")
-            if [ "$NEW_HASH" != "$CONFIG_HASH" ]; then
-                bashio::log.info "Camera configuration changed, restarting Monocle Gateway..."
-                CONFIG_HASH="$NEW_HASH"
-                pkill -f monocle-gateway || true
-                sleep 2
-                cd /opt/monocle
-                ./monocle-gateway &
-                bashio::log.info "Monocle Gateway restarted"
-            else
+            # Exit status 3 means cameras were added, removed or changed
+            # (reordering or formatting alone never rewrites the config)
+            DISCOVERY_STATUS=0
+            python3 /opt/monocle/discover_cameras.py --exit-code || DISCOVERY_STATUS=$?
+            if [ "$DISCOVERY_STATUS" = "3" ]; then
+                bashio::log.info "Camera configuration changed, reloading Monocle Gateway..."
+                kill -HUP $$ || true
+            elif [ "$DISCOVERY_STATUS" = "0" ]; then
                 bashio::log.info "No camera changes detected"
+            else
+                bashio::log.warning "Camera discovery failed (exit $DISCOVERY_STATUS)"
             fi
         done
     ) &
@@ -63,10 +78,22 @@ fi
 bashio::log.info "Starting Monocle Gateway..."
 bashio::log.info "Make sure port 443 is forwarded to this add-on"
 
-# Start Monocle Gateway (in foreground to keep container alive)
+# The supervisor runs the gateway (and go2rtc, the discovery daemon) in place of this
+# shell. An ignored SIGHUP stays ignored across exec, so one sent before the
+# supervisor installs its handler can't kill it (its periodic check applies it)
+SUPERVISOR_ARGS=""
+if [ "$RESTREAM" = "true" ]; then
+    SUPERVISOR_ARGS="--restream-config $RESTREAM_CONFIG"
+fi
+# The discovery daemon keeps its sessions and parsed registries between
+# refreshes and sends SIGHUP only when the generated config actually changed;
+# the supervisor restarts it if it exits
+if [ "$AUTO_DISCOVER" = "true" ] && [ "$REFRESH_MODE" != "poll" ]; then
+    SUPERVISOR_ARGS="$SUPERVISOR_ARGS --discovery-daemon"
+    if [ "$WARM_START" = "1" ]; then
+        SUPERVISOR_ARGS="$SUPERVISOR_ARGS --refresh-now"
+    fi
+fi
+trap '' HUP
 cd /opt/monocle
-./monocle-gateway &
-GATEWAY_PID=$!
-
-# Wait for gateway process
-wait $GATEWAY_PID
+exec python3 /opt/monocle/gateway_supervisor.py $SUPERVISOR_ARGS
@@ -0,0 +1,42 @@
+import os
+import shutil
+import ssl
+import subprocess
+import sys
+
+import pytest
+
+# discover_cameras.py and gateway_supervisor.py are scripts, not a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import discover_cameras as dc  # noqa: E402
+
+# Files discover_cameras.py keeps in /data, by module constant
+DATA_FILES = ["DISCOVERY_STATUS_FILE", "DISCOVERY_METRICS_FILE", "CIRCUIT_BREAKER_FILE", "GO2RTC_ENDPOINT_FILE",
+              "ONVIF_CACHE_FILE", "STREAM_HEALTH_FILE", "DISCOVERY_SNAPSHOT_FILE"]
+
+
+@pytest.fixture(autouse=True)
+def data_dir(monkeypatch, tmp_path):
+    """Keep /data files in a temp dir, with no breaker state from earlier tests."""
+    directory = tmp_path / "data"
+    for name in DATA_FILES:
+        monkeypatch.setattr(dc, name, str(directory / os.path.basename(getattr(dc, name))))
+    monkeypatch.setattr(dc, "PROFILE_DIR", str(directory))
+    monkeypatch.setattr(dc.CIRCUIT_BREAKERS, "breakers", None)
+    return directory
+
+
+@pytest.fixture(scope="session")
+def tls_context(tmp_path_factory):
+    """Server TLS context with a self-signed certificate (UniFi NVRs use one too)."""
+    if not shutil.which("openssl"):
+        pytest.skip("openssl not available")
+    directory = tmp_path_factory.mktemp("tls")
+    cert, key = directory / "cert.pem", directory / "key.pem"
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+                    "-subj", "/CN=127.0.0.1", "-keyout", str(key), "-out", str(cert)],
+                   check=True, capture_output=True)
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    return context
@@ -0,0 +1,278 @@
+"""
+Local stand-in servers for tests.
+
+StubServer speaks just enough RFC 6455 (handshake, unfragmented text,
+binary and close frames) for the HA event listener and the UniFi Protect
+updates stream. Each WebSocket connection is handed to a script function that
+talks to the client and returns when it wants the connection closed.
+
+RtspServer answers OPTIONS and DESCRIBE for a few kinds of camera, by path.
+"""
+
+import base64
+import hashlib
+import http.server
+import re
+import socketserver
+import struct
+import threading
+import time
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+OPCODE_TEXT = 0x1
+OPCODE_BINARY = 0x2
+OPCODE_CLOSE = 0x8
+OPCODE_PING = 0x9
+OPCODE_PONG = 0xA
+
+
+class WebSocket:
+    """Server side of one WebSocket connection."""
+
+    def __init__(self, rfile, wfile):
+        self.rfile = rfile
+        self.wfile = wfile
+        # Pongs may be sent from a reader thread while the script sends
+        self.send_lock = threading.Lock()
+
+    def send(self, data):
+        """Send text (str) or binary (bytes) in one frame."""
+        opcode = OPCODE_TEXT if isinstance(data, str) else OPCODE_BINARY
+        self.send_frame(opcode, data.encode() if isinstance(data, str) else data)
+
+    def send_frame(self, opcode: int, payload: bytes):
+        header = bytes([0x80 | opcode])
+        if len(payload) < 126:
+            header += bytes([len(payload)])
+        elif len(payload) < 1 << 16:
+            header += bytes([126]) + struct.pack(">H", len(payload))
+        else:
+            header += bytes([127]) + struct.pack(">Q", len(payload))
+        with self.send_lock:
+            self.wfile.write(header + payload)
+            self.wfile.flush()
+
+    def recv(self):
+        """Next text or binary message from the client, or None once it closed."""
+        while True:
+            head = self.rfile.read(2)
+            if len(head) < 2:
+                return None
+            opcode = head[0] & 0x0F
+            length = head[1] & 0x7F
+            if length == 126:
+                length = struct.unpack(">H", self.rfile.read(2))[0]
+            elif length == 127:
+                length = struct.unpack(">Q", self.rfile.read(8))[0]
+            mask = self.rfile.read(4) if head[1] & 0x80 else b"\0\0\0\0"
+            payload = bytes(b ^ mask[i % 4] for i, b in enumerate(self.rfile.read(length)))
+            if opcode == OPCODE_CLOSE:
+                return None
+            if opcode == OPCODE_PING:
+                self.send_frame(OPCODE_PONG, payload)
+                continue
+            if opcode == OPCODE_PONG:
+                continue
+            return payload.decode() if opcode == OPCODE_TEXT else payload
+
+    def close(self):
+        try:
+            self.send_frame(OPCODE_CLOSE, struct.pack(">H", 1000))
+        except OSError:
+            pass
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    """Plain HTTP routes from server.routes, WebSocket upgrades to server.websocket_script."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def handle_request(self, method: str):
+        with self.server.lock:
+            self.server.requests.append((method, self.path, dict(self.headers)))
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self.headers.get("Upgrade", "").lower() == "websocket":
+            self.upgrade()
+            return
+        route = self.server.routes.get((method, self.path.split("?")[0]))
+        status, headers, data = route(self, body) if callable(route) else (route or (404, {}, b""))
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def upgrade(self):
+        if self.server.websocket_script is None:
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        key = self.headers["Sec-WebSocket-Key"]
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+        self.send_response(101)
+        self.send_header("Upgrade", "websocket")
+        self.send_header("Connection", "Upgrade")
+        self.send_header("Sec-WebSocket-Accept", accept)
+        self.end_headers()
+        self.wfile.flush()
+        ws = WebSocket(self.rfile, self.wfile)
+        try:
+            self.server.websocket_script(ws, self)
+        except (OSError, ValueError):
+            pass
+        finally:
+            ws.close()
+        self.close_connection = True
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+
+class StubServer(http.server.ThreadingHTTPServer):
+    """HTTP(S) server on a free local port, serving in a background thread.
+
+    routes: (method, path) -> (status, headers, body bytes), or a function
+    (handler, request body) returning one.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, routes=None, websocket_script=None, ssl_context=None):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.routes = routes or {}
+        self.websocket_script = websocket_script
+        self.requests = []
+        self.lock = threading.Lock()
+        if ssl_context:
+            self.socket = ssl_context.wrap_socket(self.socket, server_side=True)
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def address(self) -> str:
+        return f"127.0.0.1:{self.server_address[1]}"
+
+    def count(self, method: str, path: str) -> int:
+        with self.lock:
+            return sum(1 for m, p, _ in self.requests if m == method and p.split("?")[0] == path)
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+
+SDP = ("v=0\r\no=- 0 0 IN IP4 127.0.0.1\r\ns=Stub\r\n"
+       "m=video 0 RTP/AVP 96\r\na=rtpmap:96 H264/90000\r\n"
+       "m=audio 0 RTP/AVP 97\r\na=rtpmap:97 MPEG4-GENERIC/16000/1\r\n")
+AUDIO_ONLY_SDP = "v=0\r\ns=Stub\r\nm=audio 0 RTP/AVP 0\r\na=rtpmap:0 PCMU/8000\r\n"
+
+
+class RtspHandler(socketserver.StreamRequestHandler):
+    """
+    Camera behaviour by path:
+
+        /ok          DESCRIBE answers with H264 video and AAC audio
+        /digest      Digest auth (qop=auth) as server.username/password, then /ok
+        /basic       Basic auth, then /ok
+        /audio       SDP without a video track
+        /missing     DESCRIBE answers 404
+        /slow        never answers DESCRIBE
+        /garbage     answers with something that isn't RTSP
+    """
+
+    def read_request(self):
+        request_line = self.rfile.readline(4096).decode(errors="replace").strip()
+        if not request_line:
+            return None
+        headers = {}
+        while True:
+            line = self.rfile.readline(4096).decode(errors="replace").strip()
+            if not line:
+                break
+            key, _, value = line.partition(":")
+            headers[key.strip().lower()] = value.strip()
+        return request_line, headers
+
+    def reply(self, cseq: str, status: int, reason: str, headers=None, body: str = ""):
+        lines = [f"RTSP/1.0 {status} {reason}", f"CSeq: {cseq}"]
+        lines += [f"{k}: {v}" for k, v in (headers or {}).items()]
+        if body:
+            lines += ["Content-Type: application/sdp", f"Content-Length: {len(body.encode())}"]
+        self.wfile.write(("\r\n".join(lines) + "\r\n\r\n" + body).encode())
+
+    def authorized(self, method: str, header: str, mode: str) -> bool:
+        server = self.server
+        if mode == "basic":
+            expected = base64.b64encode(f"{server.username}:{server.password}".encode()).decode()
+            return header == f"Basic {expected}"
+        fields = dict(re.findall(r'(\w+)="?([^",]*)"?', header))
+        md5 = lambda text: hashlib.md5(text.encode()).hexdigest()  # noqa: E731
+        ha1 = md5(f"{server.username}:{server.realm}:{server.password}")
+        ha2 = md5(f"{method}:{fields.get('uri')}")
+        expected = md5(f"{ha1}:{server.nonce}:{fields.get('nc')}:{fields.get('cnonce')}:auth:{ha2}")
+        return header.startswith("Digest ") and fields.get("username") == server.username \
+            and fields.get("nonce") == server.nonce and fields.get("response") == expected
+
+    def handle(self):
+        while True:
+            request = self.read_request()
+            if request is None:
+                return
+            request_line, headers = request
+            method, url, _ = request_line.split(" ", 2)
+            with self.server.lock:
+                self.server.requests.append((method, url, headers))
+            cseq = headers.get("cseq", "0")
+            mode = url.rsplit("/", 1)[-1]
+
+            if mode == "garbage":
+                self.wfile.write(b"HTTP/1.1 400 Bad Request\r\n\r\n")
+                return
+            if method == "OPTIONS":
+                self.reply(cseq, 200, "OK", {"Public": "OPTIONS, DESCRIBE, SETUP, PLAY, TEARDOWN"})
+                continue
+            if mode == "slow":
+                time.sleep(5)
+                return
+            if mode in ("digest", "basic") and not self.authorized(method, headers.get("authorization", ""), mode):
+                challenge = (f'Digest realm="{self.server.realm}", nonce="{self.server.nonce}", qop="auth"'
+                             if mode == "digest" else f'Basic realm="{self.server.realm}"')
+                self.reply(cseq, 401, "Unauthorized", {"WWW-Authenticate": challenge})
+            elif mode == "missing":
+                self.reply(cseq, 404, "Not Found")
+            elif mode == "audio":
+                self.reply(cseq, 200, "OK", body=AUDIO_ONLY_SDP)
+            else:
+                self.reply(cseq, 200, "OK", body=SDP)
+
+
+class RtspServer(socketserver.ThreadingTCPServer):
+    """RTSP stand-in camera on a free local port (see RtspHandler for the paths)."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, username: str = "admin", password: str = "secret"):
+        super().__init__(("127.0.0.1", 0), RtspHandler)
+        self.username = username
+        self.password = password
+        self.realm = "Stub Camera"
+        self.nonce = "0123456789abcdef"
+        self.requests = []
+        self.lock = threading.Lock()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def url(self, path: str, credentials: str = "") -> str:
+        return f"rtsp://{credentials + '@' if credentials else ''}127.0.0.1:{self.server_address[1]}/{path}"
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
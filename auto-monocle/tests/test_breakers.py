@@ -0,0 +1,64 @@
+import json
+import threading
+
+import pytest
+
+import discover_cameras as dc
+
+
+def fail():
+    raise ConnectionError("down")
+
+
+def test_breaker_opens_after_threshold_and_closes_on_success(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(dc.time, "time", lambda: now[0])
+    breakers = dc.CircuitBreakers()
+
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            breakers.call("nvr", fail)
+    with pytest.raises(dc.SourceSkipped):
+        breakers.call("nvr", lambda: "ok")
+
+    # Half-open after the cooldown: another failure doubles it
+    now[0] += 60
+    with pytest.raises(ConnectionError):
+        breakers.call("nvr", fail)
+    assert breakers.get("nvr").open_until == now[0] + 120
+
+    now[0] += 120
+    assert breakers.call("nvr", lambda: "ok") == "ok"
+    assert breakers.get("nvr").failures == 0
+    assert json.loads(open(breakers.path).read()) == {}
+
+
+def test_state_survives_a_new_process(data_dir):
+    first = dc.CircuitBreakers()
+    with pytest.raises(ConnectionError):
+        first.call("go2rtc", fail)
+
+    assert dc.CircuitBreakers().get("go2rtc").failures == 1
+
+
+def test_concurrent_failures_are_all_saved():
+    breakers = dc.CircuitBreakers()
+    names = [f"source {i}" for i in range(32)]
+    start = threading.Barrier(len(names))
+
+    def run(name):
+        start.wait()
+        try:
+            breakers.call(name, fail)
+        except ConnectionError:
+            pass
+
+    threads = [threading.Thread(target=run, args=(name,)) for name in names]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    saved = json.loads(open(breakers.path).read())
+    assert sorted(saved) == sorted(names)
+    assert all(state["failures"] == 1 for state in saved.values())
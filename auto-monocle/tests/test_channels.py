@@ -0,0 +1,79 @@
+import pytest
+
+import discover_cameras as dc
+
+
+def channels(high=8000, medium=2000, low=500, **overrides):
+    """Protect channels 0-2 with the given bitrates in kbps."""
+    result = [{"id": i, "rtspAlias": f"alias{i}", "enabled": True, "bitrate": kbps * 1000}
+              for i, kbps in enumerate([high, medium, low])]
+    for i, changes in overrides.items():
+        result[int(i[-1])].update(changes)
+    return result
+
+
+def camera(name, **kwargs):
+    return (name.lower(), [f"camera.{name.lower()}"], name, channels(**kwargs))
+
+
+def chosen(plan):
+    return {key: ch["id"] if ch else None for key, ch in plan.items()}
+
+
+@pytest.mark.parametrize("quality, channel", [("high", 0), ("medium", 1), ("low", 2)])
+def test_fixed_quality(quality, channel):
+    plan = dc.ChannelSelector(quality).select([camera("Porch"), camera("Yard")])
+    assert chosen(plan) == {"porch": channel, "yard": channel}
+
+
+def test_fixed_quality_without_that_channel():
+    cams = [camera("Porch", ch1={"rtspAlias": None}), camera("Yard", ch1={"enabled": False})]
+    assert chosen(dc.ChannelSelector("medium").select(cams)) == {"porch": None, "yard": None}
+
+
+def test_auto_without_budget_picks_best():
+    assert chosen(dc.ChannelSelector("auto").select([camera("Porch"), camera("Yard")])) == {"porch": 0, "yard": 0}
+
+
+def test_auto_upgrades_by_priority_within_budget():
+    selector = dc.ChannelSelector("auto", budget_mbps=11, priorities=["camera.yard=10", "Shed=-1"])
+    plan = selector.select([camera("Porch"), camera("Shed"), camera("Yard")])
+
+    # All start at 0.5 Mbps; Yard goes up to 8, then Porch (priority 0, before Shed) to 2; Shed no longer fits
+    assert chosen(plan) == {"yard": 0, "porch": 1, "shed": 2}
+
+
+def test_auto_ties_broken_by_name():
+    plan = dc.ChannelSelector("auto", budget_mbps=9).select([camera("Yard"), camera("Attic")])
+    assert chosen(plan) == {"attic": 0, "yard": 2}
+
+
+def test_fixed_override_counts_against_budget():
+    selector = dc.ChannelSelector("auto", budget_mbps=9, priorities=["Front Door=high"])
+    plan = selector.select([camera("Front Door"), camera("Porch")])
+    assert chosen(plan) == {"front door": 0, "porch": 2}
+
+
+def test_over_budget_keeps_lowest_channels(capsys):
+    plan = dc.ChannelSelector("auto", budget_mbps=0.6).select([camera("Porch"), camera("Yard")])
+    assert chosen(plan) == {"porch": 2, "yard": 2}
+    assert "over the 0.6 Mbps budget" in capsys.readouterr().out
+
+
+def test_estimated_bitrate_when_not_reported():
+    cams = [camera("Porch", ch0={"bitrate": None, "width": 1920, "height": 1080, "fps": 30},
+                   ch1={"bitrate": None, "width": 640, "height": 360, "fps": None})]
+    assert dc.ChannelSelector.channel_kbps(cams[0][3][0]) == pytest.approx(6220.8)
+    # 640x360 at the default 30 fps: 691 kbps, so channel 1 is now the cheapest
+    assert chosen(dc.ChannelSelector("auto", budget_mbps=0.7).select(cams)) == {"porch": 1}
+
+
+def test_rules_match_any_entity_id_and_first_rule_wins():
+    selector = dc.ChannelSelector("high", priorities=["camera.porch_*=low", "Porch=medium", "bad", "Yard=fast"])
+    key, _, name, chs = camera("Porch")
+    plan = selector.select([(key, ["camera.porch", "camera.porch_package"], name, chs)])
+
+    assert chosen(plan) == {"porch": 2}
+    assert selector.rule_for(["camera.porch"], "Porch") == ("medium", 0)
+    assert selector.rule_for(["camera.yard"], "Yard") == ("high", 0)
+    assert len(selector.rules) == 2
@@ -0,0 +1,76 @@
+import json
+import os
+
+import discover_cameras as dc
+
+
+def camera(name, url, tags=("@proxy",)):
+    return {"name": name, "url": url, "tags": list(tags)}
+
+
+def config(*cameras, **extra):
+    return {**extra, "cameras": list(cameras)}
+
+
+OLD = config(camera("Porch", "rtsp://a/porch"), camera("Garage", "rtsp://a/garage"),
+             camera("Front Door", "rtsp://a/front", tags=("@proxy", "door")), token="t")
+
+
+def test_diff_ignores_camera_and_tag_order():
+    reordered = config(camera("Front Door", "rtsp://a/front", tags=("door", "@proxy")),
+                       camera("Garage", "rtsp://a/garage"), camera("Porch", "rtsp://a/porch"), token="t")
+
+    assert dc.diff_monocle_configs(OLD, reordered) == {"added": [], "removed": [], "changed": []}
+    assert dc.canonical_config(OLD) == dc.canonical_config(reordered)
+
+
+def test_diff_added_removed_changed():
+    new = config(camera("Porch", "rtsp://b/porch"), camera("Front Door", "rtsp://a/front", tags=("@proxy",)),
+                 camera("Yard", "rtsp://a/yard"), token="t")
+
+    diff = dc.diff_monocle_configs(OLD, new)
+
+    assert diff == {"added": ["Yard"], "removed": ["Garage"], "changed": ["Front Door", "Porch"]}
+    assert dc.format_config_diff(diff) == "+Yard -Garage ~Front Door ~Porch"
+    assert dc.format_config_diff(dc.diff_monocle_configs(new, new)) == "no changes"
+
+
+def test_diff_against_no_config():
+    assert dc.diff_monocle_configs(None, OLD)["added"] == ["Front Door", "Garage", "Porch"]
+
+
+def test_diff_duplicate_names():
+    # Two cameras sharing a name: changing either one changes that name
+    old = config(camera("Cam", "rtsp://a/1"), camera("Cam", "rtsp://a/2"))
+    new = config(camera("Cam", "rtsp://a/2"), camera("Cam", "rtsp://a/3"))
+
+    assert dc.diff_monocle_configs(old, new)["changed"] == ["Cam"]
+    assert dc.diff_monocle_configs(old, config(*reversed(old["cameras"])))["changed"] == []
+
+
+def test_write_only_when_cameras_change(tmp_path):
+    path = str(tmp_path / "monocle" / "monocle.json")
+
+    assert dc.write_monocle_config(OLD, path)["added"] == ["Front Door", "Garage", "Porch"]
+    with open(path) as f:
+        assert json.load(f) == dc.canonical_config(OLD)
+    mtime = os.stat(path).st_mtime_ns
+
+    # Same cameras in another order: the file is left alone
+    reordered = config(*reversed(OLD["cameras"]), token="t")
+    assert dc.write_monocle_config(reordered, path) == {"added": [], "removed": [], "changed": []}
+    assert os.stat(path).st_mtime_ns == mtime
+
+    new = config(camera("Porch", "rtsp://a/porch"), token="t")
+    assert dc.write_monocle_config(new, path, previous=OLD)["removed"] == ["Front Door", "Garage"]
+    assert dc.read_monocle_config(path) == dc.canonical_config(new)
+    assert os.listdir(os.path.dirname(path)) == ["monocle.json"]
+
+
+def test_write_replaces_unreadable_config(tmp_path):
+    path = tmp_path / "monocle.json"
+    path.write_text("{not json")
+
+    assert dc.read_monocle_config(str(path)) is None
+    dc.write_monocle_config(OLD, str(path))
+    assert dc.read_monocle_config(str(path)) == dc.canonical_config(OLD)
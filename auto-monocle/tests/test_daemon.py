@@ -0,0 +1,102 @@
+import random
+
+import pytest
+
+import discover_cameras as dc
+
+NO_CHANGES = {"added": [], "removed": [], "changed": []}
+
+
+class Bounds:
+    """Stand-in RNG: uniform() returns the low or the high end of its range."""
+
+    def __init__(self, high=False):
+        self.high = high
+
+    def uniform(self, low, high):
+        return high if self.high else low
+
+
+class FakeClock:
+    """Stop event whose wait() returns at once, recording each delay; set after `waits` waits."""
+
+    def __init__(self, waits):
+        self.waits = waits
+        self.delays = []
+
+    def wait(self, delay):
+        self.delays.append(round(delay, 3))
+        return self.is_set()
+
+    def is_set(self):
+        return len(self.delays) >= self.waits
+
+
+def test_backoff_doubles_up_to_the_interval():
+    scheduler = dc.DiscoveryScheduler(300, jitter=0)
+    delays = []
+    for _ in range(7):
+        scheduler.record_failure()
+        delays.append(scheduler.next_delay())
+    assert delays == [15, 30, 60, 120, 240, 300, 300]
+
+    scheduler.record_success()
+    assert scheduler.failures == 0
+    assert scheduler.next_delay() == 300
+
+
+@pytest.mark.parametrize("failures, low, high", [(0, 270, 330), (2, 27, 33)])
+def test_jitter_bounds(failures, low, high):
+    scheduler = dc.DiscoveryScheduler(300, jitter=0.1, rng=Bounds())
+    scheduler.failures = failures
+    assert scheduler.next_delay() == pytest.approx(low)
+    scheduler.rng = Bounds(high=True)
+    assert scheduler.next_delay() == pytest.approx(high)
+
+    scheduler.rng = random.Random(1)
+    delays = [scheduler.next_delay() for _ in range(500)]
+    assert low <= min(delays) < max(delays) <= high
+    assert len(set(delays)) == len(delays)
+
+
+@pytest.fixture
+def daemon(monkeypatch, tmp_path):
+    """run_daemon with refreshes and notifications recorded; run(outcomes, waits) -> (clock, notifications)."""
+    monkeypatch.setattr(dc, "PROTECT_TRACK_UPDATES", False)
+    monkeypatch.setattr(dc, "PROTECT_CHANGE_CALLBACK", None)
+    notifications = []
+    monkeypatch.setattr(dc, "notify_config_changed", notifications.append)
+
+    def run(outcomes, waits, **kwargs):
+        outcomes = iter(outcomes)
+
+        def refresh(options, path, previous):
+            outcome = next(outcomes)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        monkeypatch.setattr(dc, "refresh_monocle_config", refresh)
+        clock = FakeClock(waits)
+        dc.run_daemon({"refresh_interval": 300}, 42, str(tmp_path / "monocle.json"), stop=clock,
+                      scheduler=dc.DiscoveryScheduler(300, jitter=0), **kwargs)
+        return clock, notifications
+
+    return run
+
+
+def test_daemon_backs_off_after_failures_and_resets(daemon):
+    changed = {**NO_CHANGES, "added": ["Porch"]}
+    clock, notifications = daemon([ValueError("HA down"), ValueError("HA down"), changed, NO_CHANGES], waits=5)
+
+    # Waits before each refresh: the interval, then backoff after each failure, then the interval again
+    assert clock.delays == [300, 15, 30, 300, 300]
+    assert notifications == [42]
+
+
+def test_daemon_refresh_now_and_stop(daemon):
+    clock, notifications = daemon([NO_CHANGES], waits=2, refresh_now=True)
+
+    # First refresh right away; the stop set during the second wait ends the loop without refreshing
+    assert clock.delays == [0, 300]
+    assert notifications == []
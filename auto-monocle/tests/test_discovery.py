@@ -0,0 +1,188 @@
+import json
+import os
+
+import pytest
+
+import discover_cameras as dc
+from stubs import StubServer
+
+# The stand-in NVR has a self-signed certificate, like real ones
+pytestmark = pytest.mark.filterwarnings("ignore::urllib3.exceptions.InsecureRequestWarning")
+
+
+def state(entity_id, name, **attributes):
+    return {"entity_id": entity_id, "state": "idle", "attributes": {"friendly_name": name, **attributes}}
+
+
+CAMERA_STATES = [
+    state("camera.front_door", "Front Door"),
+    state("camera.garage", "Garage"),
+    state("camera.doorbell", "Doorbell", stream_source="rtsp://10.0.0.9/doorbell"),
+    # Defined in YAML: no unique_id, so not in the entity registry
+    state("camera.shed", "Shed", stream_source="rtsp://10.0.0.8/shed"),
+]
+OTHER_STATES = [state(f"sensor.temperature_{i}", f"Temperature {i}") for i in range(20)]
+ENTITY_REGISTRY = [
+    {"entity_id": "camera.front_door", "platform": "unifiprotect", "unique_id": "AABBCCDDEE01_0",
+     "device_id": "dev1", "config_entry_id": "protect1"},
+    {"entity_id": "camera.garage", "platform": "generic", "unique_id": "garage"},
+    {"entity_id": "camera.doorbell", "platform": "generic", "unique_id": "doorbell"},
+    {"entity_id": "sensor.temperature_0", "platform": "template", "unique_id": "t0"},
+]
+DEVICE_REGISTRY = [{"id": "dev1", "name": "Front Door", "connections": [["mac", "aa:bb:cc:dd:ee:01"]]}]
+BOOTSTRAP = {
+    "lastUpdateId": "update-1",
+    "nvr": {"id": "nvr1", "name": "NVR", "ports": {"rtsps": 7441}},
+    "cameras": [
+        {"id": "cam1", "mac": "AABBCCDDEE01", "name": "Front Door", "channels": [{"id": 0, "rtspAlias": "front"}]},
+        {"id": "cam2", "mac": "AABBCCDDEE02", "name": "Yard", "channels": [{"id": 0, "rtspAlias": "yard"}]},
+    ],
+}
+GO2RTC_STREAMS = {"garage": {"producers": [{"url": "rtsp://10.0.0.2/garage"}]}}
+
+
+class FakeHome:
+    """HA API, .storage registries, go2rtc and a UniFi Protect NVR, all local.
+
+    cameras: camera states the template and the full /api/states dump list.
+    template_status / dump_status: HTTP status they answer with.
+    """
+
+    def __init__(self, storage, tls_context):
+        self.storage = storage
+        self.cameras = CAMERA_STATES
+        self.template_status = 200
+        self.dump_status = 200
+        routes = {("POST", "/core/api/template"): self.template, ("GET", "/core/api/states"): self.dump}
+        for camera in CAMERA_STATES:
+            routes[("GET", f"/core/api/states/{camera['entity_id']}")] = (200, {}, json.dumps(camera).encode())
+        self.ha = StubServer(routes)
+        self.go2rtc = StubServer({("GET", "/api/streams"): (200, {}, json.dumps(GO2RTC_STREAMS).encode())})
+        self.nvr = StubServer({
+            ("POST", "/api/auth/login"): (200, {"Set-Cookie": "TOKEN=session1; Path=/"}, b"{}"),
+            ("GET", "/proxy/protect/api/bootstrap"): (200, {}, json.dumps(BOOTSTRAP).encode()),
+        }, ssl_context=tls_context)
+        storage.mkdir()
+        self.write_storage("core.entity_registry", "entities", ENTITY_REGISTRY)
+        self.write_storage("core.device_registry", "devices", DEVICE_REGISTRY)
+        self.write_storage("core.config_entries", "entries", [
+            {"entry_id": "protect1", "domain": "unifiprotect", "title": "NVR",
+             "data": {"host": self.nvr.address, "username": "admin", "password": "secret"}},
+        ])
+
+    def write_storage(self, filename, key, records):
+        (self.storage / filename).write_text(json.dumps({"version": 1, "data": {key: records}}))
+
+    def template(self, handler, body):
+        return self.template_status, {}, json.dumps(self.cameras).encode()
+
+    def dump(self, handler, body):
+        return self.dump_status, {}, json.dumps(OTHER_STATES[:10] + self.cameras + OTHER_STATES[10:]).encode()
+
+    def requests(self, path):
+        """How many times the HA API path was requested."""
+        return self.ha.count("POST" if path == "/api/template" else "GET", f"/core{path}")
+
+    def close(self):
+        for server in (self.ha, self.go2rtc, self.nvr):
+            server.close()
+
+
+@pytest.fixture
+def home(monkeypatch, tmp_path, tls_context):
+    fake = FakeHome(tmp_path / ".storage", tls_context)
+    monkeypatch.setattr(dc, "SUPERVISOR_TOKEN", "token")
+    monkeypatch.setattr(dc, "HA_URL", f"http://{fake.ha.address}/core")
+    monkeypatch.setattr(dc, "HA_STORAGE_PATH", str(fake.storage))
+    monkeypatch.setattr(dc, "GO2RTC_ENDPOINTS", [f"http://{fake.go2rtc.address}/api/streams"])
+    monkeypatch.setattr(dc, "REGISTRY_CACHE", dc.RegistryCache())
+    monkeypatch.setattr(dc, "_complete_camera_list", {})
+    dc.METRICS.reset()
+    yield fake
+    fake.close()
+
+
+def test_parallel_and_sequential_discovery_agree(home, tmp_path):
+    results = {}
+    for parallel in (True, False):
+        path = str(tmp_path / f"monocle-{parallel}.json")
+        dc.refresh_monocle_config({"stream_probe": "off", "parallel_discovery": parallel}, path)
+        with open(path) as f:
+            results[parallel] = (f.read(), dc.load_discovery_snapshot()["cameras"])
+        os.remove(dc.DISCOVERY_SNAPSHOT_FILE)
+
+    assert results[True] == results[False]
+    # The stand-in NVR's host includes its HTTPS port
+    nvr = home.nvr.address
+    assert {camera["name"]: camera["url"] for camera in json.loads(results[True][0])["cameras"]} == {
+        "Front Door": f"rtsps://{nvr}:7441/front",
+        "Garage": "rtsp://10.0.0.2/garage",
+        "Doorbell": "rtsp://10.0.0.9/doorbell",
+        "Shed": "rtsp://10.0.0.8/shed",
+        "Yard": f"rtsps://{nvr}:7441/yard",
+    }
+
+
+def camera_states_read(home):
+    """get_camera_entities(): (entity_ids, HA API paths requested, ha_states_via_* counters of the run)."""
+    cameras = dc.get_camera_entities()
+    paths = ["/api/template", "/api/states"] + [f"/api/states/{c['entity_id']}" for c in CAMERA_STATES]
+    requested = [path for path in paths if home.requests(path)]
+    counters = dc.METRICS.snapshot()["counters"]
+    via = [name for name in counters if name.startswith("ha_states_via_")]
+    return sorted(c["entity_id"] for c in cameras), requested, via
+
+
+ALL_CAMERAS = sorted(c["entity_id"] for c in CAMERA_STATES)
+
+
+def test_camera_states_via_template(home):
+    assert camera_states_read(home) == (ALL_CAMERAS, ["/api/template"], ["ha_states_via_template"])
+
+
+def test_template_failure_without_a_camera_list_falls_back_to_the_dump(home):
+    home.template_status = 500
+
+    # The registry can't tell whether YAML cameras exist: camera.shed is only in the dump
+    assert camera_states_read(home) == (ALL_CAMERAS, ["/api/template", "/api/states"],
+                                        ["ha_states_via_full_dump"])
+    assert dc.METRICS.snapshot()["counters"]["ha_states_fallback"] == 2
+
+
+def test_registry_not_used_when_cameras_are_missing_from_it(home):
+    dc.get_camera_entities()
+    home.template_status = 500
+
+    cameras, requested, via = camera_states_read(home)
+    assert cameras == ALL_CAMERAS
+    assert via == ["ha_states_via_full_dump", "ha_states_via_template"]
+    assert "/api/states/camera.front_door" not in requested
+
+
+def test_registry_used_when_it_covers_every_camera(home):
+    home.cameras = [c for c in CAMERA_STATES if c["entity_id"] != "camera.shed"]
+    dc.get_camera_entities()
+    home.template_status = 500
+
+    cameras, requested, via = camera_states_read(home)
+    assert cameras == ["camera.doorbell", "camera.front_door", "camera.garage"]
+    assert requested == ["/api/template", "/api/states/camera.front_door", "/api/states/camera.garage",
+                         "/api/states/camera.doorbell"]
+    assert via == ["ha_states_via_registry", "ha_states_via_template"]
+
+
+def test_registry_not_trusted_on_an_old_camera_list(home, monkeypatch):
+    home.cameras = [c for c in CAMERA_STATES if c["entity_id"] != "camera.shed"]
+    dc.get_camera_entities()
+    monkeypatch.setattr(dc, "CAMERA_LIST_MAX_AGE", 0)
+    home.template_status = 500
+
+    assert camera_states_read(home)[1] == ["/api/template", "/api/states"]
+
+
+def test_every_method_failing(home):
+    home.template_status = 500
+    home.dump_status = 500
+
+    assert dc.get_camera_entities() == []
+    assert dc.METRICS.snapshot()["phases"]["ha_states"]["errors"] == 1
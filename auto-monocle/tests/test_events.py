@@ -0,0 +1,255 @@
+import json
+import threading
+import time
+
+import pytest
+
+import discover_cameras as dc
+from stubs import StubServer
+
+
+def test_trigger_waits_for_quiet_period():
+    trigger = dc.RefreshTrigger(quiet=0.2, max_delay=5)
+    start = time.monotonic()
+    trigger.fire("a")
+    threading.Timer(0.1, trigger.fire, ["b"]).start()
+
+    assert trigger.wait(5) == ["a", "b"]
+    # Released 0.2s after the second event, not the first
+    assert 0.25 <= time.monotonic() - start < 1
+
+
+def test_trigger_max_delay_caps_a_continuous_burst():
+    trigger = dc.RefreshTrigger(quiet=0.3, max_delay=0.5)
+    stop = threading.Event()
+
+    def keep_firing():
+        while not stop.is_set():
+            trigger.fire("event")
+            time.sleep(0.05)
+
+    threading.Thread(target=keep_firing, daemon=True).start()
+    start = time.monotonic()
+    reasons = trigger.wait(5)
+    stop.set()
+    assert reasons
+    assert 0.45 <= time.monotonic() - start < 1
+
+
+def test_trigger_times_out_without_events():
+    trigger = dc.RefreshTrigger(quiet=0.1, max_delay=1)
+    start = time.monotonic()
+    assert trigger.wait(0.2) == []
+    assert time.monotonic() - start >= 0.2
+
+
+def camera_state(entity_id, **attributes):
+    return {"entity_id": entity_id, "attributes": attributes}
+
+
+def state_trigger(entity_id, from_state, to_state):
+    """Event of a subscribe_trigger state trigger."""
+    return {"variables": {"trigger": {"platform": "state", "entity_id": entity_id,
+                                      "from_state": from_state, "to_state": to_state}}}
+
+
+class FakeHA:
+    """Script for the WebSocket stub: HA's auth handshake, then the given events.
+
+    Messages the listener sends after the events (up to `more`) are recorded too.
+    """
+
+    def __init__(self, events, token="token", subscriptions=4, more=0):
+        self.events = events
+        self.token = token
+        self.subscriptions = subscriptions
+        self.more = more
+        self.received = []
+        self.done = threading.Event()
+
+    def __call__(self, ws, handler):
+        ws.send(json.dumps({"type": "auth_required", "ha_version": "2026.10.0"}))
+        auth = json.loads(ws.recv())
+        self.received.append(auth)
+        if auth.get("access_token") != self.token:
+            ws.send(json.dumps({"type": "auth_invalid", "message": "Invalid access token"}))
+            return
+        ws.send(json.dumps({"type": "auth_ok"}))
+
+        subscriptions = {}
+        for _ in range(self.subscriptions):
+            message = json.loads(ws.recv())
+            self.received.append(message)
+            kind = message.get("event_type") or message["type"]
+            subscriptions[kind] = message["id"]
+            ws.send(json.dumps({"id": message["id"], "type": "result", "success": True, "result": None}))
+        for kind, event in self.events:
+            event_message = {"type": "event", "id": subscriptions[kind]}
+            subscribed = kind in ("config_entries/subscribe", "subscribe_trigger")
+            event_message["event"] = event if subscribed else {"data": event}
+            ws.send(json.dumps(event_message))
+        for _ in range(self.more):
+            self.received.append(json.loads(ws.recv()))
+        self.done.wait(5)
+
+
+@pytest.fixture
+def ha():
+    servers = []
+
+    def start(script):
+        server = StubServer(websocket_script=script)
+        servers.append(server)
+        return f"ws://{server.address}/api/websocket"
+
+    yield start
+    for server in servers:
+        server.close()
+
+
+def run_listener(url, trigger, token="token", cameras=("camera.porch",), ping_interval=60):
+    """Run one listen() in a thread; returns a holder for the exception it ended with."""
+    outcome = {}
+
+    def listen():
+        try:
+            dc.HAEventListener(trigger, url, token, ping_interval, entity_ids=lambda: cameras).listen()
+        except Exception as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=listen, daemon=True)
+    thread.start()
+    return thread, outcome
+
+
+def test_listener_subscribes_and_fires_only_on_relevant_changes(ha):
+    events = [
+        ("subscribe_trigger", state_trigger("camera.porch",
+                                            camera_state("camera.porch", friendly_name="Porch", brightness=1),
+                                            camera_state("camera.porch", friendly_name="Porch", brightness=2))),
+        ("subscribe_trigger", state_trigger("camera.porch",
+                                            camera_state("camera.porch", friendly_name="Porch"),
+                                            camera_state("camera.porch", friendly_name="Front Porch"))),
+        ("entity_registry_updated", {"action": "update", "entity_id": "sensor.temperature",
+                                     "changes": {"name": "Temp"}}),
+        ("device_registry_updated", {"action": "update", "device_id": "d1", "changes": {"sw_version": "2"}}),
+        ("config_entries/subscribe", [{"type": None, "entry": {"domain": "unifiprotect"}}]),
+        ("config_entries/subscribe", [{"type": "updated", "entry": {"domain": "mqtt"}}]),
+        ("config_entries/subscribe", [{"type": "added", "entry": {"domain": "onvif"}}]),
+    ]
+    script = FakeHA(events)
+    trigger = dc.RefreshTrigger(quiet=0.3, max_delay=5)
+    thread, _ = run_listener(ha(script), trigger)
+
+    reasons = trigger.wait(5)
+    script.done.set()
+    thread.join(5)
+
+    assert reasons == ["camera.porch friendly_name changed", "config entry: onvif added"]
+    subscribed = {m.get("event_type") or m["type"] for m in script.received[1:]}
+    assert subscribed == {"entity_registry_updated", "device_registry_updated", "subscribe_trigger",
+                          "config_entries/subscribe"}
+    # No state_changed firehose: only attribute changes of the cameras
+    triggers = next(m["trigger"] for m in script.received if m.get("type") == "subscribe_trigger")
+    assert {t["attribute"] for t in triggers} == set(dc.CAMERA_CONFIG_ATTRIBUTES)
+    assert all(t["platform"] == "state" and t["entity_id"] == ["camera.porch"] for t in triggers)
+
+
+def test_listener_follows_camera_entities_added_and_renamed(ha):
+    events = [
+        ("entity_registry_updated", {"action": "create", "entity_id": "camera.garage"}),
+        ("entity_registry_updated", {"action": "update", "entity_id": "camera.front",
+                                     "old_entity_id": "camera.porch", "changes": {"entity_id": "camera.porch"}}),
+    ]
+    # Each change: unsubscribe the old trigger, subscribe the new one
+    script = FakeHA(events, more=4)
+    trigger = dc.RefreshTrigger(quiet=0.3, max_delay=5)
+    thread, _ = run_listener(ha(script), trigger)
+
+    reasons = trigger.wait(5)
+    script.done.set()
+    thread.join(5)
+
+    assert reasons == ["entity registry: camera.garage create", "entity registry: camera.front update"]
+    renewals = script.received[-4:]
+    assert [m["type"] for m in renewals] == ["unsubscribe_events", "subscribe_trigger"] * 2
+    assert renewals[0]["subscription"] == next(m["id"] for m in script.received
+                                               if m.get("type") == "subscribe_trigger")
+    assert renewals[1]["trigger"][0]["entity_id"] == ["camera.garage", "camera.porch"]
+    assert renewals[3]["trigger"][0]["entity_id"] == ["camera.front", "camera.garage"]
+
+
+def test_listener_without_cameras_waits_for_one(ha):
+    script = FakeHA([("entity_registry_updated", {"action": "create", "entity_id": "camera.new"})],
+                    subscriptions=3, more=1)
+    trigger = dc.RefreshTrigger(quiet=0.1, max_delay=5)
+    thread, _ = run_listener(ha(script), trigger, cameras=())
+
+    assert trigger.wait(5) == ["entity registry: camera.new create"]
+    script.done.set()
+    thread.join(5)
+    assert script.received[-1]["type"] == "subscribe_trigger"
+    assert script.received[-1]["trigger"][0]["entity_id"] == ["camera.new"]
+
+
+def test_listener_rejected_token_raises(ha):
+    trigger = dc.RefreshTrigger()
+    thread, outcome = run_listener(ha(FakeHA([], token="other")), trigger, token="token")
+    thread.join(5)
+
+    assert "authentication failed" in str(outcome["error"])
+    assert "Invalid access token" in str(outcome["error"])
+
+
+def test_listener_raises_when_connection_drops(ha):
+    script = FakeHA([("subscribe_trigger", state_trigger("camera.new", None, camera_state("camera.new")))])
+    script.done.set()  # close right after the events
+    trigger = dc.RefreshTrigger(quiet=0.1, max_delay=1)
+    thread, outcome = run_listener(ha(script), trigger)
+    thread.join(5)
+
+    assert not thread.is_alive()
+    assert "error" in outcome
+    # Events sent before the drop still count
+    assert trigger.wait(1) == ["camera.new added"]
+
+
+def test_listener_unexpected_greeting(ha):
+    def script(ws, handler):
+        ws.send(json.dumps({"type": "hello"}))
+
+    thread, outcome = run_listener(ha(script), dc.RefreshTrigger())
+    thread.join(5)
+    assert "unexpected WebSocket greeting" in str(outcome["error"])
+
+
+def test_listener_drops_a_connection_that_stops_answering(ha):
+    # Subscribed, then nothing: not even the answer to a ping
+    script = FakeHA([])
+    thread, outcome = run_listener(ha(script), dc.RefreshTrigger(), ping_interval=0.2)
+    thread.join(5)
+    script.done.set()
+
+    assert not thread.is_alive()
+    assert "no answer to ping" in str(outcome["error"])
+
+
+def test_listener_stays_connected_while_pings_are_answered(ha):
+    pings = []
+
+    class AnsweringHA(FakeHA):
+        def __call__(self, ws, handler):
+            self.done.set()  # FakeHA returns right after the subscriptions
+            super().__call__(ws, handler)
+            while len(pings) < 3:
+                message = json.loads(ws.recv())
+                if message["type"] == "ping":
+                    pings.append(message)
+                    ws.send(json.dumps({"id": message["id"], "type": "pong"}))
+
+    thread, outcome = run_listener(ha(AnsweringHA([])), dc.RefreshTrigger(), ping_interval=0.2)
+    thread.join(5)
+
+    # Only dropped when the stand-in hung up after the third pong
+    assert len(pings) == 3
+    assert "no answer to ping" not in str(outcome["error"])
@@ -0,0 +1,53 @@
+import json
+
+import pytest
+
+import discover_cameras as dc
+from stubs import StubServer
+
+STREAMS = {"porch": {"producers": [{"url": "rtsp://10.0.0.5:554/porch"}]},
+           "webrtc_only": {"producers": [{"url": "webrtc:http://10.0.0.6/api"}]}}
+
+
+@pytest.fixture
+def go2rtc():
+    servers = []
+
+    def start(status: int = 200):
+        server = StubServer({("GET", "/api/streams"): (status, {}, json.dumps(STREAMS).encode())})
+        servers.append(server)
+        return f"http://{server.address}/api/streams"
+
+    yield start
+    for server in servers:
+        server.close()
+
+
+def test_remembered_endpoint_is_tried_alone(go2rtc, monkeypatch, data_dir):
+    good, other = go2rtc(), go2rtc()
+    monkeypatch.setattr(dc, "GO2RTC_ENDPOINTS", [other, good])
+    dc.save_go2rtc_endpoint(good)
+
+    assert dc.find_go2rtc_streams() == {"porch": "rtsp://10.0.0.5:554/porch"}
+    assert dc.CIRCUIT_BREAKERS.get(f"go2rtc {other}").failures == 0
+
+
+def test_failed_remembered_endpoint_counts_one_failure(go2rtc, monkeypatch, data_dir):
+    broken, good = go2rtc(status=500), go2rtc()
+    monkeypatch.setattr(dc, "GO2RTC_ENDPOINTS", [broken, good])
+    dc.save_go2rtc_endpoint(broken)
+
+    assert dc.find_go2rtc_streams() == {"porch": "rtsp://10.0.0.5:554/porch"}
+    assert dc.CIRCUIT_BREAKERS.get(f"go2rtc {broken}").failures == 1
+    assert dc.load_go2rtc_endpoint() == good
+
+
+def test_remembered_endpoint_kept_when_nothing_answers(go2rtc, monkeypatch, data_dir):
+    broken = go2rtc(status=500)
+    monkeypatch.setattr(dc, "GO2RTC_ENDPOINTS", [broken, go2rtc(status=404)])
+    dc.save_go2rtc_endpoint(broken)
+
+    assert dc.find_go2rtc_streams() == {}
+    breaker = dc.CIRCUIT_BREAKERS.get(f"go2rtc {broken}")
+    assert breaker.failures == 1 and breaker.allow()
+    assert dc.load_go2rtc_endpoint() == broken
@@ -0,0 +1,80 @@
+import io
+import json
+
+import pytest
+
+import discover_cameras as dc
+
+DOCUMENT = {
+    "version": 1,
+    "skipped": {"nested": [1, {"a": "]}\"[{"}, [[], {}]], "text": "back\\slash \"quoted\" ] }"},
+    "data": {
+        "ignored": [{"entity_id": "sensor.x"}] * 3,
+        "entities": [
+            {"entity_id": "camera.café", "name": "Café ☕", "unique_id": "aa\\bb"},
+            {"entity_id": "camera.porch", "options": {"list": [], "object": {}}, "n": -1.5e3},
+            12,
+            None,
+            True,
+        ],
+        "after": "value",
+    },
+}
+
+
+def chunked(data: bytes, size: int):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, 65536])
+def test_iter_path_any_chunking(size):
+    # Chunk boundaries fall inside strings, escapes, numbers and multi-byte characters
+    data = json.dumps(DOCUMENT, ensure_ascii=False, indent=1).encode()
+    reader = dc.JsonStreamReader(chunked(data, size))
+
+    assert list(reader.iter_path(("data", "entities"))) == DOCUMENT["data"]["entities"]
+    assert reader.bytes_read <= len(data)
+
+
+def test_iter_json_array_from_file():
+    data = json.dumps(DOCUMENT).encode()
+    assert list(dc.iter_json_array(io.BytesIO(data), ("data", "ignored"))) == DOCUMENT["data"]["ignored"]
+    assert list(dc.iter_json_array(io.BytesIO(b" [1, 2.5, \"x\"] "))) == [1, 2.5, "x"]
+    assert list(dc.iter_json_array(io.BytesIO(b"[]"))) == []
+
+
+def test_missing_path_yields_nothing():
+    data = json.dumps(DOCUMENT).encode()
+    assert list(dc.iter_json_array([data], ("data", "missing"))) == []
+    assert list(dc.iter_json_array([data], ("nope",))) == []
+
+
+def test_scalar_at_end_of_stream():
+    for size in (1, 2, 64):
+        reader = dc.JsonStreamReader(chunked(b"1234", size))
+        assert reader.read_value() == 1234
+
+
+def test_caller_reads_some_values_and_skips_the_rest():
+    data = json.dumps(DOCUMENT).encode()
+    reader = dc.JsonStreamReader(chunked(data, 5))
+    seen = {}
+    for key in reader.iter_object():
+        if key in ("version", "skipped"):
+            seen[key] = reader.read_value()
+    assert seen == {"version": 1, "skipped": DOCUMENT["skipped"]}
+
+
+@pytest.mark.parametrize("data, path", [
+    (b'{"data": {"entities": [1, 2', ("data", "entities")),
+    (b'[{"a": "unterminated', ()),
+    (b"", ()),
+])
+def test_truncated_stream_raises(data, path):
+    with pytest.raises(ValueError):
+        list(dc.iter_json_array(chunked(data, 3), path))
+
+
+def test_wrong_structure_raises():
+    with pytest.raises(ValueError, match="expected one of"):
+        list(dc.iter_json_array([b'{"data": 5}'], ("data",)))
@@ -0,0 +1,160 @@
+import pytest
+
+import discover_cameras as dc
+
+
+@pytest.mark.parametrize("filters, entity_id, name, kept", [
+    (["front"], "camera.front_door", "Front Door", True),
+    (["FRONT"], "camera.porch", "front porch", True),
+    (["front"], "camera.garage", "Garage", False),
+    (["camera.*_hd"], "camera.doorbell_hd", "Doorbell", True),
+    # Globs match the whole entity_id or name, not a substring
+    (["*_hd"], "camera.doorbell_hd_2", "Doorbell", False),
+    (["camera.cam?"], "camera.cam1", "Cam 1", True),
+    (["camera.cam[12]"], "camera.cam3", "Cam 3", False),
+    (["!doorbell"], "camera.doorbell_hd", "Doorbell", False),
+    (["!camera.*_hd"], "camera.porch", "Porch", True),
+    (["camera.*", "!garage"], "camera.garage", "Garage", False),
+    (["cam(1)"], "camera.x", "Cam(1)", True),
+    (["", "  ", "!"], "camera.anything", "Anything", True),
+])
+def test_filter_include_exclude_glob(filters, entity_id, name, kept):
+    assert dc.CameraFilter(filters).matches(entity_id, name) is kept
+
+
+def test_filter_aliases_count_for_include_and_exclude():
+    assert not dc.CameraFilter(["!camera.front_door"]).matches("camera.unifi_x", "X", ["camera.front_door"])
+    assert dc.CameraFilter(["camera.front*"]).matches("camera.unifi_x", "X", ["camera.front_door"])
+    assert not dc.CameraFilter(["camera.front*"]).matches("camera.unifi_x", "X", ["camera.garage"])
+
+
+def state(entity_id, name, **attributes):
+    return {"entity_id": entity_id, "attributes": {"friendly_name": name, **attributes}}
+
+
+ENTITIES = [
+    state("camera.front_door", "Front Door"),
+    state("camera.garage", "Garage"),
+    state("camera.doorbell_hd", "Doorbell", stream_source="rtsp://10.0.0.9/hd"),
+]
+GO2RTC = {"garage": "rtsp://10.0.0.2/garage"}
+UNIFI = {
+    "camera.front_door": {"name": "Front Door", "url": "rtsps://nvr:7441/front", "mac": "AABBCCDDEE01"},
+    "camera.yard": {"name": "Yard", "url": "rtsps://nvr:7441/yard", "mac": "AABBCCDDEE02"},
+}
+ONVIF = {"urn:uuid:shed": {"name": "Shed", "url": "rtsp://10.0.0.7/onvif", "mac": "AA:BB:CC:DD:EE:03"}}
+# The Shed's ONVIF entity exists in the registry but not in the states (disabled)
+ENTITY_MACS = {"AABBCCDDEE01": ["camera.front_door"], "AABBCCDDEE03": ["camera.shed"]}
+
+
+def discover(filters=None, go2rtc=GO2RTC, unifi=UNIFI, onvif=ONVIF, entities=ENTITIES):
+    camera_filter = dc.CameraFilter(filters) if filters else None
+    cameras = dc.merge_discovery_results(entities, go2rtc, unifi, camera_filter, ENTITY_MACS, onvif)
+    return {camera["entity_id"]: camera["stream_url"] for camera in cameras}
+
+
+def test_discovery_without_filters():
+    assert discover() == {
+        "camera.front_door": "rtsps://nvr:7441/front",
+        "camera.garage": "rtsp://10.0.0.2/garage",
+        "camera.doorbell_hd": "rtsp://10.0.0.9/hd",
+        "camera.unifi_yard": "rtsps://nvr:7441/yard",
+        "camera.onvif_shed": "rtsp://10.0.0.7/onvif",
+    }
+
+
+@pytest.mark.parametrize("filters, expected", [
+    # Excluding an entity also excludes the UniFi camera behind it (same MAC)
+    (["!camera.front_door"], {"camera.garage", "camera.doorbell_hd", "camera.unifi_yard", "camera.onvif_shed"}),
+    # ... and the ONVIF device behind a registry entity with no state
+    (["!camera.shed"], {"camera.front_door", "camera.garage", "camera.doorbell_hd", "camera.unifi_yard"}),
+    # By name, for a UniFi camera without an HA entity
+    (["!yard"], {"camera.front_door", "camera.garage", "camera.doorbell_hd", "camera.onvif_shed"}),
+    (["garage"], {"camera.garage"}),
+    (["camera.*door*"], {"camera.front_door", "camera.doorbell_hd"}),
+    (["yard", "SHED"], {"camera.unifi_yard", "camera.onvif_shed"}),
+    (["*", "!camera.*_hd", "!Shed"], {"camera.front_door", "camera.garage", "camera.unifi_yard"}),
+])
+def test_filters_apply_to_every_source(filters, expected):
+    assert set(discover(filters)) == expected
+
+
+MATCHER_NAMES = {
+    "camera.garage": "Garage",
+    "camera.garage_side": "Garage Side",
+    "camera.front_door": "Front Door",
+    "camera.front_door_2": "Front Door",
+    "camera.backyard_high": "Backyard High",
+}
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("Garage", "camera.garage"),
+    ("garage_side", "camera.garage_side"),
+    ("Garage Side Camera", "camera.garage_side"),
+    # Ties go to the lowest entity_id
+    ("front-door", "camera.front_door"),
+    ("backyard", "camera.backyard_high"),
+    ("porch", None),
+])
+def test_matcher_best_match(query, expected):
+    assert dc.CameraMatcher(MATCHER_NAMES).best_match(query) == expected
+
+
+def test_matcher_is_independent_of_entity_order():
+    reversed_names = dict(reversed(list(MATCHER_NAMES.items())))
+    for query in ["Garage", "Garage Side", "Front Door", "Door", "Side"]:
+        assert (dc.CameraMatcher(MATCHER_NAMES).best_match(query)
+                == dc.CameraMatcher(reversed_names).best_match(query))
+
+
+def test_matcher_mac_beats_name():
+    matcher = dc.CameraMatcher(MATCHER_NAMES, {"AABBCCDDEE01": ["camera.garage_side", "camera.unknown"]})
+    assert matcher.best_match("Garage", "aa:bb:cc:dd:ee:01") == "camera.garage_side"
+    assert matcher.candidates("Garage", "AABBCCDDEE01")["camera.garage_side"] == 3.0
+
+
+def test_matcher_assign_gives_each_entity_once():
+    matcher = dc.CameraMatcher(MATCHER_NAMES)
+    queries = {"b": ("Garage", None), "a": ("garage", None), "side": ("Garage Side", None)}
+
+    # Exact names first, ties to the lower key; "b" is left without a camera
+    assert matcher.assign(queries) == {"a": "camera.garage", "side": "camera.garage_side"}
+    assert matcher.assign(queries, available=lambda entity_id: entity_id != "camera.garage") == {
+        "side": "camera.garage_side"}
+
+
+def test_unifi_camera_behind_a_go2rtc_entity_is_not_added_twice():
+    entities = [state("camera.porch", "Porch")]
+    unifi = {"camera.porch_cam": {"name": "Porch Cam (NVR)", "url": "rtsps://nvr:7441/porch", "mac": "AABBCCDDEE09"}}
+    macs = {"AABBCCDDEE09": ["camera.porch"]}
+
+    cameras = dc.merge_discovery_results(entities, {"porch": "rtsp://10.0.0.4/porch"}, unifi, None, macs)
+
+    assert [(c["entity_id"], c["stream_url"]) for c in cameras] == [("camera.porch", "rtsp://10.0.0.4/porch")]
+
+
+def test_onvif_device_behind_a_streaming_entity_is_not_added():
+    entities = [state("camera.shed", "Shed")]
+    onvif = {"urn:uuid:shed": {"name": "IPC-Shed", "url": "rtsp://10.0.0.7/onvif", "mac": "AA:BB:CC:DD:EE:03"}}
+    macs = {"AABBCCDDEE03": ["camera.shed"]}
+
+    cameras = dc.merge_discovery_results(entities, {"shed": "rtsp://127.0.0.1:8554/shed"}, {}, None, macs, onvif)
+
+    assert [c["entity_id"] for c in cameras] == ["camera.shed"]
+
+
+def test_onvif_registry_macs_include_the_first_profile():
+    # HA's ONVIF integration gives profile 0 the bare MAC as unique_id, later profiles "<mac>_<index>"
+    registry = [
+        {"entity_id": "camera.shed_mainstream", "platform": "onvif", "unique_id": "aa:bb:cc:dd:ee:03"},
+        {"entity_id": "camera.shed_substream", "platform": "onvif", "unique_id": "aa:bb:cc:dd:ee:03_1",
+         "disabled_by": "integration"},
+    ]
+    macs = dc.index_entity_registry(registry)["camera_macs"]
+    assert macs == {"AABBCCDDEE03": ["camera.shed_mainstream", "camera.shed_substream"]}
+
+    # The default-enabled main stream entity gets the URL; no camera.onvif_* next to it
+    entities = [state("camera.shed_mainstream", "Shed")]
+    cameras = dc.merge_discovery_results(entities, {}, {}, None, macs, ONVIF)
+    assert [(c["entity_id"], c["stream_url"]) for c in cameras] == [("camera.shed_mainstream", "rtsp://10.0.0.7/onvif")]
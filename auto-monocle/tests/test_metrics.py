@@ -0,0 +1,101 @@
+import json
+
+import pytest
+
+import discover_cameras as dc
+
+
+@pytest.fixture
+def metrics(monkeypatch):
+    monkeypatch.setattr(dc, "METRICS", dc.DiscoveryMetrics())
+    return dc.METRICS
+
+
+def read_status():
+    with open(dc.DISCOVERY_STATUS_FILE) as f:
+        return json.load(f)
+
+
+def test_phase_totals(metrics):
+    for _ in range(2):
+        with metrics.phase("go2rtc"):
+            metrics.add("go2rtc", "bytes", 100)
+    with pytest.raises(ValueError):
+        with metrics.phase("go2rtc"):
+            raise ValueError("HTTP 500")
+    assert list(dc.count_records(iter(range(5)), "ha_states")) == [0, 1, 2, 3, 4]
+    metrics.count("matched_go2rtc", 3)
+    metrics.count("matched_go2rtc")
+
+    snapshot = metrics.snapshot()
+    assert snapshot["phases"]["go2rtc"]["bytes"] == 200
+    assert snapshot["phases"]["go2rtc"]["errors"] == 1
+    assert snapshot["phases"]["go2rtc"]["seconds"] >= 0
+    assert snapshot["phases"]["ha_states"] == {"seconds": 0.0, "records": 5}
+    assert snapshot["counters"] == {"matched_go2rtc": 4}
+
+    metrics.reset()
+    assert metrics.snapshot()["phases"] == {} and metrics.snapshot()["counters"] == {}
+
+
+def test_history_is_capped(metrics, monkeypatch):
+    monkeypatch.setattr(dc, "METRICS_HISTORY", 3)
+    for cameras in range(5):
+        dc.write_discovery_status("ok", cameras)
+    dc.write_discovery_status("error")
+
+    status = read_status()
+    assert [run["cameras"] for run in status["history"]] == [3, 4, None]
+    assert status["last"]["result"] == "error"
+    assert status["totals"] == {"ok": 5, "error": 1}
+
+
+def failing():
+    raise ValueError("HTTP 500")
+
+
+@pytest.mark.parametrize("dump, errors, fallbacks", [
+    (lambda: [{"entity_id": "camera.porch"}], 0, 2),
+    (failing, 1, 2),
+])
+def test_fallbacks_are_not_errors(metrics, monkeypatch, dump, errors, fallbacks):
+    monkeypatch.setattr(dc, "get_camera_states_via_template", failing)
+    monkeypatch.setattr(dc, "get_camera_states_by_id", lambda: None)
+    monkeypatch.setattr(dc, "get_camera_states_from_dump", dump)
+    monkeypatch.setattr(dc, "_complete_camera_list", {})
+
+    dc.get_camera_entities()
+
+    snapshot = metrics.snapshot()
+    # A failed method is not a phase error: only all of them failing is
+    assert snapshot["phases"]["ha_states"].get("errors", 0) == errors
+    assert snapshot["counters"]["ha_states_fallback"] == fallbacks
+
+
+def test_prometheus_text_format(metrics):
+    metrics.add("protect:Main \"NVR\"", "bytes", 2048)
+    metrics.add("protect:Main \"NVR\"", "records", 12)
+    metrics.count("registry_cache_hits", 2)
+    dc.write_discovery_status("ok", 12)
+    dc.write_discovery_status("error")
+
+    with open(dc.DISCOVERY_METRICS_FILE) as f:
+        text = f.read()
+    lines = text.splitlines()
+    assert text.endswith("\n")
+    # Every metric: HELP, TYPE, then its samples
+    for i, line in enumerate(lines):
+        if line.startswith("# HELP "):
+            name = line.split()[2]
+            assert lines[i + 1].startswith(f"# TYPE {name} ")
+        elif not line.startswith("# "):
+            name, value = line.rsplit(" ", 1)
+            assert name.startswith("auto_monocle_")
+            float(value)
+    assert "# TYPE auto_monocle_runs_total counter" in lines
+    assert 'auto_monocle_runs_total{result="error"} 1' in lines
+    assert 'auto_monocle_runs_total{result="ok"} 1' in lines
+    assert "auto_monocle_last_run_success 0" in lines
+    assert 'auto_monocle_phase_bytes{phase="protect:Main \\"NVR\\""} 2048' in lines
+    assert 'auto_monocle_phase_errors{phase="protect:Main \\"NVR\\""} 0' in lines
+    assert 'auto_monocle_discovery_count{counter="registry_cache_hits"} 2' in lines
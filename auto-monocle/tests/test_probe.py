@@ -0,0 +1,130 @@
+import json
+import time
+
+import pytest
+
+import discover_cameras as dc
+from stubs import RtspServer
+
+
+@pytest.fixture
+def rtsp():
+    server = RtspServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def health_file(data_dir):
+    return data_dir / "stream_health.json"
+
+
+def camera(entity_id, stream_url, *fallback_urls):
+    return {"entity_id": entity_id, "name": entity_id.split(".")[1].title(),
+            "stream_url": stream_url, "fallback_urls": list(fallback_urls)}
+
+
+def test_probe_reads_codecs(rtsp):
+    result = dc.probe_rtsp_url(rtsp.url("ok"))
+
+    assert result["ok"]
+    assert result["status"] == 200
+    assert result["codecs"] == {"video": "H264", "audio": "MPEG4-GENERIC"}
+    assert result["error"] is None
+    assert [method for method, _, _ in rtsp.requests] == ["OPTIONS", "DESCRIBE"]
+
+
+def test_probe_answers_digest_challenge_without_credentials_in_url(rtsp):
+    result = dc.probe_rtsp_url(rtsp.url("digest", "admin:secret"))
+
+    assert result["ok"]
+    assert [method for method, _, _ in rtsp.requests] == ["OPTIONS", "DESCRIBE", "DESCRIBE"]
+    assert all("secret" not in url and "@" not in url for _, url, _ in rtsp.requests)
+    assert rtsp.requests[-1][2]["authorization"].startswith("Digest ")
+
+
+def test_probe_answers_basic_challenge(rtsp):
+    assert dc.probe_rtsp_url(rtsp.url("basic", "admin:secret"))["ok"]
+
+
+@pytest.mark.parametrize("path, credentials, error", [
+    ("digest", "admin:wrong", "DESCRIBE returned 401"),
+    ("digest", "", "DESCRIBE returned 401"),
+    ("missing", "", "DESCRIBE returned 404"),
+    ("audio", "", "no video track in SDP"),
+    ("garbage", "", "not an RTSP response"),
+])
+def test_probe_failures(rtsp, path, credentials, error):
+    result = dc.probe_rtsp_url(rtsp.url(path, credentials))
+
+    assert not result["ok"]
+    assert error in result["error"]
+
+
+def test_probe_times_out(rtsp):
+    start = time.monotonic()
+    result = dc.probe_rtsp_url(rtsp.url("slow"), timeout=0.5)
+
+    assert not result["ok"]
+    assert result["error"]
+    assert time.monotonic() - start < 2
+
+
+def test_probe_connection_refused():
+    result = dc.probe_rtsp_url("rtsp://127.0.0.1:1/stream")
+    assert not result["ok"] and result["error"]
+
+
+def test_probe_skips_non_rtsp_urls():
+    assert dc.probe_rtsp_url("http://127.0.0.1/stream")["error"] == "not an RTSP URL"
+
+
+def test_demote_prefers_working_fallback(rtsp, health_file):
+    cameras = [camera("camera.porch", rtsp.url("missing"), rtsp.url("digest", "admin:secret")),
+               camera("camera.yard", rtsp.url("audio"))]
+
+    kept = dc.probe_camera_streams(cameras, "demote")
+
+    porch, yard = kept
+    assert porch["stream_url"] == rtsp.url("digest", "admin:secret")
+    assert porch["fallback_urls"] == [rtsp.url("missing")]
+    assert porch["probe"]["ok"]
+    # No working URL: kept on its primary URL
+    assert yard["stream_url"] == rtsp.url("audio")
+
+    health = json.loads(health_file.read_text())
+    assert len(health["results"]) == 3
+    assert not any("secret" in url for url in health["results"])
+
+
+def test_drop_removes_failing_urls_and_cameras(rtsp, health_file):
+    cameras = [camera("camera.porch", rtsp.url("missing"), rtsp.url("ok")),
+               camera("camera.yard", rtsp.url("audio"), rtsp.url("digest", "admin:wrong"))]
+
+    kept = dc.probe_camera_streams(cameras, "drop")
+
+    assert [(c["entity_id"], c["stream_url"], c["fallback_urls"]) for c in kept] == [
+        ("camera.porch", rtsp.url("ok"), [])]
+
+
+def test_unfinished_probes_leave_urls_alone(rtsp, health_file):
+    dc.METRICS.reset()
+    cameras = [camera("camera.porch", rtsp.url("slow"), rtsp.url("ok"))]
+
+    kept = dc.probe_camera_streams(cameras, "drop", budget=0.5, timeout=3)
+
+    # The slow URL wasn't checked in time, so it stays first
+    assert kept[0]["stream_url"] == rtsp.url("slow")
+    assert dc.METRICS.snapshot()["counters"]["probe_unfinished"] == 1
+
+
+def test_unchanged_cameras_reuse_their_last_probe(rtsp, health_file):
+    previous = camera("camera.porch", rtsp.url("ok"))
+    previous.update(fingerprint="abc", probe={"ok": True, "time": int(time.time())})
+    current = camera("camera.porch", rtsp.url("missing"), rtsp.url("ok"))
+    current["fingerprint"] = "abc"
+
+    kept = dc.probe_camera_streams([current], "demote", previous={"abc": previous})
+
+    assert kept[0]["stream_url"] == rtsp.url("ok")
+    assert rtsp.requests == []
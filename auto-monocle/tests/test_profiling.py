@@ -0,0 +1,97 @@
+import json
+import os
+import tracemalloc
+
+import pytest
+
+import discover_cameras as dc
+
+CONFIG = {"cameras": [{"name": "Porch", "url": "rtsp://10.0.0.2/porch", "tags": []}]}
+CAMERAS = [{"entity_id": "camera.porch", "name": "Porch", "stream_url": "rtsp://10.0.0.2/porch",
+            "fallback_urls": []}]
+
+
+def slow_match(n):
+    return [str(i) * 10 for i in range(n)]
+
+
+@pytest.fixture
+def refresh(monkeypatch, tmp_path):
+    """Run refresh_monocle_config with a discovery that has one "match" phase."""
+    monkeypatch.setattr(dc, "METRICS", dc.DiscoveryMetrics())
+    monkeypatch.delenv(dc.PROFILE_ENV, raising=False)
+    seen = {}
+
+    def build_monocle_config(options, snapshot):
+        seen["parallel_discovery"] = options.get("parallel_discovery", True)
+        seen["profiler"] = dc.METRICS.profiler
+        with dc.METRICS.phase("match"):
+            seen["held"] = slow_match(20000)
+        return CONFIG, CAMERAS, None
+
+    monkeypatch.setattr(dc, "build_monocle_config", build_monocle_config)
+
+    def run(options):
+        dc.refresh_monocle_config(options, str(tmp_path / "monocle.json"))
+        return seen
+
+    return run
+
+
+def profile_files(data_dir):
+    return sorted(name for name in os.listdir(data_dir) if name.startswith("discovery_profile-"))
+
+
+def test_profiled_phase_is_reported(refresh, data_dir):
+    seen = refresh({"profiling": True})
+
+    assert seen["profiler"] is not None and seen["parallel_discovery"] is False
+    assert dc.METRICS.profiler is None and not tracemalloc.is_tracing()
+    names = profile_files(data_dir)
+    assert [os.path.splitext(name)[1] for name in names] == [".json", ".txt"]
+
+    with open(data_dir / names[0]) as f:
+        report = json.load(f)
+    assert report["result"] == "ok"
+    match = report["phases"]["match"]
+    assert match["seconds"] > 0
+    # The phase's list is still held by the test: retained, and the top allocation site
+    assert match["peak_bytes"] >= match["retained_bytes"] > 0
+    assert "test_profiling.py" in match["allocations"][0]["site"]
+    assert any("slow_match" in row["function"] for row in match["functions"])
+    assert "write_config" in report["phases"]
+    assert report["metrics"]["phases"]["match"]["seconds"] >= 0
+
+    with open(data_dir / names[1]) as f:
+        text = f.read()
+    assert text.startswith("Auto-Monocle discovery profile")
+    assert "== match" in text and "slow_match" in text
+
+
+def test_env_turns_profiling_on(refresh, data_dir, monkeypatch):
+    monkeypatch.setenv(dc.PROFILE_ENV, "yes")
+    assert refresh({})["profiler"] is not None
+    assert len(profile_files(data_dir)) == 2
+
+
+def test_profiling_off_does_nothing(refresh, data_dir):
+    seen = refresh({"profiling": False})
+
+    assert seen["profiler"] is None and seen["parallel_discovery"] is True
+    assert not tracemalloc.is_tracing()
+    assert profile_files(data_dir) == []
+    # The run's metrics are still recorded
+    with open(dc.DISCOVERY_STATUS_FILE) as f:
+        assert "match" in json.load(f)["last"]["phases"]
+
+
+def test_old_reports_are_removed(data_dir, monkeypatch):
+    monkeypatch.setattr(dc, "PROFILE_KEEP", 2)
+    os.makedirs(data_dir, exist_ok=True)
+    report = {"time": 0, "result": "ok", "python": "3", "peak_traced_bytes": 0, "peak_rss_bytes": 0,
+              "functions": [], "phases": {}, "metrics": {"duration": 0.0, "counters": {}}}
+    paths = [dc.write_profile_report(dict(report, time=1700000000 + hour * 3600)) for hour in range(4)]
+
+    # The newest two, each as .txt and .json
+    kept = [os.path.basename(path)[:-4] for path in paths[2:]]
+    assert profile_files(data_dir) == sorted(f"{name}{ext}" for name in kept for ext in (".json", ".txt"))
@@ -0,0 +1,352 @@
+import json
+import queue
+import struct
+import threading
+import time
+import zlib
+
+import pytest
+import requests
+
+import discover_cameras as dc
+from stubs import StubServer
+
+# The stand-in NVR has a self-signed certificate, like real ones
+pytestmark = pytest.mark.filterwarnings("ignore::urllib3.exceptions.InsecureRequestWarning")
+
+BOOTSTRAP = {
+    "lastUpdateId": "update-1",
+    "nvr": {"id": "nvr1", "name": "NVR", "ports": {"rtsp": 7447, "rtsps": 7441}, "timezone": "UTC"},
+    "cameras": [
+        {"id": "cam1", "mac": "AABBCCDDEE01", "name": "Porch", "type": "UVC G4",
+         "channels": [{"id": 0, "rtspAlias": "alias0"}], "stats": {"rxBytes": 1}},
+    ],
+    "users": [{"id": "u1"}],
+}
+
+
+def packet_frame(payload, payload_format: int = 1, deflate: bool = False, packet_type: int = 1) -> bytes:
+    """One frame of a Protect update packet: 8-byte header and payload."""
+    data = json.dumps(payload).encode() if payload_format == 1 else payload
+    if deflate:
+        data = zlib.compress(data)
+    return struct.pack(">BBBBI", packet_type, payload_format, int(deflate), 0, len(data)) + data
+
+
+def update_packet(action: dict, data, deflate: bool = False) -> bytes:
+    return packet_frame(action, deflate=deflate) + packet_frame(data, deflate=deflate, packet_type=2)
+
+
+class FakeNVR:
+    """UniFi Protect login, bootstrap and updates stream on a TLS stub server."""
+
+    def __init__(self, tls_context, login_status=200, expire_first_bootstrap=False, answer_pings=True,
+                 bootstrap_delay=0.0):
+        self.login_status = login_status
+        self.expire_first_bootstrap = expire_first_bootstrap
+        # Seconds the bootstrap takes to start answering (a hung NVR)
+        self.bootstrap_delay = bootstrap_delay
+        # False: a half-open connection, nothing comes back
+        self.answer_pings = answer_pings
+        self.packets = queue.Queue()
+        self.updates_url = None
+        self.server = StubServer({
+            ("POST", "/api/auth/login"): self.login,
+            ("GET", "/proxy/protect/api/bootstrap"): self.bootstrap,
+        }, websocket_script=self.updates, ssl_context=tls_context)
+
+    def login(self, handler, body):
+        credentials = json.loads(body)
+        if self.login_status != 200 or credentials != {"username": "admin", "password": "secret"}:
+            return 401, {}, b'{"error": "unauthorized"}'
+        return 200, {"Set-Cookie": "TOKEN=session1; Path=/"}, b"{}"
+
+    def bootstrap(self, handler, body):
+        time.sleep(self.bootstrap_delay)
+        if self.expire_first_bootstrap:
+            self.expire_first_bootstrap = False
+            return 401, {}, b""
+        if "TOKEN=session1" not in (handler.headers.get("Cookie") or ""):
+            return 401, {}, b""
+        return 200, {"Content-Type": "application/json"}, json.dumps(BOOTSTRAP).encode()
+
+    def updates(self, ws, handler):
+        self.updates_url = handler.path
+        if "TOKEN=session1" not in (handler.headers.get("Cookie") or ""):
+            return
+        if self.answer_pings:
+            # WebSocket.recv() answers pings while it waits for client messages
+            threading.Thread(target=lambda: ws.recv(), daemon=True).start()
+        while True:
+            packet = self.packets.get(timeout=10)
+            if packet is None:
+                return
+            ws.send(packet)
+
+    def client(self) -> dc.ProtectClient:
+        return dc.ProtectClient(self.server.address, "admin", "secret")
+
+
+@pytest.fixture
+def nvr(tls_context):
+    servers = []
+
+    def start(**kwargs):
+        fake = FakeNVR(tls_context, **kwargs)
+        servers.append(fake)
+        return fake
+
+    yield start
+    for fake in servers:
+        fake.packets.put(None)
+        fake.server.close()
+
+
+@pytest.fixture
+def track_updates(monkeypatch):
+    """Daemon-mode updates tracking; returns the list of change reasons reported."""
+    reasons = []
+    monkeypatch.setattr(dc, "PROTECT_TRACK_UPDATES", True)
+    monkeypatch.setattr(dc, "PROTECT_CHANGE_CALLBACK", reasons.append)
+    return reasons
+
+
+def wait_for(condition, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("timed out")
+        time.sleep(0.02)
+
+
+def test_bootstrap_logs_in_once_and_keeps_only_camera_fields(nvr):
+    fake = nvr()
+    client = fake.client()
+
+    bootstrap = client.bootstrap()
+    client.bootstrap()
+
+    assert bootstrap["cameras"] == [{"id": "cam1", "mac": "AABBCCDDEE01", "name": "Porch",
+                                     "channels": [{"id": 0, "rtspAlias": "alias0"}]}]
+    assert bootstrap["lastUpdateId"] == "update-1"
+    assert bootstrap["nvr"] == {"id": "nvr1", "name": "NVR", "ports": {"rtsp": 7447, "rtsps": 7441}}
+    assert fake.server.count("POST", "/api/auth/login") == 1
+    assert fake.server.count("GET", "/proxy/protect/api/bootstrap") == 2
+
+
+def test_expired_session_logs_in_again(nvr):
+    fake = nvr(expire_first_bootstrap=True)
+
+    bootstrap = fake.client().bootstrap()
+
+    assert [cam["id"] for cam in bootstrap["cameras"]] == ["cam1"]
+    assert fake.server.count("POST", "/api/auth/login") == 2
+
+
+def test_rejected_login_raises(nvr):
+    fake = nvr(login_status=401)
+
+    with pytest.raises(requests.HTTPError):
+        fake.client().bootstrap()
+    assert fake.server.count("GET", "/proxy/protect/api/bootstrap") == 0
+
+
+def test_updates_stream_keeps_cameras_current(nvr, track_updates):
+    fake = nvr()
+    client = fake.client()
+    client.current_bootstrap()
+    wait_for(lambda: fake.updates_url is not None)
+    assert "lastUpdateId=update-1" in fake.updates_url
+
+    # Stats only: not discovery-relevant
+    fake.packets.put(update_packet({"action": "update", "modelKey": "camera", "id": "cam1",
+                                    "newUpdateId": "update-2"}, {"stats": {"rxBytes": 2}}, deflate=True))
+    fake.packets.put(update_packet({"action": "update", "modelKey": "camera", "id": "cam1",
+                                    "newUpdateId": "update-3"}, {"name": "Front Porch"}))
+    fake.packets.put(update_packet({"action": "add", "modelKey": "camera", "id": "cam2",
+                                    "newUpdateId": "update-4"},
+                                   {"id": "cam2", "mac": "AABBCCDDEE02", "name": "Garage", "channels": []}))
+    fake.packets.put(update_packet({"action": "update", "modelKey": "light", "id": "l1",
+                                    "newUpdateId": "update-5"}, {"name": "Light"}))
+    wait_for(lambda: len(track_updates) == 2 and client.last_update_id == "update-5")
+
+    assert track_updates == ["UniFi Protect: camera Front Porch name changed",
+                             "UniFi Protect: camera Garage added"]
+    current = client.current_bootstrap()
+    assert {cam["id"]: cam["name"] for cam in current["cameras"]} == {"cam1": "Front Porch", "cam2": "Garage"}
+    assert current["lastUpdateId"] == "update-5"
+    # Served from the stream, not downloaded again
+    assert fake.server.count("GET", "/proxy/protect/api/bootstrap") == 1
+
+    fake.packets.put(update_packet({"action": "remove", "modelKey": "camera", "id": "cam2"}, {}))
+    wait_for(lambda: len(track_updates) == 3)
+    assert track_updates[-1] == "UniFi Protect: camera Garage removed"
+
+
+def test_closed_updates_stream_falls_back_to_bootstrap(nvr, track_updates):
+    fake = nvr()
+    client = fake.client()
+    client.current_bootstrap()
+    wait_for(lambda: client.live and fake.updates_url is not None)
+
+    fake.packets.put(None)  # NVR closes the stream
+    wait_for(lambda: not client.live)
+    client.current_bootstrap()
+
+    assert fake.server.count("GET", "/proxy/protect/api/bootstrap") == 2
+
+
+def test_silent_updates_stream_is_dropped(nvr, track_updates, monkeypatch):
+    monkeypatch.setattr(dc, "PROTECT_PING_INTERVAL", 0.2)
+    fake = nvr(answer_pings=False)
+    client = fake.client()
+    client.current_bootstrap()
+    wait_for(lambda: client.live and fake.updates_url is not None)
+
+    # No packets and no pong: pinged after 0.2s, given up 0.2s later
+    wait_for(lambda: not client.live, timeout=2)
+    client.current_bootstrap()
+
+    assert fake.server.count("GET", "/proxy/protect/api/bootstrap") == 2
+
+
+def test_answered_pings_keep_the_stream(nvr, track_updates, monkeypatch):
+    monkeypatch.setattr(dc, "PROTECT_PING_INTERVAL", 0.2)
+    fake = nvr()
+    client = fake.client()
+    client.current_bootstrap()
+    wait_for(lambda: client.live and fake.updates_url is not None)
+
+    time.sleep(1)
+    assert client.live
+    client.current_bootstrap()
+    assert fake.server.count("GET", "/proxy/protect/api/bootstrap") == 1
+
+
+def test_stale_bootstrap_downloaded_again_while_live(nvr, track_updates, monkeypatch):
+    fake = nvr()
+    client = fake.client()
+    client.current_bootstrap()
+    wait_for(lambda: client.live and fake.updates_url is not None)
+
+    monkeypatch.setattr(dc, "PROTECT_BOOTSTRAP_MAX_AGE", 0)
+    client.current_bootstrap()
+
+    assert client.live
+    assert fake.server.count("GET", "/proxy/protect/api/bootstrap") == 2
+    # The running stream is kept, not reconnected
+    assert fake.server.count("GET", "/proxy/protect/ws/updates") == 1
+
+
+def test_malformed_update_stops_following(nvr, track_updates, capsys):
+    fake = nvr()
+    client = fake.client()
+    client.current_bootstrap()
+    wait_for(lambda: fake.updates_url is not None)
+
+    fake.packets.put(b"\x01\x01\x00\x00\x00\x00\x00\x09not json!")
+    wait_for(lambda: not client.live)
+
+    assert track_updates == []
+    assert "updates from" in capsys.readouterr().out
+
+
+def test_decode_packet_payload_formats():
+    action = {"action": "update", "modelKey": "camera", "id": "cam1"}
+    text = packet_frame(action) + packet_frame(b"plain text", payload_format=2, packet_type=2)
+    raw = packet_frame(action, deflate=True) + packet_frame(b"\x00\x01", payload_format=3, packet_type=2)
+
+    assert dc.decode_protect_packet(text) == (action, "plain text")
+    assert dc.decode_protect_packet(raw) == (action, b"\x00\x01")
+
+
+@pytest.mark.parametrize("packet", [
+    b"",
+    packet_frame({"action": "update"}),  # no data frame
+    packet_frame(b"text", payload_format=2) + packet_frame({}, packet_type=2),  # action not an object
+])
+def test_decode_packet_rejects_malformed(packet):
+    with pytest.raises(ValueError):
+        dc.decode_protect_packet(packet)
+
+
+def test_fetch_nvr_bootstraps_reports_unreachable_nvr(nvr, monkeypatch):
+    monkeypatch.setattr(dc, "_last_nvr_bootstraps", {})
+    fake = nvr()
+    good = {"entry_id": "e1", "title": "Good", "host": fake.server.address, "username": "admin",
+            "password": "secret", "port": 7441}
+    bad = dict(good, entry_id="e2", title="Bad", host="127.0.0.1:1")
+
+    bootstraps, missing = dc.fetch_nvr_bootstraps([good, bad], budget=10)
+
+    assert [(config["title"], [cam["id"] for cam in b["cameras"]]) for config, b in bootstraps] == [
+        ("Good", ["cam1"])]
+    assert missing == [bad]
+
+
+def test_fetch_nvr_bootstraps_times_out_hung_nvr(nvr, monkeypatch):
+    metrics = dc.DiscoveryMetrics()
+    monkeypatch.setattr(dc, "METRICS", metrics)
+    hung = nvr(bootstrap_delay=3)
+    config = {"entry_id": "hung", "title": "Hung", "host": hung.server.address, "username": "admin",
+              "password": "secret", "port": 7441}
+    last = {"cameras": [{"id": "cam-old"}], "nvr": {}}
+    monkeypatch.setattr(dc, "_last_nvr_bootstraps", {"hung": last})
+
+    start = time.monotonic()
+    bootstraps, missing = dc.fetch_nvr_bootstraps([config], budget=0.5)
+
+    # The request itself timed out: the call returns on the budget with no thread left behind
+    assert time.monotonic() - start < 2
+    assert not [thread for thread in threading.enumerate() if thread.name.startswith("protect-nvr")]
+    assert bootstraps == [(config, last)] and missing == []
+    assert metrics.snapshot()["counters"] == {"protect_nvr_timeouts": 1}
+
+
+def test_read_until_stops_a_trickling_download(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(dc.time, "monotonic", lambda: now[0])
+
+    def trickle():
+        while True:
+            now[0] += 1
+            yield b"x"
+
+    with pytest.raises(TimeoutError):
+        list(dc.read_until(trickle(), deadline=5))
+    now[0] = 0.0
+    assert list(dc.read_until(iter([b"a", b"b"]), deadline=5)) == [b"a", b"b"]
+
+
+def nvr_bootstrap(title, *names):
+    config = {"entry_id": title.lower(), "title": title, "host": f"{title.lower()}.local", "port": 7441}
+    cameras = [{"id": f"{title}-{i}", "mac": f"AABBCCDD{i:04X}", "name": name,
+                "channels": [{"id": 0, "rtspAlias": f"{title}{i}"}]} for i, name in enumerate(names)]
+    return config, {"cameras": cameras, "nvr": {"ports": {"rtsps": 7441}}}
+
+
+def test_build_urls_keeps_cameras_whose_keys_collide():
+    bootstraps = [nvr_bootstrap("NVR1", "Front-Door", "Garage"), nvr_bootstrap("NVR2", "Front Door", "garage")]
+
+    urls = dc.build_unifi_rtsp_urls(bootstraps, {})
+
+    assert {key: (cam["name"], cam["url"]) for key, cam in urls.items()} == {
+        "camera.front_door": ("Front-Door", "rtsps://nvr1.local:7441/NVR10"),
+        "camera.garage": ("Garage", "rtsps://nvr1.local:7441/NVR11"),
+        "camera.front_door_nvr2": ("Front Door (NVR2)", "rtsps://nvr2.local:7441/NVR20"),
+        "camera.garage_nvr2": ("garage (NVR2)", "rtsps://nvr2.local:7441/NVR21"),
+    }
+
+
+def test_add_unifi_camera_numbers_repeated_names():
+    config = {"title": "NVR"}
+    urls, taken = {}, set()
+    for _ in range(3):
+        dc.add_unifi_camera(urls, "Porch", {"url": "rtsps://nvr/x"}, config, taken)
+    # An entity_id that is already used gets a name-based key instead
+    dc.add_unifi_camera(urls, "Yard", {"url": "rtsps://nvr/y"}, config, taken, key="camera.porch")
+
+    assert {key: cam["name"] for key, cam in urls.items()} == {
+        "camera.porch": "Porch", "camera.porch_nvr": "Porch (NVR)", "camera.porch_nvr_2": "Porch (NVR) 2",
+        "camera.yard_nvr": "Yard (NVR)"}
+    assert taken == {"porch", "porch (nvr)", "porch (nvr) 2", "yard (nvr)"}
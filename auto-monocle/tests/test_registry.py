@@ -0,0 +1,109 @@
+import json
+import os
+
+import pytest
+
+import discover_cameras as dc
+
+ENTITIES = [
+    {"entity_id": "camera.front_door", "platform": "unifiprotect", "unique_id": "AABBCCDDEE01_0",
+     "device_id": "dev1", "config_entry_id": "protect1", "options": {"big": "x" * 50}},
+    {"entity_id": "camera.front_door_low", "platform": "unifiprotect", "unique_id": "AABBCCDDEE01_2",
+     "disabled_by": "integration"},
+    {"entity_id": "camera.front_door_insecure", "platform": "unifiprotect", "unique_id": "AABBCCDDEE01_0_insecure"},
+    {"entity_id": "sensor.front_door_motion", "platform": "unifiprotect", "unique_id": "AABBCCDDEE01_motion"},
+    {"entity_id": "camera.shed", "platform": "onvif", "unique_id": "aa:bb:cc:dd:ee:03"},
+    {"entity_id": "camera.garage", "platform": "generic", "unique_id": "garage"},
+    {"entity_id": "sensor.temperature", "platform": "template", "unique_id": "t0"},
+    {"entity_id": "light.porch", "platform": "hue", "unique_id": "l0"},
+]
+
+
+@pytest.fixture
+def storage(monkeypatch, tmp_path):
+    monkeypatch.setattr(dc, "HA_STORAGE_PATH", str(tmp_path))
+    dc.METRICS.reset()
+    return tmp_path
+
+
+def write_registry(storage, entities):
+    path = storage / "core.entity_registry"
+    path.write_text(json.dumps({"version": 1, "data": {"entities": entities}}))
+    return path
+
+
+def parses():
+    """Times the entity registry was read since the metrics were reset."""
+    return dc.METRICS.snapshot()["phases"].get("registry:core.entity_registry", {}).get("records", 0) / len(ENTITIES)
+
+
+def test_unchanged_file_is_parsed_once(storage):
+    write_registry(storage, ENTITIES)
+    cache = dc.RegistryCache()
+
+    first = cache.entity_registry()
+    assert cache.camera_entity_ids() and cache.camera_entities_by_mac()
+    assert cache.entity_registry() is first
+    assert parses() == 1
+    assert dc.METRICS.snapshot()["counters"]["registry_cache_hits"] == 3
+
+
+def test_mtime_change_reparses(storage):
+    path = write_registry(storage, ENTITIES)
+    cache = dc.RegistryCache()
+    cache.entity_registry()
+
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1))
+    cache.entity_registry()
+    assert parses() == 2
+
+
+def test_size_change_reparses(storage):
+    path = write_registry(storage, ENTITIES)
+    cache = dc.RegistryCache()
+    assert "camera.garage" in cache.camera_entity_ids()
+
+    # Same mtime (a coarse filesystem clock), different size
+    st = os.stat(path)
+    write_registry(storage, ENTITIES[:-3])
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert "camera.garage" not in cache.camera_entity_ids()
+
+
+def test_missing_or_broken_file(storage):
+    cache = dc.RegistryCache()
+    assert cache.entity_registry() is None
+    assert cache.camera_entity_ids() == [] and cache.camera_entities_by_mac() == {}
+
+    (storage / "core.entity_registry").write_text('{"data": {"entities": [{"entity_id": ')
+    assert cache.entity_registry() is None
+
+
+def test_index_entity_registry():
+    indexes = dc.index_entity_registry(iter(ENTITIES))
+
+    assert indexes["count"] == len(ENTITIES)
+    assert indexes["camera_macs"] == {
+        "AABBCCDDEE01": ["camera.front_door", "camera.front_door_low"],
+        "AABBCCDDEE03": ["camera.shed"],
+    }
+    # Disabled cameras are left out
+    assert indexes["camera_ids"] == ["camera.front_door", "camera.front_door_insecure", "camera.shed",
+                                     "camera.garage"]
+    assert sorted(indexes["by_platform"]) == ["generic", "onvif", "unifiprotect"]
+    assert indexes["by_platform"]["unifiprotect"][0] == {
+        "entity_id": "camera.front_door", "platform": "unifiprotect", "unique_id": "AABBCCDDEE01_0",
+        "device_id": "dev1", "config_entry_id": "protect1"}
+
+
+@pytest.mark.parametrize("entity_id, platform, needed", [
+    ("camera.garage", "generic", True),
+    ("sensor.front_door_motion", "unifiprotect", True),
+    ("switch.doorbell", "unifi", True),
+    ("binary_sensor.shed_motion", "onvif", True),
+    ("sensor.temperature", "template", False),
+    ("light.porch", "hue", False),
+])
+def test_registry_entity_needed(entity_id, platform, needed):
+    assert dc.registry_entity_needed(entity_id, platform) is needed
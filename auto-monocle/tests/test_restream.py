@@ -0,0 +1,108 @@
+import json
+import os
+
+import pytest
+
+import discover_cameras as dc
+import gateway_supervisor as gs
+
+
+def camera(entity_id, name, url, **extra):
+    return {"entity_id": entity_id, "name": name, "stream_url": url, "fingerprint": entity_id, **extra}
+
+
+CAMERAS = [
+    camera("camera.porch", "Porch", "rtsps://10.0.0.1:7441/porchalias", fallback_urls=["rtsp://10.0.0.5/porch"]),
+    camera("camera.garage", "Garage", "rtsp://10.0.0.2/garage", go2rtc_stream="garage-cam"),
+    camera("camera.garage_2", "Garage 2", "rtsp://10.0.0.3/garage", go2rtc_stream="bad name/!"),
+    camera("camera.no_url", "No URL", None),
+]
+
+
+@pytest.fixture
+def paths(monkeypatch, tmp_path):
+    monkeypatch.setattr(dc, "RESTREAM_CONFIG_FILE", str(tmp_path / "go2rtc.yaml"))
+    return str(tmp_path / "monocle.json"), str(tmp_path / "go2rtc.yaml")
+
+
+def test_cameras_point_at_the_local_restream():
+    restreamed, streams = dc.restream_cameras(CAMERAS)
+
+    assert {c["entity_id"]: (c["stream_url"], c.get("restream")) for c in restreamed} == {
+        "camera.garage": ("rtsp://127.0.0.1:8554/garage-cam", "garage-cam"),
+        "camera.garage_2": ("rtsp://127.0.0.1:8554/garage_2", "garage_2"),
+        "camera.no_url": (None, None),
+        "camera.porch": ("rtsp://127.0.0.1:8554/porch", "porch"),
+    }
+    assert all(c.get("fallback_urls", []) == [] for c in restreamed)
+    assert streams == {"garage-cam": "rtsp://10.0.0.2/garage", "garage_2": "rtsp://10.0.0.3/garage",
+                       "porch": "rtsps://10.0.0.1:7441/porchalias"}
+
+
+def test_restream_names_are_unique():
+    taken = set()
+    names = [dc.restream_name(camera("camera.front_door", "Front", "rtsp://x"), taken),
+             dc.restream_name(camera("camera.front-door", "Front", "rtsp://y"), taken),
+             dc.restream_name(camera("camera.x", "X", "rtsp://z", go2rtc_stream="front_door"), taken)]
+    assert names == ["front_door", "front_door_2", "front_door_3"]
+
+
+def test_config_is_yaml_for_go2rtc(paths):
+    yaml = pytest.importorskip("yaml")
+    _, restream_path = paths
+    _, streams = dc.restream_cameras(CAMERAS)
+
+    assert dc.write_restream_config(streams) == ["garage-cam", "garage_2", "porch"]
+    with open(restream_path) as f:
+        config = yaml.safe_load(f)
+    assert config["rtsp"] == {"listen": "127.0.0.1:8554"}
+    assert config["api"] == {"listen": ""}
+    # UniFi Protect's RTSPS, without certificate checks
+    assert config["streams"]["porch"] == "rtspx://10.0.0.1:7441/porchalias"
+    assert oct(os.stat(restream_path).st_mode & 0o777) == oct(0o600)
+
+
+def test_unchanged_streams_are_not_rewritten(paths):
+    _, restream_path = paths
+    _, streams = dc.restream_cameras(CAMERAS)
+    dc.write_restream_config(streams)
+    mtime = os.stat(restream_path).st_mtime_ns
+
+    assert dc.write_restream_config(dict(reversed(list(streams.items())))) == []
+    assert os.stat(restream_path).st_mtime_ns == mtime
+
+    assert dc.write_restream_config({**streams, "garage_2": "rtsp://10.0.0.4/garage"}) == ["garage_2"]
+    assert os.stat(restream_path).st_mtime_ns != mtime
+
+
+def test_upstream_change_restarts_only_go2rtc(paths, monkeypatch):
+    monocle_path, restream_path = paths
+    cameras = list(CAMERAS)
+    monkeypatch.setattr(dc, "discover_cameras", lambda *args: cameras)
+    options = {"restream": True, "stream_probe": "off"}
+    dc.refresh_monocle_config(options, monocle_path)
+    # What the supervisor compares to decide which process to restart
+    gateway = gs.ManagedProcess("monocle-gateway", [], monocle_path, None)
+    go2rtc = gs.ManagedProcess("go2rtc", [], restream_path, None)
+    hashes = (gateway.read_config_hash(), go2rtc.read_config_hash())
+
+    cameras[1] = {**cameras[1], "stream_url": "rtsp://10.0.0.9/garage"}
+    diff = dc.refresh_monocle_config(options, monocle_path)
+
+    # Reported as a change (so the supervisor is signalled), but only go2rtc's config differs
+    assert diff == {"added": [], "removed": [], "changed": ["Garage"]}
+    assert gateway.read_config_hash() == hashes[0]
+    assert go2rtc.read_config_hash() != hashes[1]
+    with open(monocle_path) as f:
+        assert {c["name"]: c["url"] for c in json.load(f)["cameras"]}["Garage"] == "rtsp://127.0.0.1:8554/garage-cam"
+
+
+def test_added_camera_is_not_also_reported_as_changed(paths, monkeypatch):
+    monocle_path, _ = paths
+    cameras = list(CAMERAS)
+    monkeypatch.setattr(dc, "discover_cameras", lambda *args: cameras)
+    dc.refresh_monocle_config({"restream": True, "stream_probe": "off"}, monocle_path)
+
+    cameras.append(camera("camera.yard", "Yard", "rtsp://10.0.0.7/yard"))
+    diff = dc.refresh_monocle_config({"restream": True, "stream_probe": "off"}, monocle_path)
+    assert diff == {"added": ["Yard"], "removed": [], "changed": []}
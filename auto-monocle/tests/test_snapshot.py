@@ -0,0 +1,113 @@
+import json
+import os
+import stat
+import time
+
+import pytest
+
+import discover_cameras as dc
+
+CONFIG = {"cameras": [{"name": "Porch", "url": "rtsp://admin:pw@10.0.0.2/porch", "tags": ["@proxy"]}]}
+CAMERAS = [{"entity_id": "camera.porch", "name": "Porch", "stream_url": "rtsp://admin:pw@10.0.0.2/porch",
+            "fallback_urls": [], "fingerprint": "f1", "source": "unifi", "attributes": {"big": "x" * 100}}]
+
+
+@pytest.fixture
+def restream_file(monkeypatch, tmp_path):
+    path = str(tmp_path / "go2rtc.yaml")
+    monkeypatch.setattr(dc, "RESTREAM_CONFIG_FILE", path)
+    return path
+
+
+def test_fingerprint_ignores_key_order():
+    assert dc.source_fingerprint([{"a": 1, "b": [2]}]) == dc.source_fingerprint([{"b": [2], "a": 1}])
+    assert dc.source_fingerprint([{"a": 1}]) != dc.source_fingerprint([{"a": 2}])
+
+
+def test_save_keeps_only_snapshot_fields(data_dir):
+    assert dc.save_discovery_snapshot(CONFIG, CAMERAS)
+
+    snapshot = dc.load_discovery_snapshot()
+    assert snapshot["config"] == dc.canonical_config(CONFIG)
+    assert snapshot["cameras"] == [{k: CAMERAS[0][k] for k in ["entity_id", "name", "stream_url",
+                                                               "fallback_urls", "fingerprint"]}]
+    assert "restream" not in snapshot
+    # Stream URLs carry credentials
+    assert stat.S_IMODE(os.stat(dc.DISCOVERY_SNAPSHOT_FILE).st_mode) == 0o600
+
+
+def test_save_only_when_changed(data_dir):
+    assert dc.save_discovery_snapshot(CONFIG, CAMERAS)
+    assert not dc.save_discovery_snapshot(CONFIG, [dict(CAMERAS[0], attributes={})])
+
+    probed = [dict(CAMERAS[0], probe={"ok": True, "time": int(time.time())})]
+    assert dc.save_discovery_snapshot(CONFIG, probed)
+    assert dc.save_discovery_snapshot(CONFIG, probed, restream={"porch": "rtsp://10.0.0.2/porch"})
+    assert not dc.save_discovery_snapshot(CONFIG, probed, restream={"porch": "rtsp://10.0.0.2/porch"})
+
+
+def probe(ok=True, age=0.0, latency_ms=20.0, codecs=None):
+    return {"ok": ok, "status": 200 if ok else None, "latency_ms": latency_ms if ok else None,
+            "codecs": codecs or ({"video": "H264"} if ok else {}), "error": None if ok else "timed out",
+            "time": int(time.time() - age)}
+
+
+def test_probe_times_and_latencies_are_not_changes(data_dir):
+    assert dc.save_discovery_snapshot(CONFIG, [dict(CAMERAS[0], probe=probe())])
+    with open(dc.DISCOVERY_SNAPSHOT_FILE) as f:
+        saved = f.read()
+
+    # Same camera data, probed again later with another latency
+    assert not dc.save_discovery_snapshot(CONFIG, [dict(CAMERAS[0], probe=probe(age=-60, latency_ms=35.5))])
+    with open(dc.DISCOVERY_SNAPSHOT_FILE) as f:
+        assert f.read() == saved
+
+    # A change in the probe outcome is
+    assert dc.save_discovery_snapshot(CONFIG, [dict(CAMERAS[0], probe=probe(codecs={"video": "H265"}))])
+    assert dc.save_discovery_snapshot(CONFIG, [dict(CAMERAS[0], probe=probe(ok=False))])
+    assert not dc.save_discovery_snapshot(CONFIG, [dict(CAMERAS[0], probe=probe(ok=False, age=-60))])
+
+
+def test_expired_probe_is_replaced(data_dir):
+    assert dc.save_discovery_snapshot(CONFIG, [dict(CAMERAS[0], probe=probe(age=dc.PROBE_REUSE_MAX_AGE))])
+
+    # The camera was probed again because its saved probe was too old to reuse: keep the new time
+    fresh = probe()
+    assert dc.save_discovery_snapshot(CONFIG, [dict(CAMERAS[0], probe=fresh)])
+    assert dc.load_discovery_snapshot()["cameras"][0]["probe"]["time"] == fresh["time"]
+    assert not dc.save_discovery_snapshot(CONFIG, [dict(CAMERAS[0], probe=probe())])
+
+
+@pytest.mark.parametrize("content", ["{not json", "[]", '{"config": {}}', '{"config": {"cameras": {}}}'])
+def test_load_rejects_unusable_snapshots(data_dir, content):
+    data_dir.mkdir()
+    with open(dc.DISCOVERY_SNAPSHOT_FILE, "w") as f:
+        f.write(content)
+    assert dc.load_discovery_snapshot() is None
+
+
+def test_restore_writes_config(data_dir, tmp_path, restream_file):
+    path = str(tmp_path / "monocle.json")
+    assert not dc.restore_monocle_config(path=path)
+    assert not os.path.exists(path)
+
+    dc.save_discovery_snapshot(CONFIG, CAMERAS)
+    assert dc.restore_monocle_config(path=path)
+    assert dc.read_monocle_config(path) == dc.canonical_config(CONFIG)
+    assert not os.path.exists(restream_file)
+
+
+def test_restore_needs_matching_restream_setting(data_dir, tmp_path, restream_file):
+    path = str(tmp_path / "monocle.json")
+    dc.save_discovery_snapshot(CONFIG, CAMERAS)
+    assert not dc.restore_monocle_config(restream=True, path=path)
+
+    streams = {"porch": "rtsp://admin:pw@10.0.0.2/porch"}
+    dc.save_discovery_snapshot(CONFIG, CAMERAS, restream=streams)
+    assert not dc.restore_monocle_config(restream=False, path=path)
+    assert not os.path.exists(path)
+
+    assert dc.restore_monocle_config(restream=True, path=path)
+    with open(restream_file) as f:
+        assert json.load(f)["streams"] == dc.generate_restream_config(streams)["streams"]
+    assert dc.read_monocle_config(path) == dc.canonical_config(CONFIG)
@@ -0,0 +1,249 @@
+import json
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+import gateway_supervisor as gs
+
+# Stand-in for the gateway, go2rtc and the discovery daemon: logs its arguments,
+# then exits with status 3 (crash) or listens on a port until stopped
+CHILD = """
+import signal, socket, sys, time
+log, mode = sys.argv[1], sys.argv[2]
+with open(log, "a") as f:
+    f.write(" ".join(sys.argv[2:]) + "\\n")
+if mode == "crash":
+    sys.exit(3)
+if mode == "stubborn":
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+if len(sys.argv) > 3:
+    server = socket.socket()
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind(("127.0.0.1", int(sys.argv[3])))
+    server.listen()
+while True:
+    time.sleep(1)
+"""
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Child:
+    def __init__(self, directory):
+        self.script = directory / "child.py"
+        self.script.write_text(CHILD)
+        self.log = directory / "child.log"
+
+    def argv(self, *args):
+        return [sys.executable, str(self.script), str(self.log)] + [str(a) for a in args]
+
+    def starts(self):
+        return self.log.read_text().splitlines() if self.log.exists() else []
+
+
+@pytest.fixture
+def child(tmp_path):
+    return Child(tmp_path)
+
+
+@pytest.fixture
+def processes():
+    started = []
+    yield started
+    for proc in started:
+        proc.stop(timeout=1)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def tick_until_ready(supervisor, proc):
+    """Run the supervisor's per-tick readiness check until proc is ready."""
+    return wait_for(lambda: supervisor.check_readiness() or proc.ready_at is not None)
+
+
+def test_config_change_restarts_process(child, processes, tmp_path):
+    config = tmp_path / "monocle.json"
+    config.write_text('{"cameras": []}')
+    port = free_port()
+    proc = gs.ManagedProcess("gateway", child.argv("serve", port), str(config), port)
+    processes.append(proc)
+    supervisor = gs.GatewaySupervisor([proc], str(tmp_path / "status.json"))
+    proc.start()
+    assert tick_until_ready(supervisor, proc)
+    first_pid = proc.process.pid
+
+    supervisor.apply_config_changes()
+    assert proc.process.pid == first_pid
+
+    config.write_text('{"cameras": [{"name": "Porch"}]}')
+    supervisor.apply_config_changes()
+
+    assert proc.running and proc.process.pid != first_pid
+    assert tick_until_ready(supervisor, proc)
+    assert proc.config_hash == proc.read_config_hash()
+    with open(supervisor.status_path) as f:
+        status = json.load(f)["processes"]["gateway"]
+    assert status["restarts"] == {"reload": 1, "crash": 0}
+    assert status["ready"] and status["pid"] == proc.process.pid
+    assert [outage["reason"] for outage in status["outages"]] == ["reload"]
+    assert status["outage_seconds_total"] == status["outages"][0]["seconds"]
+
+
+def test_readiness_never_blocks_the_supervisor(child, processes, tmp_path, monkeypatch, capsys):
+    config = tmp_path / "monocle.json"
+    config.write_text('{"cameras": []}')
+    # Nothing ever listens on the port
+    proc = gs.ManagedProcess("gateway", child.argv("serve"), str(config), free_port())
+    processes.append(proc)
+    supervisor = gs.GatewaySupervisor([proc], str(tmp_path / "status.json"))
+    proc.start()
+
+    start = time.monotonic()
+    supervisor.check_readiness()
+    assert proc.starting and not proc.check_ready()
+
+    # A config change waits for the process to come up instead of pulling it mid-start
+    config.write_text('{"cameras": [{"name": "Porch"}]}')
+    supervisor.apply_config_changes()
+    assert supervisor.reload_requested and proc.status["restarts"]["reload"] == 0
+    assert time.monotonic() - start < 1
+
+    # ... for READY_TIMEOUT at most
+    monkeypatch.setattr(gs, "READY_TIMEOUT", 0)
+    supervisor.check_readiness()
+    assert "not accepting connections" in capsys.readouterr().out
+    supervisor.reload_requested = False
+    supervisor.apply_config_changes()
+    assert proc.status["restarts"]["reload"] == 1 and not supervisor.reload_requested
+
+
+def test_invalid_config_not_applied(child, processes, tmp_path, capsys):
+    config = tmp_path / "monocle.json"
+    config.write_text("{}")
+    proc = gs.ManagedProcess("gateway", child.argv("serve"), str(config), None)
+    processes.append(proc)
+    supervisor = gs.GatewaySupervisor([proc], str(tmp_path / "status.json"))
+    proc.start()
+    pid = proc.process.pid
+
+    config.write_text('{"cameras": [')
+    supervisor.apply_config_changes()
+    supervisor.apply_config_changes()
+
+    assert proc.process.pid == pid
+    assert proc.status["restarts"]["reload"] == 0
+    # Reported once, not on every check
+    assert capsys.readouterr().out.count("not applying invalid config") == 1
+
+
+def test_waits_for_config_to_appear(child, processes, tmp_path):
+    config = tmp_path / "go2rtc.yaml"
+    proc = gs.ManagedProcess("go2rtc", child.argv("serve"), str(config), None, wait_for_config=True)
+    processes.append(proc)
+    supervisor = gs.GatewaySupervisor([proc], str(tmp_path / "status.json"))
+
+    supervisor.apply_config_changes()
+    assert proc.process is None
+
+    config.write_text('{"streams": {}}')
+    supervisor.apply_config_changes()
+    # No port to wait for: ready once started
+    assert proc.running and proc.ready_at is not None
+    assert proc.status["restarts"]["reload"] == 0
+
+
+def test_crash_restarts_with_backoff(child, processes, tmp_path, monkeypatch):
+    monkeypatch.setattr(gs, "CRASH_BACKOFF_BASE", 0.2)
+    proc = gs.ManagedProcess("discovery", child.argv("crash", "first"), None, None,
+                             restart_argv=child.argv("crash", "again"))
+    processes.append(proc)
+    supervisor = gs.GatewaySupervisor([proc], str(tmp_path / "status.json"))
+    proc.start()
+    proc.process.wait(5)
+
+    delays = []
+    for _ in range(3):
+        supervisor.check_crashes()
+        delays.append(proc.restart_at - time.monotonic())
+        assert wait_for(lambda: time.monotonic() >= proc.restart_at)
+        supervisor.check_crashes()
+        proc.process.wait(5)
+
+    assert [round(d, 1) for d in delays] == [0.2, 0.4, 0.8]
+    assert child.starts() == ["crash first"] + ["crash again"] * 3
+    with open(supervisor.status_path) as f:
+        status = json.load(f)["processes"]["discovery"]
+    assert status["restarts"] == {"reload": 0, "crash": 3}
+    assert status["last_exit"] == 3
+
+
+def test_backoff_resets_once_stable(child, processes, tmp_path, monkeypatch):
+    monkeypatch.setattr(gs, "STABLE_AFTER", 0)
+    proc = gs.ManagedProcess("gateway", child.argv("serve"), None, None)
+    processes.append(proc)
+    proc.start()
+    proc.crashes_in_row = 4
+
+    gs.GatewaySupervisor([proc], str(tmp_path / "status.json")).check_crashes()
+    assert proc.crashes_in_row == 0
+
+
+def test_stop_kills_process_ignoring_sigterm(child, processes):
+    proc = gs.ManagedProcess("gateway", child.argv("stubborn"), None, None)
+    proc.start()
+    assert wait_for(lambda: child.starts())
+
+    start = time.monotonic()
+    proc.stop(timeout=0.5)
+    assert not proc.running
+    assert proc.process.returncode == -signal.SIGKILL
+    assert time.monotonic() - start < 3
+
+
+def test_supervisor_reloads_on_sighup_and_stops_on_sigterm(child, tmp_path):
+    config = tmp_path / "monocle.json"
+    config.write_text('{"cameras": []}')
+    port = free_port()
+    gateway = tmp_path / "gateway"
+    gateway.write_text(f"#!/bin/sh\nexec {sys.executable} {child.script} {child.log} serve {port}\n")
+    gateway.chmod(0o755)
+    status_path = tmp_path / "status.json"
+    supervisor = subprocess.Popen(
+        [sys.executable, gs.__file__, "--gateway", str(gateway), "--gateway-config", str(config),
+         "--gateway-port", str(port), "--status-file", str(status_path)],
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    try:
+        def status():
+            try:
+                return json.loads(status_path.read_text())["processes"]["monocle-gateway"]
+            except (OSError, ValueError):
+                return None
+
+        assert wait_for(lambda: (status() or {}).get("ready"))
+        config.write_text('{"cameras": [{"name": "Porch"}]}')
+        supervisor.send_signal(signal.SIGHUP)
+        assert wait_for(lambda: status()["restarts"]["reload"] == 1 and status()["ready"])
+        assert len(child.starts()) == 2
+
+        supervisor.send_signal(signal.SIGTERM)
+        assert supervisor.wait(10) == 0
+        assert not status()["running"]
+    finally:
+        if supervisor.poll() is None:
+            supervisor.kill()
+        supervisor.communicate()